@@ -67,6 +67,7 @@ INSTALLED_APPS = [
 # -----------------------------
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.deadline.DeadlineMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -108,9 +109,7 @@ TEMPLATES = [
 # REST Framework & JWT
 # -----------------------------
 REST_FRAMEWORK = {
-    "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    ),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("api.authentication.ShardedJWTAuthentication",),
 }
 
 SIMPLE_JWT = {
@@ -162,22 +161,180 @@ CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/1",
-        "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # reads are further capped by the request deadline
+            "CONNECTION_POOL_CLASS": "api.deadline.DeadlineConnectionPool",
+            "SOCKET_CONNECT_TIMEOUT": float(os.environ.get("REDIS_CONNECT_TIMEOUT", 1)),
+            "SOCKET_TIMEOUT": float(os.environ.get("REDIS_SOCKET_TIMEOUT", 2)),
+        },
     }
 }
 
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
 
+# seconds a per-user status record (is_active, token_epoch) stays cached
+USER_STATUS_CACHE_TTL = int(os.environ.get("USER_STATUS_CACHE_TTL", 300))
+
+# auth records (id, email, is_active, token_epoch): seconds in
+# Redis, and seconds/entries in each worker's own LRU in front of it
+AUTH_CACHE_TTL = int(os.environ.get("AUTH_CACHE_TTL", 300))
+AUTH_CACHE_LOCAL_TTL = float(os.environ.get("AUTH_CACHE_LOCAL_TTL", 5))
+AUTH_CACHE_LOCAL_MAX_ENTRIES = int(
+    os.environ.get("AUTH_CACHE_LOCAL_MAX_ENTRIES", 10000)
+)
+# higher refreshes entries earlier before they expire (XFetch beta)
+AUTH_CACHE_EARLY_REFRESH_BETA = float(
+    os.environ.get("AUTH_CACHE_EARLY_REFRESH_BETA", 1.0)
+)
+
+# -----------------------------
+# Registration Bloom Filters
+# -----------------------------
+# per region, one filter each for emails and usernames; every worker keeps
+# a copy of both (about 6 MB each at the defaults). Changing the capacity or
+# error rate needs `manage.py rebuild_registration_filters`.
+BLOOM_FILTER_CAPACITY = int(os.environ.get("BLOOM_FILTER_CAPACITY", 5_000_000))
+BLOOM_FILTER_ERROR_RATE = float(os.environ.get("BLOOM_FILTER_ERROR_RATE", 0.01))
+# seconds between full re-reads of the bitsets on top of pub/sub updates
+BLOOM_FILTER_SYNC_INTERVAL = float(os.environ.get("BLOOM_FILTER_SYNC_INTERVAL", 300))
+
+# -----------------------------
+# Token Audit
+# -----------------------------
+# the audit tables are partitioned by day of issue; partitions are created
+# this many days ahead and dropped this many days after their last token
+# expired
+TOKEN_AUDIT_PARTITION_DAYS_AHEAD = int(
+    os.environ.get("TOKEN_AUDIT_PARTITION_DAYS_AHEAD", 7)
+)
+TOKEN_AUDIT_RETENTION_DAYS = int(os.environ.get("TOKEN_AUDIT_RETENTION_DAYS", 30))
+
+# -----------------------------
+# Rate Limiting
+# -----------------------------
+# per view scope: dimension -> (requests, window seconds); "endpoint" is
+# shared by every client of that view
+RATE_LIMITS = {
+    "login": {"ip": (20, 60), "email": (10, 300), "endpoint": (2000, 1)},
+    "register": {"ip": (10, 3600), "email": (3, 3600), "endpoint": (200, 1)},
+    "password_reset": {"ip": (10, 600), "email": (5, 3600), "endpoint": (200, 1)},
+    "refresh": {"ip": (120, 60), "endpoint": (5000, 1)},
+    # answers reveal whether an address is registered; keep enumeration slow
+    "availability": {"ip": (60, 60), "endpoint": (5000, 1)},
+}
+if "test" in sys.argv:
+    # every test client posts from 127.0.0.1 and Redis keeps the windows
+    # between runs; api.tests.test_throttling patches in its own limits
+    RATE_LIMITS = {}
+
+# -----------------------------
+# Request Deadlines
+# -----------------------------
+# seconds a request may take end to end, unless the client sends a smaller
+# X-Request-Deadline-Ms budget; DB, Redis and provider calls share it
+REQUEST_DEADLINE = float(os.environ.get("REQUEST_DEADLINE", 10))
+REQUEST_DEADLINE_MAX = float(os.environ.get("REQUEST_DEADLINE_MAX", 30))
+# how far Postgres' statement_timeout may trail the deadline before re-sending
+REQUEST_DEADLINE_DB_SLACK_MS = int(os.environ.get("REQUEST_DEADLINE_DB_SLACK_MS", 250))
+# seconds for OAuth provider calls (e.g. Google tokeninfo)
+OAUTH_PROVIDER_TIMEOUT = float(os.environ.get("OAUTH_PROVIDER_TIMEOUT", 5))
+
+# -----------------------------
+# Admission Control
+# -----------------------------
+# per endpoint class: AIMD concurrency limit tuned against target_latency
+# (seconds); requests beyond limit + max_queue, or queued longer than
+# queue_timeout, are shed with 503
+ADMISSION_CONTROL = {
+    "hashing": {
+        "target_latency": 0.5,
+        "initial_limit": 8,
+        "min_limit": 2,
+        "max_limit": 64,
+        "max_queue": 16,
+        "queue_timeout": 0.2,
+    },
+    "token": {
+        "target_latency": 0.05,
+        "initial_limit": 32,
+        "min_limit": 4,
+        "max_limit": 256,
+        "max_queue": 64,
+        "queue_timeout": 0.05,
+    },
+}
+
+# -----------------------------
+# Password Hashing
+# -----------------------------
+# processes running the password KDF off the request threads
+PASSWORD_HASHER_WORKERS = int(
+    os.environ.get("PASSWORD_HASHER_WORKERS", os.cpu_count() or 1)
+)
+# hashing jobs queued or running before new ones wait for a slot
+PASSWORD_HASHER_MAX_PENDING = int(
+    os.environ.get("PASSWORD_HASHER_MAX_PENDING", PASSWORD_HASHER_WORKERS * 4)
+)
+# seconds a request waits for a slot before it is refused
+PASSWORD_HASHER_QUEUE_TIMEOUT = float(
+    os.environ.get("PASSWORD_HASHER_QUEUE_TIMEOUT", 2.0)
+)
+
+# -----------------------------
+# Multi-Region
+# -----------------------------
+REGION = os.environ.get("REGION", "local")
+
+# peer regions' Redis, e.g. "eu=redis://eu-redis:6379/1,us=redis://us-redis:6379/1"
+REPLICATION_PEERS = dict(
+    peer.split("=", 1)
+    for peer in os.environ.get("REPLICATION_PEERS", "").split(",")
+    if peer
+)
+
+# base URL of each region's API, e.g. "eu=https://eu.auth.example.com"
+REGION_ENDPOINTS = dict(
+    endpoint.split("=", 1)
+    for endpoint in os.environ.get("REGION_ENDPOINTS", "").split(",")
+    if endpoint
+)
+# (connect, read) seconds for refreshes proxied to a token's home region
+REGION_PROXY_TIMEOUT = (
+    float(os.environ.get("REGION_PROXY_CONNECT_TIMEOUT", 0.5)),
+    float(os.environ.get("REGION_PROXY_READ_TIMEOUT", 2.0)),
+)
+
 
 # -----------------------------
 # Database Routers
 # -----------------------------
-DATABASE_ROUTERS = ["api.db_routers.PrimaryReplicaRouter"]
+DATABASE_ROUTERS = ["api.db_routers.ShardRouter"]
+# ms a written user's reads stay on the primary (covers Aurora replica lag)
+READ_YOUR_WRITES_WINDOW_MS = int(os.environ.get("READ_YOUR_WRITES_WINDOW_MS", 5000))
 
 # -----------------------------
 # Databases (PostgreSQL primary/replica)
 # -----------------------------
+# psycopg 3 pool per alias and process, in place of a connection per request;
+# Django requires CONN_MAX_AGE = 0 with pooling, the pool keeps them open
+DATABASE_POOL = {
+    "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+    "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+    # seconds a request waits for a connection before failing
+    "timeout": float(os.environ.get("DB_POOL_TIMEOUT", 2)),
+    "max_idle": float(os.environ.get("DB_POOL_MAX_IDLE", 300)),
+    "max_lifetime": float(os.environ.get("DB_POOL_MAX_LIFETIME", 1800)),
+}
+DATABASE_OPTIONS = {
+    "pool": DATABASE_POOL,
+    # server-side binding lets psycopg prepare statements run this many times
+    # per connection (the hot user/token lookups)
+    "server_side_binding": True,
+    "prepare_threshold": int(os.environ.get("DB_PREPARE_THRESHOLD", 5)),
+}
+
 DATABASES = {
     "default": {  # write DB
         "ENGINE": "django.db.backends.postgresql",
@@ -186,6 +343,8 @@ DATABASES = {
         "PASSWORD": os.environ.get("DATABASE_PASSWORD"),
         "HOST": os.environ.get("WRITER_DB_HOST"),
         "PORT": os.environ.get("DATABASE_PORT", 5432),
+        "CONN_HEALTH_CHECKS": True,  # checked on checkout from the pool
+        "OPTIONS": DATABASE_OPTIONS,
     },
     "read_replica": {  # read DB
         "ENGINE": "django.db.backends.postgresql",
@@ -194,12 +353,69 @@ DATABASES = {
         "PASSWORD": os.environ.get("DATABASE_PASSWORD"),
         "HOST": os.environ.get("READER_DB_HOST"),
         "PORT": os.environ.get("DATABASE_PORT", 5432),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": DATABASE_OPTIONS,
         "TEST": {
             "MIRROR": "default",  # use default DB during tests
         },
     },
 }
 
+# read_replica takes READER_DB_WEIGHT; more Aurora readers come from
+# EXTRA_READER_DB_HOSTS, e.g. "reader-2.example.com=2,reader-3.example.com",
+# as read_replica_2, read_replica_3, ... (weight defaults to 1)
+READ_REPLICA_WEIGHTS = {"read_replica": int(os.environ.get("READER_DB_WEIGHT", 1))}
+for number, reader in enumerate(
+    filter(None, os.environ.get("EXTRA_READER_DB_HOSTS", "").split(",")), start=2
+):
+    host, _, weight = reader.partition("=")
+    DATABASES[f"read_replica_{number}"] = {**DATABASES["read_replica"], "HOST": host}
+    READ_REPLICA_WEIGHTS[f"read_replica_{number}"] = int(weight or 1)
+
+# readers further behind than this are taken out of rotation until they catch up
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 2))
+REPLICA_PROBE_INTERVAL = float(os.environ.get("REPLICA_PROBE_INTERVAL", 5))
+# run on each reader; returns its lag in seconds. The default works on any
+# streaming replica; a reader that has replayed all it received counts as
+# current even when the primary is idle. On Aurora set e.g.
+#   SELECT replica_lag_in_msec / 1000.0 FROM aurora_replica_status()
+#   WHERE server_id = aurora_db_instance_identifier()
+REPLICA_LAG_SQL = os.environ.get(
+    "REPLICA_LAG_SQL",
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+    "END",
+)
+
+# -----------------------------
+# User Shards
+# -----------------------------
+# Users hash by email into USER_SHARD_SLOTS slots spread evenly over the
+# shards (api.sharding). Shard 0 is the databases above; each entry of
+# EXTRA_USER_SHARDS, e.g. "writer-b.example.com|reader-b.example.com,...",
+# adds a shard as user_shard_N with readers user_shard_N_read_M.
+# The slot count is part of every id: never change it afterwards. Ids from
+# before slot encoding must be re-keyed (manage.py encode_user_ids) before
+# the first extra shard is added; the app refuses to start sharded until then.
+USER_SHARD_SLOTS = int(os.environ.get("USER_SHARD_SLOTS", 1024))
+USER_SHARDS = [{"writer": "default", "readers": READ_REPLICA_WEIGHTS}]
+for number, spec in enumerate(
+    filter(None, os.environ.get("EXTRA_USER_SHARDS", "").split(",")), start=1
+):
+    writer_host, *reader_hosts = spec.split("|")
+    writer = f"user_shard_{number}"
+    DATABASES[writer] = {**DATABASES["default"], "HOST": writer_host}
+    readers = {}
+    for reader_number, host in enumerate(reader_hosts, start=1):
+        alias = f"{writer}_read_{reader_number}"
+        DATABASES[alias] = {
+            **DATABASES["read_replica"],
+            "HOST": host,
+            "TEST": {"MIRROR": writer},
+        }
+        readers[alias] = 1
+    USER_SHARDS.append({"writer": writer, "readers": readers})
+
 # -----------------------------
 # Logging
 # -----------------------------
@@ -261,6 +477,22 @@ CELERY_BEAT_SCHEDULE = {
         "task": "api.tasks.push_metrics",
         "schedule": 10.0,  # seconds, or use crontab(minute="*/1") for 1 min
     },
+    "flush-token-audit-every-5-seconds": {
+        "task": "api.tasks.flush_token_audit",
+        "schedule": 5.0,
+    },
+    "replicate-tokens-every-second": {
+        "task": "api.tasks.replicate_tokens",
+        "schedule": 1.0,
+    },
+    "maintain-token-audit-partitions-hourly": {
+        "task": "api.tasks.maintain_token_audit_partitions",
+        "schedule": 3600.0,
+    },
+    "rebuild-registration-filters-daily": {
+        "task": "api.tasks.rebuild_registration_filters",
+        "schedule": 86400.0,
+    },
 }
 
 # Set up a tracer providerfrom tracing import TracerFactory
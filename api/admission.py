@@ -0,0 +1,140 @@
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+from .metrics import AdmissionMetrics
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for one class of endpoints, tuned by AIMD on observed
+    latency: every fast response nudges the limit up by 1/limit (about +1 per
+    round of requests), a slow one cuts it by `backoff`, at most once per
+    `target_latency` so one slow burst is not punished once per request.
+
+    Requests over the limit wait in a short bounded queue; beyond that, or
+    after `queue_timeout`, they are shed instead of tying up a thread.
+    """
+
+    def __init__(
+        self,
+        name,
+        target_latency,
+        initial_limit,
+        min_limit,
+        max_limit,
+        max_queue,
+        queue_timeout,
+        backoff=0.9,
+        metrics=None,
+    ):
+        self.name = name
+        self.target_latency = target_latency
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.metrics = metrics or AdmissionMetrics()
+
+        self.in_flight = 0
+        self.queued = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> bool:
+        with self._cond:
+            if not self._has_room():
+                if self.queued >= self.max_queue or not self._wait_for_room():
+                    self.metrics.shed.increment(labels={"endpoint_class": self.name})
+                    return False
+            self.in_flight += 1
+            self._publish()
+            return True
+
+    def release(self, latency):
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if latency > self.target_latency:
+                if now - self._last_decrease >= self.target_latency:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._publish()
+            self._cond.notify()
+
+    def _has_room(self):
+        return self.in_flight < int(self.limit)
+
+    def _wait_for_room(self):
+        self.queued += 1
+        self._publish()
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            while not self._has_room():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+        finally:
+            self.queued -= 1
+            self._publish()
+
+    def _publish(self):
+        labels = {"endpoint_class": self.name}
+        self.metrics.in_flight.set(self.in_flight, labels=labels)
+        self.metrics.queued.set(self.queued, labels=labels)
+        self.metrics.limit.set(int(self.limit), labels=labels)
+
+
+class AdmissionControl:
+    """One shared limiter per endpoint class in settings.ADMISSION_CONTROL."""
+
+    _limiters = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, endpoint_class):
+        if endpoint_class is None:
+            return None
+        limiter = cls._limiters.get(endpoint_class)
+        if limiter is None:
+            config = settings.ADMISSION_CONTROL.get(endpoint_class)
+            if config is None:
+                return None
+            with cls._lock:
+                limiter = cls._limiters.setdefault(
+                    endpoint_class, AdaptiveLimiter(endpoint_class, **config)
+                )
+        return limiter
+
+
+def admission_controlled(func):
+    """Admit or shed requests to a DRF view method by its admission_class."""
+
+    @wraps(func)
+    def wrapper(view, request, *args, **kwargs):
+        limiter = AdmissionControl.get(getattr(view, "admission_class", None))
+        if limiter is None:
+            return func(view, request, *args, **kwargs)
+        if not limiter.acquire():
+            return Response(
+                {"errors": "Server is busy, try again shortly."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+        start = time.monotonic()
+        try:
+            return func(view, request, *args, **kwargs)
+        finally:
+            limiter.release(time.monotonic() - start)
+
+    return wrapper
@@ -0,0 +1,277 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .metrics import AuthCacheMetrics
+from .redis_scripts import RedisScripts
+
+MISS = object()
+
+
+class LocalTTLCache:
+    """Thread-safe LRU with a per-entry TTL, the in-process tier."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+            value, expires = entry
+            if expires <= now:
+                del self._entries[key]
+                return MISS
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class AuthRecordCache:
+    """
+    Read-through cache of auth record rows (AuthRecord field order, which
+    leaves out the password hash) by user id or lowercased email: a
+    short-lived in-process LRU in front of Redis.
+
+    - Each lookup key has a version in Redis that invalidation bumps; a
+      loaded row is only stored if the version is unchanged, so a load that
+      raced a write cannot put the old row back.
+    - Invalidations are published so every worker drops its local copies.
+    - On a Redis miss one caller loads (SET NX lock) while the others wait
+      briefly for it; entries near expiry are refreshed early by one caller
+      with a probability that grows as expiry nears.
+    """
+
+    # v2: rows no longer carry the password hash; v1 entries just expire
+    key_prefix = "auth_record:v2"
+    channel = "auth_record:invalidate"
+    instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        redis_conn=None,
+        local=None,
+        ttl=None,
+        lock_ttl_ms=2000,
+        lock_wait=0.2,
+        beta=None,
+        metrics=None,
+    ):
+        self.redis_conn = redis_conn or get_redis_connection("default")
+        self.local = local or LocalTTLCache(
+            settings.AUTH_CACHE_LOCAL_MAX_ENTRIES, settings.AUTH_CACHE_LOCAL_TTL
+        )
+        self.ttl = settings.AUTH_CACHE_TTL if ttl is None else ttl
+        self.lock_ttl_ms = lock_ttl_ms
+        self.lock_wait = lock_wait
+        self.beta = settings.AUTH_CACHE_EARLY_REFRESH_BETA if beta is None else beta
+        self.metrics = metrics or AuthCacheMetrics()
+        self._listener = None
+
+    @classmethod
+    def get(cls):
+        """The process-wide cache, with its invalidation listener running."""
+        if AuthRecordCache.instance is None:
+            with AuthRecordCache._instance_lock:
+                if AuthRecordCache.instance is None:
+                    cache = cls()
+                    cache.start_listener()
+                    AuthRecordCache.instance = cache
+        return AuthRecordCache.instance
+
+    # ---------------------
+    # Reads
+    # ---------------------
+
+    def by_id(self, user_id, load):
+        return self._get("id", user_id, load)
+
+    def by_email(self, email, load):
+        return self._get("email", email.lower(), load)
+
+    def _get(self, kind, ident, load):
+        local_key = f"{kind}:{ident}"
+        row = self.local.get(local_key)
+        if row is not MISS:
+            self._count("local", "hit")
+            return row
+        self._count("local", "miss")
+
+        try:
+            cached, version = self.redis_conn.mget(
+                self._key(kind, ident), self._key("ver", kind, ident)
+            )
+        except RedisError as e:
+            print("auth cache unavailable", e)
+            return load()
+        version = version.decode() if version else "0"
+
+        entry = json.loads(cached) if cached else None
+        if entry is not None and not self._refresh_early(entry):
+            self._count("redis", "hit")
+            self.local.set(local_key, entry["row"])
+            return entry["row"]
+        self._count("redis", "miss" if entry is None else "early_refresh")
+        return self._load(kind, ident, load, version, entry)
+
+    def _refresh_early(self, entry):
+        # XFetch: -log(u) is usually small, so only entries within a few
+        # load times of expiry are likely to be refreshed.
+        gap = entry["delta"] * self.beta * -math.log(1 - random.random())
+        return time.time() + gap >= entry["exp"]
+
+    def _load(self, kind, ident, load, version, stale):
+        lock_key = self._key("lock", kind, ident)
+        try:
+            locked = self.redis_conn.set(lock_key, 1, nx=True, px=self.lock_ttl_ms)
+        except RedisError as e:
+            print("auth cache unavailable", e)
+            return load()
+
+        if not locked:
+            if stale is not None:
+                return stale["row"]  # someone else is refreshing it
+            row = self._wait_for_fill(kind, ident)
+            return load() if row is MISS else row
+
+        try:
+            start = time.monotonic()
+            row = load()
+            if row is not None:
+                row = list(row)
+                if self._fill(kind, ident, row, version, time.monotonic() - start):
+                    self.local.set(f"{kind}:{ident}", row)
+            return row
+        finally:
+            self._unlock(lock_key)
+
+    def _wait_for_fill(self, kind, ident):
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(0.02)
+            try:
+                cached = self.redis_conn.get(self._key(kind, ident))
+            except RedisError:
+                return MISS
+            if cached:
+                return json.loads(cached)["row"]
+        return MISS
+
+    def _fill(self, kind, ident, row, version, delta) -> bool:
+        entry = {"row": row, "exp": time.time() + self.ttl, "delta": delta}
+        keys = [self._key("ver", kind, ident), self._key(kind, ident)]
+        args = [version, int(self.ttl * 1000), json.dumps(entry)]
+        if kind == "email":
+            keys.append(self._key("emails", row[0]))
+            args.append(ident)
+        try:
+            return bool(
+                RedisScripts.run(
+                    self.redis_conn, "cache_set_if_version", keys=keys, args=args
+                )
+            )
+        except RedisError as e:
+            print("auth cache fill failed", e)
+            return False
+
+    def _unlock(self, lock_key):
+        try:
+            self.redis_conn.delete(lock_key)
+        except RedisError as e:
+            print("auth cache unlock failed", e)
+
+    # ---------------------
+    # Invalidation
+    # ---------------------
+
+    def invalidate(self, user_id, emails=()):
+        emails = [email.lower() for email in emails if email]
+        try:
+            dropped = RedisScripts.run(
+                self.redis_conn,
+                "cache_invalidate",
+                keys=[
+                    self._key("emails", user_id),
+                    self._key("id", user_id),
+                    self._key("ver", "id", user_id),
+                ],
+                # versions must outlive the entries they guard
+                args=[self.key_prefix, int(self.ttl * 2000), *emails],
+            )
+            emails = sorted({*emails, *(e.decode() for e in dropped)})
+            self.redis_conn.publish(
+                self.channel, json.dumps({"id": user_id, "emails": emails})
+            )
+        except RedisError as e:
+            print("auth cache invalidation failed", user_id, e)
+        finally:
+            self._drop_local(user_id, emails)
+
+    def _drop_local(self, user_id, emails):
+        self.local.pop(f"id:{user_id}")
+        for email in emails:
+            self.local.pop(f"email:{email}")
+
+    def start_listener(self):
+        if self._listener is None:
+            self._listener = threading.Thread(
+                target=self._listen, name="auth-cache-invalidation", daemon=True
+            )
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis_conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # anything published while we were not subscribed is lost
+                self.local.clear()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self.on_message(message["data"])
+            except RedisError as e:
+                print("auth cache listener reconnecting", e)
+                time.sleep(1)
+
+    def on_message(self, data):
+        message = json.loads(data)
+        self._drop_local(message["id"], message["emails"])
+
+    # ---------------------
+    # Helpers
+    # ---------------------
+
+    def _count(self, tier, result):
+        self.metrics.lookups.increment(labels={"tier": tier, "result": result})
+
+    def _key(self, *parts):
+        return ":".join([self.key_prefix, *map(str, parts)])
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import math
+import threading
+import time
+
+from celery import current_app
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .metrics import BloomFilterMetrics
+
+
+class BloomFilter:
+    """Bit positions of an m-bit, k-hash filter sized for capacity/error_rate."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+
+    @property
+    def layout(self) -> str:
+        """Identifies the bit layout; bitsets of another layout are unusable."""
+        return f"{self.size}:{self.hashes}"
+
+    def positions(self, item: str) -> list:
+        # double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def empty(self) -> bytearray:
+        return bytearray((self.size + 7) // 8)
+
+
+# Same bit order as Redis SETBIT/GETBIT: offset 0 is the high bit of byte 0,
+# so a GET of the key can be used as the local mirror as is.
+def set_bits(bits, positions):
+    for pos in positions:
+        bits[pos >> 3] |= 0x80 >> (pos & 7)
+
+
+def has_bits(bits, positions) -> bool:
+    return all(bits[pos >> 3] & (0x80 >> (pos & 7)) for pos in positions)
+
+
+class RegisteredNames:
+    """
+    Per-region Bloom filters of registered emails and usernames (lowercased),
+    stored as Redis bitsets and mirrored in every process.
+
+    - might_contain() answers from the mirror with no network call; False
+      means definitely not registered, True means "ask the database".
+    - add() sets the bits in Redis and publishes them so every worker's
+      mirror has them within milliseconds; a periodic full sync covers lost
+      messages. Bits are set before the insert commits: a rolled-back insert
+      only costs a false positive, never a false negative.
+    - Until rebuild() has written a filter with this layout, or while Redis
+      is unreachable, every answer is "maybe" and callers query the database.
+    - If an add() cannot reach Redis, the filters are marked stale: every
+      mirror drops its bits and answers "maybe" until a rebuild, which is
+      queued right away, has put the lost names back.
+    """
+
+    kinds = ("email", "username")
+    instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self, redis_conn=None, bloom=None, region=None, sync_interval=None, metrics=None
+    ):
+        self.redis_conn = redis_conn or get_redis_connection("default")
+        self.bloom = bloom or BloomFilter(
+            settings.BLOOM_FILTER_CAPACITY, settings.BLOOM_FILTER_ERROR_RATE
+        )
+        self.region = region or settings.REGION
+        self.sync_interval = (
+            settings.BLOOM_FILTER_SYNC_INTERVAL
+            if sync_interval is None
+            else sync_interval
+        )
+        self.metrics = metrics or BloomFilterMetrics()
+        self.channel = f"bloom:{self.region}:added"
+        # kind -> bytearray, only for filters that are loaded
+        self.mirrors = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        # a failed add whose stale mark has not reached Redis yet
+        self._stale_pending = False
+        self._rebuild_queued_at = None
+
+    @classmethod
+    def get(cls):
+        """The process-wide filters, with their sync thread running."""
+        if RegisteredNames.instance is None:
+            with RegisteredNames._instance_lock:
+                if RegisteredNames.instance is None:
+                    names = cls()
+                    names.start()
+                    RegisteredNames.instance = names
+        return RegisteredNames.instance
+
+    # ---------------------
+    # Lookups
+    # ---------------------
+
+    def might_contain(self, kind, value) -> bool:
+        bits = self.mirrors.get(kind)
+        if bits is None:
+            self._count(kind, "unloaded")
+            return True
+        if has_bits(bits, self.bloom.positions(value.lower())):
+            self._count(kind, "maybe")
+            return True
+        self._count(kind, "absent")
+        return False
+
+    def is_loaded(self, kind) -> bool:
+        return kind in self.mirrors
+
+    # ---------------------
+    # Updates
+    # ---------------------
+
+    def add(self, email=None, username=None):
+        """Record newly registered names."""
+        self.add_many([(email, username)])
+
+    def add_many(self, rows):
+        """add() for many (email, username) rows in one round trip."""
+        positions = {kind: [] for kind in self.kinds}
+        for row in rows:
+            for kind, value in zip(self.kinds, row):
+                if value:
+                    positions[kind] += self.bloom.positions(value.lower())
+        self._apply(positions)
+
+        pipe = self.redis_conn.pipeline(transaction=False)
+        for kind, bits in positions.items():
+            for pos in bits:
+                pipe.setbit(self._key(kind), pos, 1)
+        pipe.publish(self.channel, json.dumps({"add": positions}))
+        try:
+            pipe.execute()
+        except RedisError as e:
+            print("bloom filter update failed", e)
+            self.mark_stale()
+
+    def mark_stale(self):
+        """
+        Redis and the other mirrors may now miss names: a false "absent"
+        would skip the database. Have every mirror fail open until the
+        rebuild queued here has restored them.
+        """
+        with self._lock:
+            self.mirrors = {}
+            self._stale_pending = True
+        try:
+            pipe = self.redis_conn.pipeline(transaction=True)
+            pipe.set(self._stale_key, time.time())
+            pipe.publish(self.channel, json.dumps({"resync": True}))
+            pipe.execute()
+            self._stale_pending = False
+        except RedisError as e:
+            # retried by the next sync; until then a mirror that cannot
+            # reach Redis is cleared by its sync thread anyway
+            print("bloom filter stale mark failed", e)
+        self._queue_rebuild()
+
+    def _queue_rebuild(self, every=60):
+        now = time.monotonic()
+        if self._rebuild_queued_at and now - self._rebuild_queued_at < every:
+            return
+        try:
+            current_app.send_task("api.tasks.rebuild_registration_filters")
+            self._rebuild_queued_at = now
+        except Exception as e:
+            print("could not queue bloom filter rebuild", e)
+
+    def rebuild(self, rows):
+        """
+        Write both filters from (email, username) rows. Bits set live while
+        the rows were read are OR-ed in rather than lost; bits of deleted
+        accounts only go away when the layout changes.
+        """
+        # read before the rows: a failed add after this point needs another
+        # rebuild, so only this mark may be cleared at the end
+        stale = self.redis_conn.get(self._stale_key)
+        bits = {kind: self.bloom.empty() for kind in self.kinds}
+        for email, username in rows:
+            if email:
+                set_bits(bits["email"], self.bloom.positions(email.lower()))
+            if username:
+                set_bits(bits["username"], self.bloom.positions(username.lower()))
+
+        layouts = self.redis_conn.mget(*(self._key(k, "layout") for k in self.kinds))
+        marked = self.redis_conn.get(self._stale_key)
+        pipe = self.redis_conn.pipeline(transaction=True)
+        for kind, layout in zip(self.kinds, layouts):
+            key, staging = self._key(kind), self._key(kind, "rebuild")
+            pipe.set(staging, bytes(bits[kind]))
+            if layout and layout.decode() == self.bloom.layout:
+                pipe.bitop("OR", staging, staging, key)
+            pipe.rename(staging, key)
+            pipe.set(self._key(kind, "layout"), self.bloom.layout)
+        if marked == stale:
+            pipe.delete(self._stale_key)
+        pipe.publish(self.channel, json.dumps({"resync": True}))
+        pipe.execute()
+
+    # ---------------------
+    # Mirror
+    # ---------------------
+
+    def sync(self):
+        """Replace the mirrors with the bitsets currently in Redis."""
+        if self._stale_pending:
+            self.mark_stale()
+        pipe = self.redis_conn.pipeline(transaction=True)
+        pipe.get(self._stale_key)
+        for kind in self.kinds:
+            pipe.get(self._key(kind, "layout"))
+            pipe.get(self._key(kind))
+        stale, *replies = pipe.execute()
+
+        mirrors = {}
+        for kind, layout, value in zip(self.kinds, replies[::2], replies[1::2]):
+            if stale:
+                break
+            if not layout or layout.decode() != self.bloom.layout:
+                continue
+            bits = self.bloom.empty()
+            # Redis trims the string after the highest set bit
+            bits[: len(value or b"")] = value or b""
+            mirrors[kind] = bits
+        with self._lock:
+            self.mirrors = mirrors
+
+    def on_message(self, data):
+        message = json.loads(data)
+        if message.get("resync"):
+            self.sync()
+        else:
+            self._apply(message["add"])
+
+    def _apply(self, positions):
+        with self._lock:
+            for kind, bits in positions.items():
+                mirror = self.mirrors.get(kind)
+                if mirror is not None:
+                    set_bits(mirror, bits)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="bloom-filter-sync", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        # sync and messages share this thread, so an add published after a
+        # sync's GET is always applied on top of it
+        while True:
+            try:
+                pubsub = self.redis_conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self.sync()
+                synced = time.monotonic()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self.on_message(message["data"])
+                    if time.monotonic() - synced >= self.sync_interval:
+                        self.sync()
+                        synced = time.monotonic()
+            except RedisError as e:
+                print("bloom filter sync reconnecting", e)
+                self.mirrors = {}
+                time.sleep(1)
+
+    # ---------------------
+    # Helpers
+    # ---------------------
+
+    def _count(self, kind, result):
+        self.metrics.checks.increment(labels={"kind": kind, "result": result})
+
+    @property
+    def _stale_key(self):
+        return f"bloom:{self.region}:stale"
+
+    def _key(self, kind, *parts):
+        return ":".join(["bloom", self.region, kind, *parts])
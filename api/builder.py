@@ -1,18 +1,29 @@
+import base64
+import hmac
+import json
+import time
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connections, transaction
 from django_redis import get_redis_connection
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 
-from api.models import CustomUser
+from .auth_cache import AuthRecordCache
+from .hashing import password_for_storage
+from .models import CustomUser
+from .read_your_writes import ReadYourWrites
 from .serializer import UserSerializer
+from .sharding import ShardMap
 
-from .utils import (
-    blacklist_refresh,
-    blacklist_access,
-    get_user_by_email,
-    get_user_by_id,
-)
+from .utils import AuthRecord, get_auth_record_by_email
 
+from .tokens import BufferedRefreshToken, REGION_CLAIM, TOKEN_EPOCH_CLAIM
+from .user_status import UserStatusCache
+from .token_store import RefreshTokenStore
 from .tracers import trace
 from .o_auth_start import ThirdPartyStrategySingleton
 
@@ -60,16 +71,20 @@ class ModelBuilder(Buildable, Cleanable, Serializable, ABC):
     """Base builder for creating/updating models."""
 
     serializer_class = None
+    # True when data["password"] arrives hashed (by the state machine's
+    # PasswordOutput); otherwise it is user input and gets hashed here
+    password_hashed = False
 
     def get_serializer(self, instance=None, data=None):
         """Returns an instance of the serializer."""
+        context = {"password_hashed": self.password_hashed}
         if instance and data:
-            return self.serializer_class(instance, data=data)
+            return self.serializer_class(instance, data=data, context=context)
         if instance:
-            return self.serializer_class(instance)
+            return self.serializer_class(instance, context=context)
         if data:
-            return self.serializer_class(data=data)
-        return self.serializer_class()
+            return self.serializer_class(data=data, context=context)
+        return self.serializer_class(context=context)
 
     def build(self, data):
         cleaned_data = self.clean(data)
@@ -121,10 +136,8 @@ class Clean(ABC):
 
 class UserPasswordCleaner(Clean):
     def clean(self, data):
-        if "password_repeat" in data:
-            data["password"] = data["password_repeat"]
-            del data["password_repeat"]
-
+        # "password" already holds the hash; never persist the plaintext repeat.
+        data.pop("password_repeat", None)
         return data
 
 
@@ -137,23 +150,141 @@ class UserBuilder(CreateModelBuilder):
     name = "UserBuilder"
     serializer_class = UserSerializer
     cleaners = [UserPasswordCleaner]
+    password_hashed = True
+
 
+class PasswordResetBuilder(ModelBuilder):
+    """
+    Sets the new password and bumps token_epoch, revoking every token issued
+    before the reset, in a single UPDATE on the user's shard writer that
+    returns the row, so the user is never read first.
+    """
 
-class PasswordResetBuilder(UpdateModelBuilder):
     name = "PasswordResetBuilder"
-    serializer_class = UserSerializer
     cleaners = [UserPasswordCleaner]
+    password_hashed = True
+
+    RESET_SQL = (
+        "UPDATE {table} SET password = %s, token_epoch = token_epoch + 1 "
+        "WHERE LOWER(email) = %s "
+        f"RETURNING {', '.join(AuthRecord.__slots__)}"
+    )
+
+    def build(self, data):
+        data = self.clean(data)
+        rows = self.perform_build(data)
+        if not rows:
+            raise BuilderException("No account with this email.")
+        record = AuthRecord(*rows[0])
+        self.invalidate(record)
+        return {"id": record.id, "email": record.email}
+
+    def perform_build(self, data) -> list:
+        """The updated rows: one, or none when no account has the email."""
+        email = data["email"].lower()
+        connection = connections[ShardMap.get().for_email(email).writer]
+        table = connection.ops.quote_name(CustomUser._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                self.RESET_SQL.format(table=table),
+                [password_for_storage(data["password"], self.password_hashed), email],
+            )
+            return cursor.fetchall()
+
+    def invalidate(self, record):
+        # raw SQL sends no post_save; do what the CustomUser receivers would,
+        # dropping caches only once a racing read can no longer see the old row
+        def drop_cached():
+            UserStatusCache().invalidate(record.id)
+            AuthRecordCache.get().invalidate(record.id, emails=[record.email])
+
+        transaction.on_commit(
+            drop_cached, using=ShardMap.get().for_id(record.id).writer
+        )
+        ReadYourWrites().mark(record)
+
+
+# ------------------------------------------------------------------
+# 5. TOKEN MINTING
+# ------------------------------------------------------------------
 
-    def get_instance(self, data):
-        print("getting the instance", data)
-        email = data["email"]
-        user = get_user_by_email(email=email)
-        print("getting the instance", user)
-        return user
+
+def _b64url(raw: bytes) -> bytes:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=")
+
+
+class TokenMinter:
+    """
+    Lean HMAC JWT minting for the login and refresh paths.
+
+    Produces the same claims SimpleJWT would (token_type, exp, iat, jti,
+    user id) so BufferedRefreshToken/AccessToken validate the output, but
+    skips its Token objects and PyJWT: the header segment is built once per
+    algorithm/kid, claims go through one compact JSON encoder and the
+    signature is a single hmac.digest over a cached key.
+    """
+
+    digests = {"HS256": "sha256", "HS384": "sha384", "HS512": "sha512"}
+    _encode_json = json.JSONEncoder(separators=(",", ":")).encode
+
+    def __init__(self, algorithm=None, signing_key=None, kid=None, region=None):
+        self.algorithm = algorithm or api_settings.ALGORITHM
+        if self.algorithm not in self.digests:
+            raise BuilderException(f"Unsupported signing algorithm: {self.algorithm}")
+        self.digest = self.digests[self.algorithm]
+
+        key = signing_key or api_settings.SIGNING_KEY
+        self.key = key.encode() if isinstance(key, str) else key
+        self.header = self.header_segment(self.algorithm, kid)
+        self.region = region or settings.REGION
+
+        self.refresh_lifetime = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+        self.access_lifetime = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def header_segment(algorithm, kid=None) -> bytes:
+        header = {"alg": algorithm, "typ": "JWT"}
+        if kid:
+            header["kid"] = kid
+        return _b64url(json.dumps(header, separators=(",", ":")).encode())
+
+    def encode(self, payload) -> str:
+        signing_input = (
+            self.header + b"." + _b64url(self._encode_json(payload).encode())
+        )
+        signature = hmac.digest(self.key, signing_input, self.digest)
+        return (signing_input + b"." + _b64url(signature)).decode()
+
+    def claims(self, token_type, lifetime, now, extra) -> dict:
+        payload = {
+            api_settings.TOKEN_TYPE_CLAIM: token_type,
+            "exp": now + lifetime,
+            "iat": now,
+            api_settings.JTI_CLAIM: uuid4().hex,
+            **extra,
+        }
+        if api_settings.AUDIENCE is not None:
+            payload["aud"] = api_settings.AUDIENCE
+        if api_settings.ISSUER is not None:
+            payload["iss"] = api_settings.ISSUER
+        return payload
+
+    def mint_pair(self, user_id, token_epoch=0):
+        """Return (refresh payload, encoded refresh, encoded access)."""
+        now = int(time.time())
+        shared = {
+            api_settings.USER_ID_CLAIM: str(user_id),
+            TOKEN_EPOCH_CLAIM: token_epoch,
+            REGION_CLAIM: self.region,
+        }
+        refresh = self.claims("refresh", self.refresh_lifetime, now, shared)
+        access = self.claims("access", self.access_lifetime, now, shared)
+        return refresh, self.encode(refresh), self.encode(access)
 
 
 # ------------------------------------------------------------------
-# 5. API RESPONSE BUILDERS
+# 6. API RESPONSE BUILDERS
 # ------------------------------------------------------------------
 
 
@@ -166,19 +297,30 @@ class APIResponseBuilder(Buildable, ABC):
 class LoginBuilder(APIResponseBuilder):
     """Builds a JWT token response."""
 
+    minter = None
+
     def build(self, data):
         user = self.get_instance(data)
         print("user ", user)
-        refresh = RefreshToken.for_user(user)
-        access = refresh.access_token
+        payload, refresh, access = self.get_minter().mint_pair(
+            user.id, getattr(user, "token_epoch", 0)
+        )
+        RefreshTokenStore().issue(payload, refresh)
 
         return {
-            "refresh": str(refresh),
-            "access": str(access),
+            "refresh": refresh,
+            "access": access,
         }
 
+    @classmethod
+    def get_minter(cls):
+        if LoginBuilder.minter is None:
+            LoginBuilder.minter = TokenMinter()
+        return LoginBuilder.minter
+
     def get_instance(self, data):
-        return get_user_by_email(email=data["email"])
+        # id and token_epoch are all minting needs
+        return get_auth_record_by_email(data["email"])
 
 
 class ValidationTokenBuilder(APIResponseBuilder):
@@ -189,7 +331,7 @@ class ValidationTokenBuilder(APIResponseBuilder):
         if not token:
             raise BuilderException("Token not provided.")
         try:
-            RefreshToken(token)
+            BufferedRefreshToken(token)
             return {"detail": "Token is valid."}
         except TokenError:
             raise BuilderException("Token is invalid or expired.")
@@ -208,9 +350,7 @@ class LogoutBuilder(APIResponseBuilder):
         try:
             conn = get_redis_connection("default")
 
-            blacklist_refresh(conn, refresh_token)
-
-            blacklist_access(conn, refresh_token)
+            RefreshTokenStore(conn).revoke(refresh_token, access_token)
 
             return {"detail": "Logout successful. Tokens invalidated."}
         except Exception:
@@ -218,11 +358,10 @@ class LogoutBuilder(APIResponseBuilder):
 
 
 class TokenRefreshBuilder(LoginBuilder):
-    """Refreshes JWT tokens."""
-
-    class MinimalUser:
-        def __init__(self, id):
-            self.id = id
+    """
+    Refreshes JWT tokens straight from the verified refresh-token claims.
+    The user row is never loaded; only the cached status record is checked.
+    """
 
     def build(self, data):
         refresh_token = data.get("refresh")
@@ -233,23 +372,38 @@ class TokenRefreshBuilder(LoginBuilder):
             conn = get_redis_connection("default")
             print("got the conn")
 
+            # user ids and status are only meaningful on the issuing region's
+            # shards; HomeRegionRouter forwards foreign tokens there
+            if refresh_token.get(REGION_CLAIM, settings.REGION) != settings.REGION:
+                raise TokenError("Refresh token belongs to another region.")
+
             user_id = refresh_token.get("user_id")
+            epoch = refresh_token.get(TOKEN_EPOCH_CLAIM, 0)
 
             print("user id", user_id)
 
-            blacklist_refresh(conn, refresh_token)
+            status = UserStatusCache(conn).get(user_id)
+            if not status.allows(epoch):
+                raise TokenError("User is inactive or the token was revoked.")
+
+            payload, refresh, access = self.get_minter().mint_pair(
+                user_id, status.token_epoch
+            )
+            # The old token is consumed and the new one registered atomically;
+            # if another request got there first, the minted pair is dropped.
+            if not RefreshTokenStore(conn).rotate(refresh_token, payload, refresh):
+                raise TokenError("Refresh token has already been used.")
 
             print("balcklisted")
-            return super().build({"pk": user_id})
-        except (TokenError, CustomUser.DoesNotExist):
+            return {
+                "refresh": refresh,
+                "access": access,
+            }
+        except TokenError:
             raise TokenError("Token is invalid or user not found.")
         except Exception:
             raise BuilderException("An unexpected error occurred during token refresh.")
 
-    def get_instance(self, data):
-        print(data, "gettingthe user")
-        return get_user_by_id(data["pk"])
-
 
 class OAuthUserInfoBuilder(APIResponseBuilder):
     def build(self, data):
@@ -0,0 +1,43 @@
+from django.db import connections
+
+from .metrics import DatabasePoolMetrics
+
+
+class PoolStatsRecorder:
+    """
+    Copies the stats of each alias' psycopg pool into gauges before a scrape.
+    Only pools that are already open are read: the wrapper's `pool` property
+    would open one for every alias, just to report it idle.
+    """
+
+    metrics = None
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics or self.get_metrics()
+
+    @classmethod
+    def get_metrics(cls):
+        if PoolStatsRecorder.metrics is None:
+            PoolStatsRecorder.metrics = DatabasePoolMetrics()
+        return PoolStatsRecorder.metrics
+
+    def record(self):
+        for alias in connections:
+            # the postgres backend's process-wide registry of opened pools
+            pools = getattr(connections[alias], "_connection_pools", {})
+            pool = pools.get(alias)
+            if pool is not None:
+                self._record(alias, pool.get_stats())
+
+    def _record(self, alias, stats):
+        # psycopg_pool leaves counters that are still zero out of the dict
+        labels = {"alias": alias}
+        for state in ("size", "available", "max"):
+            self.metrics.connections.set(
+                stats.get(f"pool_{state}", 0), labels={**labels, "state": state}
+            )
+        self.metrics.waiting.set(stats.get("requests_waiting", 0), labels=labels)
+        self.metrics.wait_seconds.set(
+            stats.get("requests_wait_ms", 0) / 1000, labels=labels
+        )
+        self.metrics.checkout_errors.set(stats.get("requests_errors", 0), labels=labels)
@@ -1,12 +1,25 @@
+from django.conf import settings
+
+from .read_your_writes import is_pinned
+from .replica_pool import ReplicaPool
+from .sharding import ShardMap
+
+
 class PrimaryReplicaRouter:
     """
     A router to send all write operations to the default (primary) database
-    and all read operations to the read_replica database.
+    and read operations to a healthy read replica, falling back to the
+    primary for reads pinned to a just-written user or when no replica is
+    usable.
     """
 
     def db_for_read(self, model, **hints):
-        """Direct all read operations to the read_replica database."""
-        return "read_replica"
+        """Pick a replica by weight among the healthy ones, else the primary."""
+        pool = ReplicaPool.get()
+        alias = None if is_pinned() else pool.choose()
+        alias = alias or "default"
+        pool.metrics.reads.increment(labels={"alias": alias})
+        return alias
 
     def db_for_write(self, model, **hints):
         """Direct all write operations to the default database."""
@@ -19,3 +32,43 @@ class PrimaryReplicaRouter:
     def allow_migrate(self, db, app_label, model_name=None, **hints):
         """Only allow migrations on the primary database."""
         return db == "default"
+
+
+class ShardRouter(PrimaryReplicaRouter):
+    """
+    PrimaryReplicaRouter per user shard (see api.sharding). A user model
+    operation that carries its instance (save, delete, refresh, related
+    managers) goes to that user's shard. Queries without one go to shard 0
+    like every other model, so the helpers in api.utils pick the shard
+    themselves with .using(), and request authentication loads the user
+    through them (api.authentication).
+    """
+
+    def db_for_read(self, model, **hints):
+        shard = self._shard(model, hints)
+        if shard is None:
+            return super().db_for_read(model, **hints)
+        return shard.reader()
+
+    def db_for_write(self, model, **hints):
+        shard = self._shard(model, hints)
+        if shard is None:
+            return super().db_for_write(model, **hints)
+        return shard.writer
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """
+        Every shard writer carries the full schema, so a user's groups,
+        permissions and other rows can sit next to it. Only the user rows
+        are spread over shards; everything else is read and written on
+        shard 0, and its copies elsewhere stay empty.
+        """
+        return db in ShardMap.get().writers
+
+    def _shard(self, model, hints):
+        instance = hints.get("instance")
+        if model._meta.label != settings.AUTH_USER_MODEL or instance is None:
+            return None
+        if not isinstance(instance, model):
+            return None
+        return ShardMap.get().for_user(instance)
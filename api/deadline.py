@@ -0,0 +1,212 @@
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.http import JsonResponse
+from redis.connection import SENTINEL, Connection, ConnectionPool
+from redis.exceptions import TimeoutError as RedisTimeoutError
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# remaining budget in milliseconds, sent by clients and to peer regions
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+_deadline = ContextVar("request_deadline", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(APIException):
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = "Request deadline exceeded."
+    default_code = "deadline_exceeded"
+
+
+class Deadline:
+    """
+    The monotonic time a request must be answered by, carried in a context
+    variable so DB, Redis and HTTP calls can size their own timeouts from it.
+    Outside a request (Celery, management commands) there is no deadline.
+    """
+
+    @staticmethod
+    def start(seconds):
+        return _deadline.set(time.monotonic() + seconds)
+
+    @staticmethod
+    def reset(token):
+        _deadline.reset(token)
+
+    @staticmethod
+    def remaining():
+        """Seconds left, or None without a deadline."""
+        deadline = _deadline.get()
+        if deadline is None:
+            return None
+        return deadline - time.monotonic()
+
+    @classmethod
+    def check(cls):
+        remaining = cls.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded()
+
+    @classmethod
+    def timeout(cls, default=None):
+        """
+        `default` (seconds, or a requests-style (connect, read) pair) capped
+        to the remaining budget; raises once it is spent.
+        """
+        if isinstance(default, tuple):
+            return tuple(cls.timeout(part) for part in default)
+        remaining = cls.remaining()
+        if remaining is None:
+            return default
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return remaining if default is None else min(default, remaining)
+
+
+# ---------------------
+# Redis
+# ---------------------
+
+
+class DeadlineConnection(Connection):
+    """Reads time out when the request's budget runs out, not at socket_timeout."""
+
+    def send_packed_command(self, command, check_health=True):
+        Deadline.check()
+        super().send_packed_command(command, check_health=check_health)
+
+    def read_response(self, *args, timeout=SENTINEL, **kwargs):
+        if timeout is SENTINEL and Deadline.remaining() is not None:
+            timeout = Deadline.timeout(self.socket_timeout)
+        try:
+            return super().read_response(*args, timeout=timeout, **kwargs)
+        except RedisTimeoutError:
+            Deadline.check()
+            raise
+
+
+class DeadlineConnectionPool(ConnectionPool):
+    """django-redis CONNECTION_POOL_CLASS handing out DeadlineConnections."""
+
+    def __init__(self, connection_class=Connection, **kwargs):
+        if connection_class is Connection:
+            connection_class = DeadlineConnection
+        super().__init__(connection_class=connection_class, **kwargs)
+
+
+# ---------------------
+# Postgres
+# ---------------------
+
+
+class StatementTimeout:
+    """
+    execute_wrapper that keeps Postgres' statement_timeout inside the budget.
+    The timeout is only re-sent when the one in force would overshoot the
+    deadline by more than `slack_ms`, so most queries cost no extra trip.
+
+    Inside a transaction the timeout is set with SET LOCAL and not cached: a
+    rollback would undo it behind the cache's back. The session value cached
+    from autocommit queries is untouched by either.
+    """
+
+    def __init__(self, slack_ms=None):
+        self.slack_ms = (
+            settings.REQUEST_DEADLINE_DB_SLACK_MS if slack_ms is None else slack_ms
+        )
+        self.applied = {}  # alias -> (ms, monotonic time set, raw connection)
+
+    def __call__(self, execute, sql, params, many, context):
+        remaining = Deadline.timeout()
+        connection = context["connection"]
+        if remaining is not None and connection.vendor == "postgresql":
+            self._apply(connection, context["cursor"], int(remaining * 1000))
+        try:
+            return execute(sql, params, many, context)
+        except DatabaseError:
+            Deadline.check()  # canceled by statement_timeout
+            raise
+
+    def _apply(self, connection, cursor, remaining_ms):
+        applied = self.applied.get(connection.alias)
+        if applied and applied[2] is connection.connection:  # not reconnected
+            ms, at, _ = applied
+            in_force = ms - (time.monotonic() - at) * 1000
+            if in_force <= remaining_ms + self.slack_ms:
+                return
+        # the cursor's own execute, so the SET does not pass through wrappers
+        if connection.in_atomic_block:
+            cursor.cursor.execute(
+                f"SET LOCAL statement_timeout = {max(remaining_ms, 1)}"
+            )
+            return
+        cursor.cursor.execute(f"SET statement_timeout = {max(remaining_ms, 1)}")
+        self.applied[connection.alias] = (
+            remaining_ms,
+            time.monotonic(),
+            connection.connection,
+        )
+
+    def reset(self):
+        """Put persistent connections back to the server default."""
+        for alias, (_, _, raw) in self.applied.items():
+            if connections[alias].connection is raw and not raw.closed:
+                with raw.cursor() as cursor:
+                    cursor.execute("RESET statement_timeout")
+        self.applied.clear()
+
+
+# ---------------------
+# Middleware
+# ---------------------
+
+
+class DeadlineMiddleware:
+    """
+    Starts the request's deadline from the DEADLINE_HEADER budget, if the
+    client sent one, else settings.REQUEST_DEADLINE, capped at
+    settings.REQUEST_DEADLINE_MAX.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = Deadline.start(self.get_budget(request))
+        statement_timeout = StatementTimeout()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(statement_timeout))
+                return self.get_response(request)
+        finally:
+            Deadline.reset(token)
+            try:
+                statement_timeout.reset()
+            except DatabaseError as e:
+                logger.warning("could not reset statement_timeout: %s", e)
+
+    def process_exception(self, request, exception):
+        # DRF views answer APIExceptions themselves; this covers plain views
+        if isinstance(exception, DeadlineExceeded):
+            return JsonResponse(
+                {"detail": str(exception.detail)}, status=exception.status_code
+            )
+        return None
+
+    def get_budget(self, request):
+        budget = settings.REQUEST_DEADLINE
+        header = request.headers.get(DEADLINE_HEADER)
+        if header:
+            try:
+                budget = int(header) / 1000
+            except ValueError:
+                pass
+        return min(max(budget, 0), settings.REQUEST_DEADLINE_MAX)
@@ -0,0 +1,168 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from .deadline import Deadline, DeadlineExceeded
+from .metrics import HasherMetrics
+
+
+class HasherBusy(RuntimeError):
+    pass
+
+
+def worker_context():
+    """
+    Start method for hashing workers. By the time a pool starts, the process
+    runs threads (Redis, metrics, the bloom listener) whose locks a plain
+    fork would copy mid-use; forkserver workers start from a clean process.
+    """
+    return multiprocessing.get_context("forkserver")
+
+
+def _init_worker():
+    # Workers start without a configured Django.
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+class HashingPool:
+    """
+    A bounded front for an executor. At most `max_pending` jobs are queued or
+    running; beyond that callers wait `queue_timeout` seconds for a slot and
+    then get HasherBusy instead of piling up behind the KDF.
+    """
+
+    def __init__(self, executor, max_pending, queue_timeout, metrics=None):
+        self.executor = executor
+        self.queue_timeout = queue_timeout
+        self.metrics = metrics or HasherMetrics()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def submit(self, fn, *args, timeout=None):
+        timeout = Deadline.timeout(self.queue_timeout if timeout is None else timeout)
+        if not self._slots.acquire(timeout=timeout):
+            self.metrics.rejected.increment()
+            raise HasherBusy("Password hashing is saturated, try again shortly.")
+        self._track(1)
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        self._track(-1)
+        self._slots.release()
+
+    def _track(self, delta):
+        with self._lock:
+            self.pending += delta
+            self.metrics.queue_depth.set(self.pending)
+
+
+class HasherService:
+    """
+    Runs Django's password hashing and verification on a process pool so
+    PBKDF2/Argon2 work uses every core without holding request threads.
+    """
+
+    pool = None
+
+    def __init__(self, pool=None):
+        self.pool = pool or self.get_pool()
+
+    @classmethod
+    def get_pool(cls):
+        if HasherService.pool is None:
+            workers = settings.PASSWORD_HASHER_WORKERS
+            HasherService.pool = HashingPool(
+                ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=worker_context(),
+                    initializer=_init_worker,
+                ),
+                max_pending=settings.PASSWORD_HASHER_MAX_PENDING,
+                queue_timeout=settings.PASSWORD_HASHER_QUEUE_TIMEOUT,
+            )
+        return HasherService.pool
+
+    # ---------------------
+    # Blocking interface
+    # ---------------------
+
+    def make_password(self, password) -> str:
+        future = self.pool.submit(hashers.make_password, password)
+        return self._result(future)
+
+    def check_password(self, password, encoded) -> bool:
+        future = self.pool.submit(hashers.check_password, password, encoded)
+        return self._result(future)
+
+    def _result(self, future):
+        try:
+            return future.result(timeout=Deadline.timeout())
+        except TimeoutError:
+            raise DeadlineExceeded()
+
+    # ---------------------
+    # Async interface
+    # ---------------------
+
+    async def amake_password(self, password) -> str:
+        future = self.pool.submit(hashers.make_password, password)
+        return await asyncio.wrap_future(future)
+
+    async def acheck_password(self, password, encoded) -> bool:
+        future = self.pool.submit(hashers.check_password, password, encoded)
+        return await asyncio.wrap_future(future)
+
+    # ---------------------
+    # Hash upgrades
+    # ---------------------
+
+    def needs_upgrade(self, encoded) -> bool:
+        """True if `encoded` is not what the preferred hasher would produce now."""
+        try:
+            hasher = hashers.identify_hasher(encoded)
+        except ValueError:
+            return False
+        preferred = hashers.get_hasher("default")
+        return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+    def rehash_later(self, password, on_done):
+        """
+        Hash `password` with the preferred hasher without waiting for it and
+        pass the new hash to `on_done`. Skipped when the pool is busy; the
+        next login tries again.
+        """
+        try:
+            future = self.pool.submit(hashers.make_password, password, timeout=0)
+        except HasherBusy:
+            return None
+
+        def done(f):
+            if f.exception() is None:
+                on_done(f.result())
+
+        future.add_done_callback(done)
+        return future
+
+
+def password_for_storage(password, hashed=False) -> str:
+    """
+    The value to store for `password`. Only a caller that produced the hash
+    itself passes hashed=True; anything else is hashed, whatever it looks
+    like, so a plaintext "pbkdf2_sha256$..." is never stored as a hash.
+    """
+    return password if hashed else HasherService().make_password(password)
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.auth_cache import AuthRecordCache
+from api.models import CustomUser
+from api.sharding import ShardMap
+from api.user_status import UserStatusCache
+
+
+def referencing_fields():
+    """(model, field) of every row that points at a user by id."""
+    fields = [
+        (rel.related_model, rel.field.name)
+        for rel in CustomUser._meta.related_objects
+        if not rel.many_to_many
+    ]
+    fields += [
+        (field.remote_field.through, field.m2m_field_name())
+        for field in CustomUser._meta.many_to_many
+    ]
+    return fields
+
+
+def encode_user_id(shards, old_id):
+    """
+    Give a plain-id user an id carrying its slot, moving every row that
+    refers to it along in the same transaction. Returns the new id, or
+    None if the user is gone.
+    """
+    writer = shards.shards[0].writer
+    users = CustomUser.objects.using(writer)
+    with transaction.atomic(using=writer):
+        email = (
+            users.select_for_update()
+            .filter(pk=old_id)
+            .values_list("email", flat=True)
+            .first()
+        )
+        if email is None:
+            return None
+        new_id = shards.allocate_id(email, CustomUser._meta.db_table)
+        # foreign keys are checked at commit, so the order does not matter
+        for model, field in referencing_fields():
+            model.objects.using(writer).filter(**{field: old_id}).update(
+                **{field: new_id}
+            )
+        users.filter(pk=old_id).update(id=new_id)
+
+        def drop_cached():
+            UserStatusCache().invalidate(old_id)
+            AuthRecordCache.get().invalidate(old_id, emails=[email])
+
+        transaction.on_commit(drop_cached, using=writer)
+    return new_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-key users whose ids predate slot encoding, so shards can be added. "
+        "Run with a single shard, before setting EXTRA_USER_SHARDS. Tokens "
+        "issued to re-keyed users stop working; they have to log in again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        shards = ShardMap.get()
+        if shards.sharded:
+            raise CommandError("Run with a single shard (unset EXTRA_USER_SHARDS).")
+
+        encoded = 0
+        table = CustomUser._meta.db_table
+        while ids := shards.legacy_ids(table, limit=batch_size):
+            for old_id in ids:
+                if encode_user_id(shards, old_id) is not None:
+                    encoded += 1
+            self.stdout.write(f"{encoded} users re-keyed")
+        self.stdout.write(self.style.SUCCESS(f"Done: {encoded} users re-keyed."))
@@ -0,0 +1,308 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from api.bloom import RegisteredNames
+from api.hashing import _init_worker, worker_context
+from api.models import CustomUser
+from api.sharding import ShardMap
+from api.validators import (
+    EmailValidator,
+    PasswordValidator,
+    UsernameValidator,
+    ValidationError,
+)
+
+COLUMNS = ("number", "slot", "email", "username", "full_name", "password")
+
+STAGING_SQL = """
+CREATE TEMP TABLE import_users_staging (
+    number bigint, slot integer, email text, username text, full_name text,
+    password text
+) ON COMMIT DROP
+"""
+
+COPY_SQL = f"COPY import_users_staging ({', '.join(COLUMNS)}) FROM STDIN"
+
+# Rows whose email (any case) or username (any case) is already taken are
+# skipped; the merge returns the ones it inserted. Ids are drawn from the
+# shard's own sequence and encode the slot like ShardMap.allocate_id.
+MERGE_SQL = """
+INSERT INTO {table} (
+    id, email, username, full_name, password,
+    is_active, is_staff, is_superuser, date_joined, token_epoch
+)
+SELECT nextval(pg_get_serial_sequence(%s, 'id')) * %s + s.slot,
+       s.email, s.username, s.full_name, s.password, true, false, false, %s, 0
+FROM import_users_staging s
+WHERE NOT EXISTS (
+    SELECT 1 FROM {table} u WHERE LOWER(u.username) = LOWER(s.username)
+)
+ON CONFLICT DO NOTHING
+RETURNING email, username
+"""
+
+
+def read_records(path, fmt):
+    """(record number, dict or None if unreadable) for each input record."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from enumerate(csv.DictReader(f), start=1)
+            return
+        lines = (line for line in f if line.strip())
+        for number, line in enumerate(lines, start=1):
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError:
+                yield number, None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def validate_chunk(records, passwords="auto"):
+    """
+    Split (number, record) pairs into rows to stage and rejects, using the
+    validators' database-free checks. Repeats within the chunk are rejected
+    here; names already in the table are left to the merge. Rows whose
+    password is still plaintext come back with needs_hash set.
+    """
+    email_validator = EmailValidator()
+    username_validator = UsernameValidator()
+    password_validator = PasswordValidator()
+    rows, rejects = [], []
+    seen_emails, seen_usernames = set(), set()
+
+    for number, record in records:
+        email = record.get("email") if isinstance(record, dict) else None
+        try:
+            if not isinstance(record, dict):
+                raise ValidationError("Unreadable record.")
+            email_validator.validate_format(email)
+            username_validator.validate_format(record.get("username"))
+            password = record.get("password")
+            needs_hash = _needs_hash(password, passwords)
+            if needs_hash:
+                password_validator.validate(password)
+            if email.lower() in seen_emails:
+                raise ValidationError("Email appears twice in this import.")
+            if record["username"].lower() in seen_usernames:
+                raise ValidationError("Username appears twice in this import.")
+        except ValidationError as e:
+            rejects.append({"number": number, "email": email, "reason": str(e)})
+            continue
+
+        seen_emails.add(email.lower())
+        seen_usernames.add(record["username"].lower())
+        rows.append(
+            {
+                "number": number,
+                "email": CustomUser.objects.normalize_email(email),
+                "username": record["username"],
+                "full_name": record.get("full_name") or "",
+                "password": password,
+                "needs_hash": needs_hash,
+            }
+        )
+    return rows, rejects
+
+
+def _needs_hash(password, passwords):
+    if not isinstance(password, str) or not password:
+        raise ValidationError("Password is required.")
+    if passwords == "plain":
+        return True
+    try:
+        hashers.identify_hasher(password)
+        return False
+    except ValueError:
+        if passwords == "hashed":
+            raise ValidationError("Password hash is not in a configured format.")
+        return True
+
+
+def load_checkpoint(path, source):
+    """Progress saved for `source`, or a fresh start."""
+    state = {"source": source, "done": 0, "inserted": 0, "rejected": 0}
+    if os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+        if saved.get("source") == source:
+            state.update(saved)
+    return state
+
+
+def save_checkpoint(path, state):
+    # written aside and renamed so a crash never leaves half a checkpoint
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-import users from CSV or JSONL (email, username, full_name, "
+        "password). Passwords may be plaintext or already encoded in a "
+        "PASSWORD_HASHERS format. Each chunk is validated, hashed on a process "
+        "pool, COPY-ed into a temp table and merged in one statement; progress "
+        "is checkpointed per chunk so an interrupted import resumes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=("csv", "jsonl"))
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--workers", type=int, default=settings.PASSWORD_HASHER_WORKERS
+        )
+        parser.add_argument(
+            "--passwords",
+            choices=("auto", "hashed", "plain"),
+            default="auto",
+            help="auto: keep recognised hashes, hash the rest.",
+        )
+        parser.add_argument("--checkpoint", help="Default: <path>.checkpoint")
+        parser.add_argument("--rejects", help="Default: <path>.rejects.jsonl")
+        parser.add_argument(
+            "--restart", action="store_true", help="Ignore a saved checkpoint."
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        checkpoint = options["checkpoint"] or f"{path}.checkpoint"
+        source = os.path.abspath(path)
+        state = (
+            {"source": source, "done": 0, "inserted": 0, "rejected": 0}
+            if options["restart"]
+            else load_checkpoint(checkpoint, source)
+        )
+        if state["done"]:
+            self.stdout.write(f"resuming after record {state['done']}")
+
+        self.shards = ShardMap.get()
+        if any(connections[a].vendor != "postgresql" for a in self.shards.writers):
+            raise CommandError("import_users needs PostgreSQL (COPY).")
+
+        records = islice(read_records(path, fmt), state["done"], None)
+        rejects_path = options["rejects"] or f"{path}.rejects.jsonl"
+        start, imported = time.monotonic(), 0
+        with ProcessPoolExecutor(
+            options["workers"], mp_context=worker_context(), initializer=_init_worker
+        ) as pool, open(rejects_path, "a") as rejects_file:
+            for chunk in chunked(records, options["chunk_size"]):
+                rows, rejects = validate_chunk(chunk, options["passwords"])
+                taken = self._taken_usernames(rows)
+                rejects += [
+                    self._reject(row, "Username is already taken.")
+                    for row in rows
+                    if row["username"].lower() in taken
+                ]
+                rows = [row for row in rows if row["username"].lower() not in taken]
+                self._hash(pool, rows)
+                inserted = []
+                for alias, shard_rows in self._by_shard(rows).items():
+                    inserted += self._ingest(alias, shard_rows)
+                rejects += self._conflicts(rows, inserted)
+
+                for reject in rejects:
+                    rejects_file.write(json.dumps(reject) + "\n")
+                rejects_file.flush()
+                state["done"] += len(chunk)
+                state["inserted"] += len(inserted)
+                state["rejected"] += len(rejects)
+                save_checkpoint(checkpoint, state)
+
+                imported += len(chunk)
+                rate = imported / max(time.monotonic() - start, 1e-9)
+                self.stdout.write(
+                    f"records {state['done']}: {len(inserted)} inserted, "
+                    f"{len(rejects)} rejected, {rate:.0f} records/s"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{state['inserted']} users imported, {state['rejected']} "
+                f"rejected (see {rejects_path})."
+            )
+        )
+
+    def _hash(self, pool, rows):
+        pending = [row for row in rows if row["needs_hash"]]
+        hashed = pool.map(
+            hashers.make_password,
+            [row["password"] for row in pending],
+            chunksize=64,
+        )
+        for row, encoded in zip(pending, hashed):
+            row["password"] = encoded
+
+    def _taken_usernames(self, rows):
+        """
+        Lowercased usernames already used on any shard. Each merge only
+        sees its own shard, so with several this is asked of all of them.
+        """
+        if not self.shards.sharded or not rows:
+            return set()
+        names = [row["username"].lower() for row in rows]
+        taken = set()
+        for shard in self.shards.shards:
+            taken.update(
+                name.lower()
+                for name in CustomUser.objects.using(shard.writer)
+                .filter(username__lower__in=names)
+                .values_list("username", flat=True)
+            )
+        return taken
+
+    def _by_shard(self, rows):
+        by_shard = {}
+        for row in rows:
+            row["slot"] = self.shards.slot_for_email(row["email"])
+            writer = self.shards.for_slot(row["slot"]).writer
+            by_shard.setdefault(writer, []).append(row)
+        return by_shard
+
+    def _ingest(self, alias, rows):
+        """COPY `rows` into staging and merge them; the (email, username) inserted."""
+        # raw SQL sends no post_save, so the filters are updated here, and
+        # before the commit for the same reason the receiver does it early
+        RegisteredNames.get().add_many(
+            [(row["email"], row["username"]) for row in rows]
+        )
+
+        connection = connections[alias]
+        table = CustomUser._meta.db_table
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.execute(STAGING_SQL)
+            with cursor.copy(COPY_SQL) as copy:
+                for row in rows:
+                    copy.write_row([row[column] for column in COLUMNS])
+            cursor.execute(
+                MERGE_SQL.format(table=connection.ops.quote_name(table)),
+                [table, self.shards.stride, timezone.now()],
+            )
+            return cursor.fetchall()
+
+    def _conflicts(self, rows, inserted):
+        taken = {email for email, _ in inserted}
+        return [
+            self._reject(row, "Email or username is already taken.")
+            for row in rows
+            if row["email"] not in taken
+        ]
+
+    def _reject(self, row, reason):
+        return {"number": row["number"], "email": row["email"], "reason": reason}
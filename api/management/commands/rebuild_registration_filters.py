@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.tasks import rebuild_registration_filters
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the email/username Bloom filters from the users table. Run once "
+        "per region before relying on them, and after changing their capacity "
+        "or error rate; until then availability checks query the database."
+    )
+
+    def handle(self, *args, **options):
+        rebuild_registration_filters()
+        self.stdout.write(self.style.SUCCESS("Registration filters rebuilt."))
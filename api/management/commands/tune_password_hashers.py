@@ -0,0 +1,183 @@
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from api.hashing import _init_worker
+from api.metrics import HasherMetrics
+
+# Cost parameters tried per algorithm, cheapest first.
+CANDIDATES = {
+    "pbkdf2_sha256": [
+        {"iterations": n}
+        for n in (260_000, 390_000, 600_000, 870_000, 1_000_000, 1_500_000)
+    ],
+    "pbkdf2_sha1": [
+        {"iterations": n}
+        for n in (260_000, 390_000, 600_000, 870_000, 1_000_000, 1_500_000)
+    ],
+    "argon2": [
+        {"time_cost": t, "memory_cost": m}
+        for m in (19_456, 47_104, 102_400)
+        for t in (1, 2, 3, 4)
+    ],
+    "bcrypt_sha256": [{"rounds": r} for r in (10, 11, 12, 13, 14)],
+    # maxmem must cover 128 * n * r bytes or OpenSSL refuses the parameters
+    "scrypt": [
+        {"work_factor": 2**e, "maxmem": 256 * 2**e * 8} for e in (14, 15, 16, 17)
+    ],
+}
+
+
+def time_encode(hasher_path, params, password="Benchmark1Password"):
+    """Seconds for one encode (the same KDF work as one verification)."""
+    hasher = import_string(hasher_path)()
+    for name, value in params.items():
+        setattr(hasher, name, value)
+    salt = hasher.salt()
+    start = time.perf_counter()
+    hasher.encode(password, salt)
+    return time.perf_counter() - start
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    index = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def cost(params):
+    """Relative work of a parameter set, used to pick the strongest."""
+    return math.prod(params.values())
+
+
+def recommend(results, budget):
+    """The costliest parameters whose p99 fits in `budget` seconds, or None."""
+    fitting = [r for r in results if r["p99"] <= budget]
+    if not fitting:
+        return None
+    return max(fitting, key=lambda r: cost(r["params"]))
+
+
+def format_params(params):
+    return ",".join(f"{k}={v}" for k, v in params.items())
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the configured PASSWORD_HASHERS on this machine, with every "
+        "hashing worker busy, and recommend the strongest cost parameters that "
+        "keep LoginView/RegisterView inside their p99 latency targets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--login-p99-ms", type=float, default=300)
+        # registration runs two KDFs: hashing the password, then checking the repeat
+        parser.add_argument("--register-p99-ms", type=float, default=600)
+        parser.add_argument(
+            "--overhead-ms",
+            type=float,
+            default=25,
+            help="Non-hashing time per request (DB, Redis, serialization).",
+        )
+        parser.add_argument("--samples", type=int, default=20)
+        parser.add_argument(
+            "--workers", type=int, default=settings.PASSWORD_HASHER_WORKERS
+        )
+
+    def handle(self, *args, **options):
+        budget = self._hash_budget(options)
+        self.stdout.write(f"per-hash p99 budget: {budget * 1000:.0f} ms")
+        metrics = HasherMetrics()
+
+        recommendations = {}
+        with ProcessPoolExecutor(options["workers"], initializer=_init_worker) as pool:
+            for hasher in get_hashers():
+                results = self._benchmark(hasher, pool, options)
+                for result in results:
+                    for quantile in ("p50", "p99"):
+                        metrics.hash_seconds.set(
+                            result[quantile],
+                            labels={
+                                "algorithm": hasher.algorithm,
+                                "params": format_params(result["params"]),
+                                "quantile": quantile,
+                            },
+                        )
+                if results:
+                    recommendations[hasher.algorithm] = recommend(results, budget)
+
+        metrics.factory.provider.push()
+        self._print_snippet(recommendations)
+
+    def _hash_budget(self, options):
+        overhead = options["overhead_ms"]
+        login = options["login_p99_ms"] - overhead
+        register = (options["register_p99_ms"] - overhead) / 2
+        return max(min(login, register), 1) / 1000
+
+    def _benchmark(self, hasher, pool, options):
+        path = f"{type(hasher).__module__}.{type(hasher).__qualname__}"
+        candidates = CANDIDATES.get(hasher.algorithm)
+        if not candidates:
+            self.stdout.write(f"{hasher.algorithm}: no tunable parameters, skipped")
+            return []
+        if hasher.library:  # hashlib-backed hashers have nothing to load
+            try:
+                hasher._load_library()
+            except ValueError:
+                self.stdout.write(f"{hasher.algorithm}: library not installed, skipped")
+                return []
+
+        results = []
+        for params in candidates:
+            # Saturate every worker, as a login burst would.
+            jobs = options["samples"] * options["workers"]
+            try:
+                samples = list(pool.map(time_encode, [path] * jobs, [params] * jobs))
+            except ValueError as e:
+                self.stdout.write(f"{hasher.algorithm} {format_params(params)}: {e}")
+                continue
+            result = {
+                "params": params,
+                "p50": percentile(samples, 50),
+                "p99": percentile(samples, 99),
+            }
+            results.append(result)
+            self.stdout.write(
+                f"{hasher.algorithm:<14} {format_params(params):<36} "
+                f"p50 {result['p50'] * 1000:>7.1f} ms  p99 {result['p99'] * 1000:>7.1f} ms"
+            )
+        return results
+
+    def _print_snippet(self, recommendations):
+        configured = list(settings.PASSWORD_HASHERS)
+        preferred = get_hashers()[0]
+        choice = recommendations.get(preferred.algorithm)
+        if choice is None:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"No {preferred.algorithm} setting fits the budget; "
+                    "raise the targets or add hashing workers."
+                )
+            )
+            return
+
+        base = type(preferred)
+        name = f"Tuned{base.__name__}"
+        attributes = "\n".join(f"    {k} = {v}" for k, v in choice["params"].items())
+        remaining = "\n".join(f'    "{path}",' for path in configured[1:])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n# api/hashers.py\n"
+                f"from {base.__module__} import {base.__name__}\n\n\n"
+                f"class {name}({base.__name__}):\n{attributes}\n\n\n"
+                f"# settings.py (old hashes keep verifying and are upgraded on login)\n"
+                f"PASSWORD_HASHERS = [\n"
+                f'    "api.hashers.{name}",\n{remaining}\n]'
+            )
+        )
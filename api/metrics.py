@@ -95,7 +95,7 @@ class PrometheusMetric(MetricsProvider):
     def counter(self, name, description, labelnames=()):
         if name not in self.metrics:
             counter_obj = Counter(name, description, labelnames, registry=self.registry)
-        self.metrics[name] = PrometheusCounterWrapper(counter_obj)
+            self.metrics[name] = PrometheusCounterWrapper(counter_obj)
         return self.metrics[name]
 
     def histogram(self, name, description, labelnames=(), buckets=None):
@@ -103,14 +103,13 @@ class PrometheusMetric(MetricsProvider):
             hist_obj = Histogram(
                 name, description, labelnames, buckets=buckets, registry=self.registry
             )
-        self.metrics[name] = PrometheusHistogramWrapper(hist_obj)
+            self.metrics[name] = PrometheusHistogramWrapper(hist_obj)
         return self.metrics[name]
 
     def gauge(self, name, description, labelnames=()):
         if name not in self.metrics:
-            self.metrics[name] = Gauge(
-                name, description, labelnames, registry=self.registry
-            )
+            gauge_obj = Gauge(name, description, labelnames, registry=self.registry)
+            self.metrics[name] = PrometheusGaugeWrapper(gauge_obj)
         return self.metrics[name]
 
     def push(self):
@@ -129,6 +128,10 @@ class AbstractMetricsFactory(ABC):
     def create_histogram(self, name, documentation, labelnames=(), buckets=None):
         pass
 
+    @abstractmethod
+    def create_gauge(self, name, documentation, labelnames=()):
+        pass
+
 
 class MetricsRegistryError:
     _registry = {
@@ -154,6 +157,9 @@ class MetricsFactory(AbstractMetricsFactory):
     def create_histogram(self, name, documentation, labelnames=(), buckets=None):
         return self.provider.histogram(name, documentation, labelnames, buckets)
 
+    def create_gauge(self, name, documentation, labelnames=()):
+        return self.provider.gauge(name, documentation, labelnames)
+
     def get_provider_backend(self):
         backend_name = os.getenv("METRICS_BACKEND", "prometheus").lower()
         provider_cls = MetricsRegistryError.get(backend_name)
@@ -252,6 +258,172 @@ class TokenValidationMetrics(GeneralMetricsView):
     name = "token_validation"
 
 
+class ReplicationMetrics:
+    """Per-peer metrics for cross-region token replication."""
+
+    factory = GeneralMetricsView.factory
+
+    def __init__(self):
+        self.lag = self.factory.create_gauge(
+            name="token_replication_lag_seconds",
+            documentation="Age of the oldest entry not yet applied to a peer region",
+            labelnames=("peer",),
+        )
+
+
+class ReplicaMetrics:
+    """Read routing and health of the database read replicas."""
+
+    factory = GeneralMetricsView.factory
+
+    def __init__(self):
+        self.reads = self.factory.create_counter(
+            name="db_reads_total",
+            documentation="Reads routed to each database alias",
+            labelnames=("alias",),
+        )
+        self.lag = self.factory.create_gauge(
+            name="db_replica_lag_seconds",
+            documentation="Last probed replication lag of a read replica",
+            labelnames=("alias",),
+        )
+        self.healthy = self.factory.create_gauge(
+            name="db_replica_healthy",
+            documentation="1 while a read replica is in rotation",
+            labelnames=("alias",),
+        )
+
+
+class DatabasePoolMetrics:
+    """psycopg connection pool state per database alias."""
+
+    factory = GeneralMetricsView.factory
+
+    def __init__(self):
+        self.connections = self.factory.create_gauge(
+            name="db_pool_connections",
+            documentation="Pool connections by state (size, available, max)",
+            labelnames=("alias", "state"),
+        )
+        self.waiting = self.factory.create_gauge(
+            name="db_pool_requests_waiting",
+            documentation="Requests currently waiting for a pooled connection",
+            labelnames=("alias",),
+        )
+        self.wait_seconds = self.factory.create_gauge(
+            name="db_pool_checkout_wait_seconds",
+            documentation="Total time spent waiting for connections since start",
+            labelnames=("alias",),
+        )
+        self.checkout_errors = self.factory.create_gauge(
+            name="db_pool_checkout_errors",
+            documentation="Checkouts that failed or timed out since start",
+            labelnames=("alias",),
+        )
+
+
+class AuthCacheMetrics:
+    """Auth record cache lookups per tier; hit ratio = hit / all per tier."""
+
+    factory = GeneralMetricsView.factory
+
+    def __init__(self):
+        self.lookups = self.factory.create_counter(
+            name="auth_cache_lookups_total",
+            documentation="Auth record cache lookups by tier and result",
+            labelnames=("tier", "result"),
+        )
+
+
+class BloomFilterMetrics:
+    """Registration filter answers; "absent" is a database query saved."""
+
+    factory = GeneralMetricsView.factory
+
+    def __init__(self):
+        self.checks = self.factory.create_counter(
+            name="bloom_filter_checks_total",
+            documentation="Email/username filter checks by result (absent, maybe, unloaded)",
+            labelnames=("kind", "result"),
+        )
+
+
+class HasherMetrics:
+    """Load on the password hashing pool."""
+
+    factory = GeneralMetricsView.factory
+
+    def __init__(self):
+        self.queue_depth = self.factory.create_gauge(
+            name="password_hasher_queue_depth",
+            documentation="Password hashing jobs queued or running",
+        )
+        self.rejected = self.factory.create_counter(
+            name="password_hasher_rejected_total",
+            documentation="Password hashing jobs refused because the pool was full",
+        )
+        self.hash_seconds = self.factory.create_gauge(
+            name="password_hash_seconds",
+            documentation="Benchmarked time for one password hash on this hardware",
+            labelnames=("algorithm", "params", "quantile"),
+        )
+
+
+class AdmissionMetrics:
+    """Per endpoint class concurrency, for load shedding and autoscaling."""
+
+    factory = GeneralMetricsView.factory
+
+    def __init__(self):
+        labelnames = ("endpoint_class",)
+        self.in_flight = self.factory.create_gauge(
+            name="admission_in_flight",
+            documentation="Requests currently admitted",
+            labelnames=labelnames,
+        )
+        self.queued = self.factory.create_gauge(
+            name="admission_queued",
+            documentation="Requests waiting for a concurrency slot",
+            labelnames=labelnames,
+        )
+        self.limit = self.factory.create_gauge(
+            name="admission_limit",
+            documentation="Current adaptive concurrency limit",
+            labelnames=labelnames,
+        )
+        self.shed = self.factory.create_counter(
+            name="admission_shed_total",
+            documentation="Requests shed with 503 instead of queueing",
+            labelnames=labelnames,
+        )
+
+
+class RateLimitMetrics:
+    """Requests refused by the rate limiter."""
+
+    factory = GeneralMetricsView.factory
+
+    def __init__(self):
+        self.limited = self.factory.create_counter(
+            name="rate_limited_total",
+            documentation="Requests refused with 429, by scope and where they were caught",
+            labelnames=("scope", "source"),
+        )
+
+
+class RegionRoutingMetrics:
+    """Where token refreshes were served: locally or by the home region."""
+
+    factory = GeneralMetricsView.factory
+
+    def __init__(self):
+        self.routed = self.factory.create_counter(
+            name="token_refresh_routing_total",
+            documentation="Token refreshes by route (local, proxied, proxy_failed)",
+            labelnames=("route",),
+        )
+
+
 """
 The decorator to track metrics for DRF views.
 """
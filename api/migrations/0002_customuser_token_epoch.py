@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="token_epoch",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,82 @@
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+INDEXES = ("customuser_email_lower_uniq", "customuser_username_lower_idx")
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    Refuse to start while emails differing only in case exist: the unique
+    build would fail on them partway through. Lists them to merge first.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT LOWER("email"), array_agg("id" ORDER BY "id") '
+            'FROM "api_customuser" GROUP BY LOWER("email") '
+            "HAVING COUNT(*) > 1 ORDER BY 1 LIMIT 100"
+        )
+        duplicates = cursor.fetchall()
+    if duplicates:
+        listing = "\n".join(f"  {email}: user ids {ids}" for email, ids in duplicates)
+        raise RuntimeError(
+            "Emails registered more than once (ignoring case); merge or "
+            f"remove these accounts before migrating:\n{listing}"
+        )
+
+
+def drop_invalid_indexes(apps, schema_editor):
+    """
+    A failed CONCURRENTLY build leaves an INVALID index behind, which
+    IF NOT EXISTS would then accept without it enforcing anything.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE NOT i.indisvalid AND c.relname = ANY(%s)",
+            [list(INDEXES)],
+        )
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction; building the
+    # indexes this way keeps api_customuser writable while they are built
+    atomic = False
+
+    dependencies = [
+        ("api", "0002_customuser_token_epoch"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunPython(drop_invalid_indexes, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "
+                    '"customuser_email_lower_uniq" ON "api_customuser" '
+                    '(LOWER("email"))',
+                    reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS "
+                    '"customuser_email_lower_uniq"',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="customuser",
+                    constraint=models.UniqueConstraint(
+                        django.db.models.functions.text.Lower("email"),
+                        name="customuser_email_lower_uniq",
+                    ),
+                ),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name="customuser",
+            index=models.Index(
+                django.db.models.functions.text.Lower("username"),
+                name="customuser_username_lower_idx",
+            ),
+        ),
+    ]
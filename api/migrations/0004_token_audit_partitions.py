@@ -0,0 +1,114 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+# Range-partitioned by issue day. The primary key has to include the
+# partition key. Dated partitions are created ahead of time, and dropped
+# once expired, by api.tasks.maintain_token_audit_partitions. The DEFAULT
+# partition only catches rows for days that have no partition.
+PARTITIONED_TABLES_SQL = """
+CREATE TABLE api_issued_token (
+    jti varchar(255) NOT NULL,
+    issued_at timestamp with time zone NOT NULL,
+    expires_at timestamp with time zone NOT NULL,
+    user_id bigint NULL,
+    token text NOT NULL DEFAULT '',
+    PRIMARY KEY (jti, issued_at)
+) PARTITION BY RANGE (issued_at);
+CREATE TABLE api_issued_token_default PARTITION OF api_issued_token DEFAULT;
+
+CREATE TABLE api_revoked_token (
+    jti varchar(255) NOT NULL,
+    issued_at timestamp with time zone NOT NULL,
+    expires_at timestamp with time zone NOT NULL,
+    user_id bigint NULL,
+    revoked_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (jti, issued_at)
+) PARTITION BY RANGE (issued_at);
+CREATE TABLE api_revoked_token_default PARTITION OF api_revoked_token DEFAULT;
+"""
+
+
+# The first week's UTC-day partitions, so rows do not collect in DEFAULT
+# until the maintenance task first runs. Kept as SQL so the migration does
+# not change with TokenAuditPartitions.
+INITIAL_PARTITIONS_SQL = """
+DO $$
+DECLARE
+    parent text;
+    day date;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['api_issued_token', 'api_revoked_token'] LOOP
+        FOR day IN
+            SELECT (now() AT TIME ZONE 'UTC')::date + generate_series(0, 7)
+        LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I '
+                'FOR VALUES FROM (%L) TO (%L)',
+                parent || '_p' || to_char(day, 'YYYYMMDD'),
+                parent,
+                day::timestamp AT TIME ZONE 'UTC',
+                (day + 1)::timestamp AT TIME ZONE 'UTC'
+            );
+        END LOOP;
+    END LOOP;
+END
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_customuser_lower_email_username"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IssuedToken",
+            fields=[
+                (
+                    "pk",
+                    models.CompositePrimaryKey(
+                        "jti", "issued_at", blank=True, editable=False, primary_key=True
+                    ),
+                ),
+                ("jti", models.CharField(max_length=255)),
+                ("issued_at", models.DateTimeField()),
+                ("expires_at", models.DateTimeField()),
+                ("user_id", models.BigIntegerField(null=True)),
+                ("token", models.TextField(blank=True)),
+            ],
+            options={
+                "db_table": "api_issued_token",
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="RevokedToken",
+            fields=[
+                (
+                    "pk",
+                    models.CompositePrimaryKey(
+                        "jti", "issued_at", blank=True, editable=False, primary_key=True
+                    ),
+                ),
+                ("jti", models.CharField(max_length=255)),
+                ("issued_at", models.DateTimeField()),
+                ("expires_at", models.DateTimeField()),
+                ("user_id", models.BigIntegerField(null=True)),
+                (
+                    "revoked_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+            options={
+                "db_table": "api_revoked_token",
+                "managed": False,
+            },
+        ),
+        migrations.RunSQL(
+            PARTITIONED_TABLES_SQL,
+            reverse_sql="DROP TABLE api_revoked_token; DROP TABLE api_issued_token;",
+        ),
+        migrations.RunSQL(INITIAL_PARTITIONS_SQL, migrations.RunSQL.noop),
+    ]
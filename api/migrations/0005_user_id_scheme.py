@@ -0,0 +1,25 @@
+from django.db import migrations
+
+# Ids issued from here on carry their slot (api.sharding). Recording the
+# highest id issued before that lets ShardMap refuse to start sharded while
+# plain ids remain, and tells `manage.py encode_user_ids` which to re-key.
+# Migrate before serving the new code: ids encoded earlier would be
+# counted as plain and re-keyed needlessly.
+USER_ID_SCHEME_SQL = """
+CREATE TABLE api_user_id_scheme (legacy_max_id bigint NOT NULL);
+INSERT INTO api_user_id_scheme (legacy_max_id)
+SELECT COALESCE(MAX(id), 0) FROM api_customuser;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_token_audit_partitions"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            USER_ID_SCHEME_SQL, reverse_sql="DROP TABLE api_user_id_scheme;"
+        ),
+    ]
@@ -5,8 +5,15 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 from django.db import models
+from django.db.models.functions import Lower
 from django.utils import timezone
 
+from .sharding import ShardMap
+
+# email__lower / username__lower compile to LOWER(col), which the
+# functional indexes below serve
+models.CharField.register_lookup(Lower)
+
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, username, password=None, **extra_fields):
@@ -20,6 +27,13 @@ class CustomUserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def create(self, **kwargs):
+        # QuerySet.create fixes the alias before the row exists; saving
+        # without one lets the router send it to the user's shard
+        user = self.model(**kwargs)
+        user.save(force_insert=True, using=self._db)
+        return user
+
     def create_superuser(self, email, username, password=None, **extra_fields):
         extra_fields.setdefault("is_staff", True)
         extra_fields.setdefault("is_superuser", True)
@@ -37,6 +51,8 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(default=timezone.now)
+    # bumped to invalidate every token issued before the change
+    token_epoch = models.PositiveIntegerField(default=0)
 
     objects = CustomUserManager()
 
@@ -48,5 +64,58 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     fields = required + ["full_name"]
     auth_fields = ["email", "password"]
 
+    class Meta:
+        constraints = [
+            # one account per address however it is capitalised
+            models.UniqueConstraint(Lower("email"), name="customuser_email_lower_uniq"),
+        ]
+        indexes = [
+            models.Index(Lower("username"), name="customuser_username_lower_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            # sharded ids carry the slot of the email (api.sharding)
+            self.pk = ShardMap.get().allocate_id(self.email, self._meta.db_table)
+            if self.pk is not None:
+                kwargs.setdefault("force_insert", True)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.username  # display username in admin
+
+
+# ---------------------
+# Token audit
+# ---------------------
+# Both tables are range-partitioned by the day the token was issued (see
+# migration 0004 and api.token_audit.TokenAuditPartitions); Django does not
+# manage them. Filter on issued_at as well as jti so a query touches one
+# partition. There is no foreign key to the user: users live on their shard.
+
+
+class IssuedToken(models.Model):
+    pk = models.CompositePrimaryKey("jti", "issued_at")
+    jti = models.CharField(max_length=255)
+    issued_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    user_id = models.BigIntegerField(null=True)
+    token = models.TextField(blank=True)
+
+    class Meta:
+        managed = False
+        db_table = "api_issued_token"
+
+
+class RevokedToken(models.Model):
+    pk = models.CompositePrimaryKey("jti", "issued_at")
+    jti = models.CharField(max_length=255)
+    # when the revoked token was issued, so it shares the partition day
+    issued_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    user_id = models.BigIntegerField(null=True)
+    revoked_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        managed = False
+        db_table = "api_revoked_token"
@@ -1,5 +1,8 @@
 import requests
 from abc import ABC, abstractmethod
+from django.conf import settings
+
+from .deadline import Deadline
 
 
 class ThirdPartyStrategy(ABC):
@@ -22,7 +25,11 @@ class GoogleStrategy(ThirdPartyStrategy):
         }
 
     def get_response(self, url, token):
-        return requests.get(url, params={"id_token": token})
+        return requests.get(
+            url,
+            params={"id_token": token},
+            timeout=Deadline.timeout(settings.OAUTH_PROVIDER_TIMEOUT),
+        )
 
 
 class ThirdPartyStrategySingleton:
@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+_pinned = ContextVar("pinned_to_primary", default=False)
+
+
+def is_pinned() -> bool:
+    """True while reads in this context must see the primary."""
+    return _pinned.get()
+
+
+@contextmanager
+def pinned_to_primary(pinned=True):
+    token = _pinned.set(pinned or _pinned.get())
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReadYourWrites:
+    """
+    Short-lived Redis markers for users written in the last
+    READ_YOUR_WRITES_WINDOW ms. Reads for a marked user go to the primary
+    until the replicas have caught up; all other reads stay on the replica.
+    """
+
+    key_prefix = "rw_sticky"
+
+    def __init__(self, redis_conn=None):
+        self.redis_conn = redis_conn or get_redis_connection("default")
+        self.window_ms = settings.READ_YOUR_WRITES_WINDOW_MS
+
+    def mark(self, user):
+        pipe = self.redis_conn.pipeline()
+        for key in self._keys(email=user.email, user_id=user.pk):
+            pipe.set(key, 1, px=self.window_ms)
+        try:
+            pipe.execute()
+        except RedisError as e:
+            # the write itself succeeded; worst case a read is briefly stale
+            print("could not mark user as recently written", e)
+
+    def is_sticky(self, email=None, user_id=None) -> bool:
+        keys = self._keys(email=email, user_id=user_id)
+        if not keys:
+            return False
+        try:
+            return bool(self.redis_conn.exists(*keys))
+        except RedisError as e:
+            # the replica is only a lag window behind; keep reads off the primary
+            print("read-your-writes marker unavailable", e)
+            return False
+
+    @contextmanager
+    def reads_for(self, email=None, user_id=None):
+        """Route the reads inside to the primary if the user was just written."""
+        with pinned_to_primary(self.is_sticky(email=email, user_id=user_id)):
+            yield
+
+    def _keys(self, email=None, user_id=None):
+        keys = []
+        if email:
+            keys.append(f"{self.key_prefix}:email:{email.lower()}")
+        if user_id is not None:
+            keys.append(f"{self.key_prefix}:id:{user_id}")
+        return keys
@@ -0,0 +1,171 @@
+# ------------------------------------------------------------------
+# LUA SOURCES
+# ------------------------------------------------------------------
+
+# KEYS[1] = blacklisted_token:<old jti>, KEYS[2] = refresh_token:<old jti>
+# KEYS[3] = replication stream, KEYS[4] = refresh_token:<new jti> (optional)
+# ARGV[1] = seconds until the old token expires, ARGV[2] = its exp claim
+# ARGV[3] = approximate stream length cap
+# ARGV[4] = seconds until the new token expires
+# Returns 1 if this call consumed the token, 0 if it was already revoked.
+ROTATE_REFRESH = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('SET', KEYS[1], '1', 'EX', ARGV[1])
+redis.call('DEL', KEYS[2])
+redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[3], '*', 'key', KEYS[1], 'exp', ARGV[2])
+if KEYS[4] then
+    redis.call('SET', KEYS[4], '1', 'EX', ARGV[4])
+end
+return 1
+"""
+
+# KEYS[1] = blacklisted_token:<refresh jti>, KEYS[2] = blacklisted_token:<access jti>
+# KEYS[3] = refresh_token:<refresh jti>, KEYS[4] = replication stream
+# ARGV[1] / ARGV[2] = seconds until the refresh / access token expires
+# ARGV[3] / ARGV[4] = exp claims of the refresh / access token
+# ARGV[5] = approximate stream length cap
+# Returns the number of tokens that were not already revoked.
+REVOKE_PAIR = """
+local revoked = 0
+for i = 1, 2 do
+    if redis.call('SET', KEYS[i], '1', 'EX', ARGV[i], 'NX') then
+        revoked = revoked + 1
+        redis.call('XADD', KEYS[4], 'MAXLEN', '~', ARGV[5], '*',
+                   'key', KEYS[i], 'exp', ARGV[i + 2])
+    end
+end
+redis.call('DEL', KEYS[3])
+return revoked
+"""
+
+# KEYS = blacklisted_token:<jti> for every token to check
+# Returns one 0/1 flag per key, in order.
+CHECK_REVOKED_MANY = """
+local flags = {}
+for i, key in ipairs(KEYS) do
+    flags[i] = redis.call('EXISTS', key)
+end
+return flags
+"""
+
+# KEYS = one sorted set per limited dimension (ip, email, endpoint, ...)
+# ARGV[1] = unique member for this request
+# ARGV[2i] / ARGV[2i + 1] = limit / window in ms for KEYS[i]
+# Returns 0 if the request was admitted (and recorded in every window),
+# otherwise the ms until the tightest window has room again.
+SLIDING_WINDOW = """
+local now = redis.call('TIME')
+local now_ms = now[1] * 1000 + math.floor(now[2] / 1000)
+local retry = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2])
+    local window = tonumber(ARGV[i * 2 + 1])
+    redis.call('ZREMRANGEBYSCORE', key, 0, now_ms - window)
+    if redis.call('ZCARD', key) >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        local wait = window
+        if oldest[2] then
+            wait = tonumber(oldest[2]) + window - now_ms
+        end
+        retry = math.max(retry, wait, 1)
+    end
+end
+if retry > 0 then
+    return retry
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now_ms, ARGV[1])
+    redis.call('PEXPIRE', key, ARGV[i * 2 + 1])
+end
+return 0
+"""
+
+# KEYS[1] = version key the caller read before loading, KEYS[2] = value key
+# KEYS[3] = set of emails cached for the user (email lookups only)
+# ARGV[1] = version read before loading, ARGV[2] = ttl in ms, ARGV[3] = value
+# ARGV[4] = the email, added to KEYS[3]
+# Returns 1 if stored, 0 if the user was invalidated while it was loading.
+CACHE_SET_IF_VERSION = """
+local current = redis.call('GET', KEYS[1]) or '0'
+if current ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[3], 'PX', ARGV[2])
+if KEYS[3] then
+    redis.call('SADD', KEYS[3], ARGV[4])
+    redis.call('PEXPIRE', KEYS[3], ARGV[2])
+end
+return 1
+"""
+
+# KEYS[1] = version key the caller read before loading, KEYS[2] = hash key
+# ARGV[1] = version read before loading, ARGV[2] = ttl in seconds
+# ARGV[3..] = field, value pairs
+# Returns 1 if stored, 0 if the user was invalidated while it was loading.
+HASH_SET_IF_VERSION = """
+local current = redis.call('GET', KEYS[1]) or '0'
+if current ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[2], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# KEYS[1] = set of emails cached for the user, KEYS[2] = the user's id entry
+# KEYS[3] = the user's id version key
+# ARGV[1] = key prefix, ARGV[2] = version key ttl in ms
+# ARGV[3..] = emails known to the caller (e.g. the one just saved)
+# Email keys are derived from KEYS[1], since a changed address leaves the
+# old one cached. Returns every email whose entry was dropped.
+CACHE_INVALIDATE = """
+local emails = redis.call('SMEMBERS', KEYS[1])
+for i = 3, #ARGV do
+    table.insert(emails, ARGV[i])
+end
+redis.call('INCR', KEYS[3])
+redis.call('PEXPIRE', KEYS[3], ARGV[2])
+redis.call('DEL', KEYS[1], KEYS[2])
+for _, email in ipairs(emails) do
+    local version = ARGV[1] .. ':ver:email:' .. email
+    redis.call('INCR', version)
+    redis.call('PEXPIRE', version, ARGV[2])
+    redis.call('DEL', ARGV[1] .. ':email:' .. email)
+end
+return emails
+"""
+
+
+# ------------------------------------------------------------------
+# REGISTRY
+# ------------------------------------------------------------------
+
+
+class RedisScripts:
+    """
+    Registry of server-side scripts. Each script is registered once and then
+    invoked with EVALSHA (redis-py reloads it transparently on NOSCRIPT).
+    """
+
+    _sources = {
+        "rotate_refresh": ROTATE_REFRESH,
+        "revoke_pair": REVOKE_PAIR,
+        "check_revoked_many": CHECK_REVOKED_MANY,
+        "sliding_window": SLIDING_WINDOW,
+        "cache_set_if_version": CACHE_SET_IF_VERSION,
+        "hash_set_if_version": HASH_SET_IF_VERSION,
+        "cache_invalidate": CACHE_INVALIDATE,
+    }
+    _scripts = {}
+
+    @classmethod
+    def run(cls, conn, name, keys=(), args=()):
+        script = cls._scripts.get(name)
+        if script is None:
+            source = cls._sources.get(name)
+            if source is None:
+                raise ValueError(f"Unknown redis script: {name}")
+            script = cls._scripts[name] = conn.register_script(source)
+        return script(keys=list(keys), args=list(args), client=conn)
@@ -0,0 +1,109 @@
+import logging
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import TokenError
+
+from .deadline import DEADLINE_HEADER, Deadline
+from .metrics import RegionRoutingMetrics
+from .tokens import REGION_CLAIM, BufferedRefreshToken
+
+# set on forwarded requests so a region never proxies a proxied refresh
+PROXIED_HEADER = "X-Proxied-From-Region"
+
+logger = logging.getLogger(__name__)
+
+
+class HomeRegionProxy:
+    """Forwards a token refresh to the region that issued the token."""
+
+    refresh_path = "/token-refresh/"
+    _session = None
+
+    def __init__(self, endpoints=None, timeout=None):
+        self.endpoints = settings.REGION_ENDPOINTS if endpoints is None else endpoints
+        self.timeout = timeout or settings.REGION_PROXY_TIMEOUT
+
+    @classmethod
+    def session(cls):
+        """One keep-alive connection pool per process, shared by all requests."""
+        if cls._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            cls._session = session
+        return cls._session
+
+    def can_proxy(self, region) -> bool:
+        return region != settings.REGION and region in self.endpoints
+
+    def refresh(self, region, refresh_token):
+        """Return (body, status code) from the home region."""
+        url = self.endpoints[region].rstrip("/") + self.refresh_path
+        headers = {PROXIED_HEADER: settings.REGION}
+        timeout = Deadline.timeout(self.timeout)
+        remaining = Deadline.remaining()
+        if remaining is not None:
+            # the home region gets what is left of our budget, not a fresh one
+            headers[DEADLINE_HEADER] = str(int(remaining * 1000))
+        response = self.session().post(
+            url,
+            json={"refresh": refresh_token},
+            headers=headers,
+            timeout=timeout,
+        )
+        return response.json(), response.status_code
+
+
+class HomeRegionRouter:
+    """
+    Decides where a refresh is served. Tokens issued here are refreshed
+    locally; every other token is proxied to its home region, whose shards
+    hold its user and status. Only revocations are replicated between
+    regions, so a peer cannot vouch for a foreign token itself.
+    """
+
+    metrics = None
+
+    def __init__(self, proxy=None):
+        self.proxy = proxy or HomeRegionProxy()
+
+    @classmethod
+    def get_metrics(cls):
+        if HomeRegionRouter.metrics is None:
+            HomeRegionRouter.metrics = RegionRoutingMetrics()
+        return HomeRegionRouter.metrics
+
+    def route(self, request):
+        """Return a Response if the refresh was proxied, else None."""
+        raw = request.data.get("refresh")
+        if not raw or request.headers.get(PROXIED_HEADER):
+            return None
+        try:
+            token = BufferedRefreshToken(raw)
+        except TokenError:
+            return None  # the local state machine reports the error
+
+        region = token.get(REGION_CLAIM, settings.REGION)
+        if not self.proxy.can_proxy(region):
+            self._count("local")
+            return None
+
+        try:
+            body, status_code = self.proxy.refresh(region, raw)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("refresh proxy to %s failed: %s", region, e)
+            self._count("proxy_failed")
+            return Response(
+                {"errors": "Home region is unavailable, try again later."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        self._count("proxied")
+        return Response(body, status=status_code)
+
+    def _count(self, route):
+        self.get_metrics().routed.increment(labels={"route": route})
@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from .metrics import ReplicaMetrics
+
+
+class ReplicaPool:
+    """
+    Weighted pool of read replica aliases. A background thread probes each
+    replica's replication lag every `probe_interval` seconds and takes
+    readers that are down or further behind than `max_lag` out of rotation
+    until they recover. choose() returns None when no reader is usable.
+    """
+
+    instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self, weights, max_lag, probe_interval, lag_sql, metrics=None, rng=None
+    ):
+        self.weights = dict(weights)
+        self.max_lag = max_lag
+        self.probe_interval = probe_interval
+        self.lag_sql = lag_sql
+        self.metrics = metrics or ReplicaMetrics()
+        self.rng = rng or random.Random()
+        # every reader starts in rotation; the first probe corrects that
+        self.healthy = list(self.weights)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        if ReplicaPool.instance is None:
+            with ReplicaPool._instance_lock:
+                if ReplicaPool.instance is None:
+                    pool = cls(
+                        settings.READ_REPLICA_WEIGHTS,
+                        max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+                        probe_interval=settings.REPLICA_PROBE_INTERVAL,
+                        lag_sql=settings.REPLICA_LAG_SQL,
+                    )
+                    pool.start()
+                    ReplicaPool.instance = pool
+        return ReplicaPool.instance
+
+    def choose(self):
+        healthy = self.healthy
+        if not healthy:
+            return None
+        if len(healthy) == 1:
+            return healthy[0]
+        weights = [self.weights[alias] for alias in healthy]
+        return self.rng.choices(healthy, weights=weights)[0]
+
+    # ---------------------
+    # Health probing
+    # ---------------------
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="replica-probe", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self.probe()
+            time.sleep(self.probe_interval)
+
+    def probe(self):
+        healthy = []
+        for alias in self.weights:
+            lag = self.lag(alias)
+            usable = lag is not None and lag <= self.max_lag
+            if usable:
+                healthy.append(alias)
+            self.metrics.healthy.set(int(usable), labels={"alias": alias})
+            if lag is not None:
+                self.metrics.lag.set(lag, labels={"alias": alias})
+        # swapped whole so readers never see a half-built list
+        self.healthy = healthy
+        return healthy
+
+    def lag(self, alias):
+        """Replication lag in seconds, or None if the replica is unreachable."""
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(self.lag_sql)
+                row = cursor.fetchone()
+        except DatabaseError as e:
+            print("replica probe failed", alias, e)
+            return None
+        finally:
+            # the probe thread should not pin a connection between rounds
+            connection.close()
+        # no row or NULL: the reader answers but reports no lag figure
+        return float(row[0]) if row and row[0] is not None else 0.0
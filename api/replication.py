@@ -0,0 +1,145 @@
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError, ResponseError
+
+from .metrics import ReplicationMetrics
+from .utils import REPLICATION_STREAM
+
+logger = logging.getLogger(__name__)
+
+
+class TokenReplicator:
+    """
+    Ships entries from the local replication stream to one peer region.
+
+    Every peer has its own consumer group, so a slow or unreachable region
+    only holds back its own cursor. Entries are applied with SET EX, which
+    makes replaying a batch after a crash harmless.
+    """
+
+    consumer = "replicator"
+    batch_size = 500
+    max_batches = 20  # per run, so one busy peer cannot hog the worker
+
+    def __init__(self, peer, peer_conn, local_conn=None, metrics=None):
+        self.peer = peer
+        self.peer_conn = peer_conn
+        self.local_conn = local_conn or get_redis_connection("default")
+        self.metrics = metrics or ReplicationMetrics()
+        self.group = f"replicator:{peer}"
+
+    def ensure_group(self):
+        try:
+            self.local_conn.xgroup_create(
+                REPLICATION_STREAM, self.group, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def replicate(self) -> int:
+        """Apply pending entries to the peer. Returns how many were shipped."""
+        self.ensure_group()
+        shipped = 0
+        try:
+            # Entries read but never acked (peer was down, worker crashed)
+            # are retried before new ones are read.
+            for cursor in ("0", ">"):
+                for _ in range(self.max_batches):
+                    entries = self._read(cursor)
+                    if not entries:
+                        break
+                    self._apply(entries)
+                    shipped += len(entries)
+        finally:
+            self.metrics.lag.set(self.lag(), labels={"peer": self.peer})
+        return shipped
+
+    def lag(self) -> float:
+        """
+        Seconds since the oldest entry this peer has not applied. Entries are
+        delivered in order, so that is the oldest unacked one if there is
+        any, else the first one past the group's last-delivered id.
+        """
+        pending = self.local_conn.xpending(REPLICATION_STREAM, self.group)
+        oldest = pending["min"] if pending["pending"] else self._first_unread()
+        if oldest is None:
+            return 0.0
+        if isinstance(oldest, bytes):
+            oldest = oldest.decode()
+        oldest_ms = int(oldest.split("-")[0])
+        return max(time.time() - oldest_ms / 1000, 0.0)
+
+    def _first_unread(self):
+        """Id of the first entry this peer's group has not read yet, or None."""
+        for group in self.local_conn.xinfo_groups(REPLICATION_STREAM):
+            name = group["name"]
+            if (name.decode() if isinstance(name, bytes) else name) != self.group:
+                continue
+            last = group["last-delivered-id"]
+            if isinstance(last, bytes):
+                last = last.decode()
+            entries = self.local_conn.xrange(
+                REPLICATION_STREAM, min=f"({last}", count=1
+            )
+            return entries[0][0] if entries else None
+        return None
+
+    def _read(self, cursor):
+        response = self.local_conn.xreadgroup(
+            self.group,
+            self.consumer,
+            {REPLICATION_STREAM: cursor},
+            count=self.batch_size,
+        )
+        return response[0][1] if response else []
+
+    def _apply(self, entries):
+        now = int(time.time())
+        pipe = self.peer_conn.pipeline(transaction=False)
+        for _, fields in entries:
+            # Trimmed entries come back without fields; they only need acking.
+            if not fields:
+                continue
+            ttl = int(fields[b"exp"]) - now
+            if ttl > 0:
+                pipe.set(fields[b"key"], "1", ex=ttl)
+        pipe.execute()
+        self.local_conn.xack(
+            REPLICATION_STREAM, self.group, *[entry_id for entry_id, _ in entries]
+        )
+
+
+# ------------------------------------------------------------------
+# PEERS
+# ------------------------------------------------------------------
+
+_peer_connections = {}
+
+
+def peer_connection(url):
+    """One pooled client per peer URL, reused across task runs."""
+    conn = _peer_connections.get(url)
+    if conn is None:
+        conn = _peer_connections[url] = redis.Redis.from_url(
+            url, socket_timeout=2, socket_connect_timeout=2
+        )
+    return conn
+
+
+def replicate_to_peers(peers=None):
+    """Run one replication pass for every configured peer region."""
+    peers = settings.REPLICATION_PEERS if peers is None else peers
+    shipped = {}
+    for peer, url in peers.items():
+        try:
+            shipped[peer] = TokenReplicator(peer, peer_connection(url)).replicate()
+        except RedisError as e:
+            # Leave the entries pending; the next run retries them.
+            logger.warning("replication to %s failed: %s", peer, e)
+            shipped[peer] = None
+    return shipped
@@ -1,6 +1,17 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers  # type: ignore
 
+from .hashing import password_for_storage
 from .models import CustomUser
+from .sharding import ShardMap
+from .validators import EMAIL_TAKEN
+
+# unique indexes that reject a second account for an email: the column's
+# own (from unique=True) and the case-insensitive one
+EMAIL_UNIQUE_CONSTRAINTS = {
+    "api_customuser_email_key",
+    "customuser_email_lower_uniq",
+}
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -9,6 +20,29 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ["id", "email", "password"]
+        # EmailValidator already checked the address earlier in the flow; the
+        # unique index catches the rest in create() without another SELECT
+        extra_kwargs = {"email": {"validators": []}}
+
+    def validate_password(self, value):
+        # context["password_hashed"] is set by builders fed by the state
+        # machine, whose PasswordOutput has hashed the value already
+        return password_for_storage(
+            value, hashed=self.context.get("password_hashed", False)
+        )
+
+    def create(self, validated_data):
+        writer = ShardMap.get().for_email(validated_data["email"]).writer
+        try:
+            # savepoint, so a duplicate does not break an enclosing transaction
+            with transaction.atomic(using=writer):
+                return super().create(validated_data)
+        except IntegrityError as e:
+            # psycopg's error, chained by Django, names the violated index
+            diag = getattr(e.__cause__, "diag", None)
+            if getattr(diag, "constraint_name", None) not in EMAIL_UNIQUE_CONSTRAINTS:
+                raise
+            raise serializers.ValidationError({"email": [EMAIL_TAKEN]})
 
     def update(self, instance, validated_data):
         print("Updating via serializer")
@@ -20,9 +54,9 @@ class UserSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        # Safely set password using Django's set_password method
+        # Already hashed by validate_password
         if password:
-            instance.set_password(password)
+            instance.password = password
 
         instance.save()
         print(instance.password, instance.email)  # optional debug
@@ -1,6 +1,7 @@
 import json
 from abc import ABC, abstractmethod
 from django_redis import get_redis_connection
+from .deadline import Deadline, DeadlineExceeded
 from .utils import get_transaction_id, create_jwt, decode_jwt
 from .tracers import trace
 
@@ -44,6 +45,7 @@ class AuthService(Servicable):
             return self._get_result()
         print(state_inputs, self.state.next)
         for key, value in state_inputs.items():
+            Deadline.check()  # stop once the client has given up
             print("k", key, "val", value, "state", self.state.name)
             step_result = self._process_step(key, value)
             if not step_result["success"]:
@@ -59,12 +61,7 @@ class AuthService(Servicable):
             if final_result["success"]:
                 print("scuess")
                 self._on_successful_finish()
-                try:
-                    print("now buildign..", final_result["output"])
-                    self.result = {"create": self.builder.build(final_result["output"])}
-                    print(self.result, "good finsih")
-                except Exception as e:
-                    self.errors["builder_exception"] = str(e)
+                self._build(final_result["output"])
 
         self._on_finish_execution()
         return self._get_result()
@@ -88,12 +85,24 @@ class AuthService(Servicable):
             next_state = self.state.handle(value)
             print("next state", next_state)
             output = getattr(self.state, "get_data", lambda v: v)(value)
-            print(self.state.get_data(value), "outp98put")
+            print(output, "outp98put")
             return {"success": True, "output": output, "next_state": next_state}
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             self.errors[self.state.name] = str(e)
             return {"success": False, "output": None, "next_state": None}
 
+    def _build(self, output):
+        try:
+            print("now buildign..", output)
+            self.result = {"create": self.builder.build(output)}
+            print(self.result, "good finsih")
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            self.errors["builder_exception"] = str(e)
+
     def _save(self, key, value):
         self.info[key] = value
 
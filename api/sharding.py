@@ -0,0 +1,193 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+from .read_your_writes import is_pinned
+from .replica_pool import ReplicaPool
+
+# single row written by migration 0005: the highest id issued before ids
+# carried their slot
+USER_ID_SCHEME_TABLE = "api_user_id_scheme"
+
+
+class Shard:
+    """One writer alias and its weighted read replicas."""
+
+    def __init__(self, index, writer, readers=None, pool=None, shared_pool=False):
+        self.index = index
+        self.writer = writer
+        self.readers = dict(readers or {})
+        # shard 0 uses the process-wide ReplicaPool the plain router uses
+        self.shared_pool = shared_pool
+        self._pool = pool
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self.shared_pool:
+            return ReplicaPool.get()
+        if self._pool is None and self.readers:
+            with self._lock:
+                if self._pool is None:
+                    pool = ReplicaPool(
+                        self.readers,
+                        max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+                        probe_interval=settings.REPLICA_PROBE_INTERVAL,
+                        lag_sql=settings.REPLICA_LAG_SQL,
+                    )
+                    pool.start()
+                    self._pool = pool
+        return self._pool
+
+    def reader(self):
+        """A healthy reader of this shard, or its writer when pinned or none is."""
+        pool = self.pool
+        alias = None if is_pinned() or pool is None else pool.choose()
+        alias = alias or self.writer
+        if pool is not None:
+            pool.metrics.reads.increment(labels={"alias": alias})
+        return alias
+
+    def __repr__(self):
+        return f"Shard({self.index}, writer={self.writer!r})"
+
+
+class ShardMap:
+    """
+    Users are spread over shards by a stable hash of the lowercased email
+    into `slots` slots, with contiguous slot ranges per shard.
+
+    - Every user's id encodes its slot: local sequence * slots + slot, so
+      the row is found from either its id or its email with no lookup. Ids
+      are encoded with a single shard too, so shards can be added later.
+    - Ids issued before the encoding (up to the legacy_max_id migration
+      0005 recorded) carry no slot. A sharded map refuses to load while
+      any are left; `manage.py encode_user_ids` re-keys them first.
+    - The slot count cannot change once ids are issued. Adding shards moves
+      slot ranges, and their rows have to be copied over first.
+    - Usernames are unique per shard by index only; across shards it is
+      the registration check (api.utils.username_exists) that keeps them
+      apart, so two concurrent sign-ups on different shards can both win.
+    """
+
+    instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, shards, slots):
+        self.shards = list(shards)
+        self.slots = slots
+
+    @classmethod
+    def get(cls):
+        if ShardMap.instance is None:
+            with ShardMap._instance_lock:
+                if ShardMap.instance is None:
+                    ShardMap.instance = cls.from_settings()
+        return ShardMap.instance
+
+    @classmethod
+    def from_settings(cls):
+        shards = [
+            Shard(index, config["writer"], config["readers"], shared_pool=index == 0)
+            for index, config in enumerate(settings.USER_SHARDS)
+        ]
+        shard_map = cls(shards, settings.USER_SHARD_SLOTS)
+        if shard_map.sharded:
+            shard_map.check_legacy_ids()
+        return shard_map
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.shards) > 1
+
+    @property
+    def stride(self) -> int:
+        """What ids are multiplied by to make room for the slot."""
+        return self.slots
+
+    @property
+    def writers(self):
+        return [shard.writer for shard in self.shards]
+
+    # ---------------------
+    # Locating users
+    # ---------------------
+
+    def slot_for_email(self, email) -> int:
+        digest = hashlib.blake2b(email.lower().encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.stride
+
+    def for_slot(self, slot) -> Shard:
+        return self.shards[slot * len(self.shards) // self.stride]
+
+    def for_email(self, email) -> Shard:
+        return self.for_slot(self.slot_for_email(email))
+
+    def for_id(self, user_id) -> Shard:
+        return self.for_slot(int(user_id) % self.stride)
+
+    def for_user(self, user) -> Shard:
+        if user.pk is not None:
+            return self.for_id(user.pk)
+        return self.for_email(user.email)
+
+    # ---------------------
+    # Id allocation
+    # ---------------------
+
+    def allocate_id(self, email, table):
+        """An id, carrying the slot of `email`, on the shard it hashes to."""
+        slot = self.slot_for_email(email)
+        local = self.next_local_id(self.for_slot(slot).writer, table)
+        return local * self.stride + slot
+
+    def next_local_id(self, alias, table):
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [table]
+                )
+                return cursor.fetchone()[0]
+            # no sequence to draw from (local SQLite shards): one past the highest
+            cursor.execute(
+                f"SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)}"
+            )
+            return cursor.fetchone()[0] // self.stride + 1
+
+    # ---------------------
+    # Ids from before the slot encoding
+    # ---------------------
+
+    def legacy_max_id(self) -> int:
+        """Highest plain (unencoded) id, as recorded on shard 0 by migration 0005."""
+        with connections[self.shards[0].writer].cursor() as cursor:
+            cursor.execute(f"SELECT legacy_max_id FROM {USER_ID_SCHEME_TABLE}")
+            row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def legacy_ids(self, table, limit=None):
+        """Plain ids still on shard 0, lowest first."""
+        alias = self.shards[0].writer
+        quoted = connections[alias].ops.quote_name(table)
+        sql = f"SELECT id FROM {quoted} WHERE id <= %s ORDER BY id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql, [self.legacy_max_id()])
+            return [row[0] for row in cursor.fetchall()]
+
+    def check_legacy_ids(self, table="api_customuser"):
+        """
+        Plain ids would be routed by `id % slots` to an arbitrary shard, so
+        do not start sharded until they are re-keyed.
+        """
+        if self.legacy_ids(table, limit=1):
+            raise ImproperlyConfigured(
+                "Users with ids from before slot encoding are still on shard 0. "
+                "Run `manage.py encode_user_ids` with a single shard before "
+                "setting EXTRA_USER_SHARDS."
+            )
@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import CustomUser
+from .auth_cache import AuthRecordCache
+from .bloom import RegisteredNames
+from .read_your_writes import ReadYourWrites
+from .user_status import UserStatusCache
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_status(sender, instance, **kwargs):
+    """
+    Drop the cached status record once a change to the user row commits on
+    its shard; before that a refresh could cache the pre-commit row again.
+    """
+    user_id = instance.pk
+    transaction.on_commit(
+        lambda: UserStatusCache().invalidate(user_id), using=kwargs["using"]
+    )
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_auth_record(sender, instance, **kwargs):
+    """
+    Drop the cached auth record everywhere once the change is committed on
+    the user's shard; before that a reader could cache the pre-commit row
+    again.
+    """
+    user_id, email = instance.pk, instance.email
+    transaction.on_commit(
+        lambda: AuthRecordCache.get().invalidate(user_id, emails=[email]),
+        using=kwargs["using"],
+    )
+
+
+@receiver(post_save, sender=CustomUser)
+def add_registered_names(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Put new emails/usernames in the registration filters. Done before the
+    commit: a rollback leaves a harmless false positive, while adding late
+    would let a concurrent check skip the database for a taken name.
+    """
+    if created or update_fields is None or {"email", "username"} & update_fields:
+        RegisteredNames.get().add(email=instance.email, username=instance.username)
+
+
+@receiver(post_save, sender=CustomUser)
+def stick_reads_to_primary(sender, instance, **kwargs):
+    """Serve this user's next reads from the primary until replicas catch up."""
+    ReadYourWrites().mark(instance)
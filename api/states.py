@@ -15,6 +15,7 @@ from .validators import (
     UsernameValidator,
     UserRegistrationValidator,
     PasswordResetValidator,
+    LoginCredentialsValidator,
     TokenRefreshValidator,
     RefreshTokenValidator,
     AccessTokenValidator,
@@ -23,8 +24,7 @@ from .validators import (
 )
 from .utils import hash_token
 
-# Import RefreshToken if it's defined elsewhere in your project
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import BufferedRefreshToken
 from .tracers import trace
 
 
@@ -181,7 +181,7 @@ class LoginFactory(ServiceStateFactory):
     def configure(self):
         return (
             EmailExistsState()
-            .then_handle(PasswordState())
+            .then_handle(LoginPasswordState())
             .then_handle(CompleteLoginState())
         )
 
@@ -243,7 +243,7 @@ class AccessOutput(Output):
 
 class RefreshTokenOutput(Output):
     def output(self, value):
-        return RefreshToken(value).payload
+        return BufferedRefreshToken(value).payload
 
 
 # ------------------------------------------------------------------
@@ -340,6 +340,13 @@ class PasswordState(PasswordSensitiveState):
     name = "Password"
 
 
+class LoginPasswordState(PasswordSensitiveState):
+    # Kept as given: it is verified against the stored hash at completion.
+    validator = PasswordValidator()
+    name = "Password"
+    getter_class = DefaultOutput
+
+
 class EmailState(NonSensitiveState):
     validator = EmailValidator()
     name = "Email"
@@ -363,6 +370,7 @@ class RefreshState(TokenState):
 
 class AccessState(TokenState):
     validator = AccessTokenValidator()
+    getter_class = AccessOutput
     name = "access"
 
 
@@ -388,7 +396,7 @@ class CompletePasswordResetState(CompleteState):
 
 class CompleteLoginState(CompleteState):
     name = "CompleteLogin"
-    validator = DefaultStateValidator()  # Added to make concrete
+    validator = LoginCredentialsValidator()
 
 
 class CompleteTokenState(CompleteState):
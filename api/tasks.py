@@ -1,10 +1,63 @@
+from itertools import chain
+
 from celery import shared_task
-from .metrics import MetricsFactory  # import your factory
+from .bloom import RegisteredNames
+from .metrics import GeneralMetricsView
+from .models import CustomUser
+from .replication import replicate_to_peers
+from .sharding import ShardMap
+from .token_audit import TokenAuditBuffer, TokenAuditPartitions
 
 
 @shared_task
 def push_metrics():
     """Push metrics to Prometheus PushGateway periodically."""
-    factory = MetricsFactory()
-    provider = factory.provider
+    # Push the shared registry the metric objects were created on; a fresh
+    # MetricsFactory here would push an empty one.
+    provider = GeneralMetricsView.factory.provider
     provider.push()
+
+
+@shared_task
+def flush_token_audit():
+    """Persist buffered IssuedToken/RevokedToken rows in batches."""
+    return TokenAuditBuffer().flush()
+
+
+@shared_task
+def maintain_token_audit_partitions():
+    """Create the coming days' audit partitions and drop expired ones."""
+    return TokenAuditPartitions().maintain()
+
+
+@shared_task
+def upgrade_password_hash(user_id, old_encoded, new_encoded):
+    """
+    Store a rehashed password unless the password changed since the login.
+    Nothing cached holds the hash (see utils.get_password_hash), so the
+    update() needs no invalidation.
+    """
+    writer = ShardMap.get().for_id(user_id).writer
+    return (
+        CustomUser.objects.using(writer)
+        .filter(pk=user_id, password=old_encoded)
+        .update(password=new_encoded)
+    )
+
+
+@shared_task
+def replicate_tokens():
+    """Ship pending token revocations to every peer region."""
+    return replicate_to_peers()
+
+
+@shared_task
+def rebuild_registration_filters():
+    """Rewrite the email/username Bloom filters from the users table."""
+    rows = chain.from_iterable(
+        CustomUser.objects.using(shard.reader())
+        .values_list("email", "username")
+        .iterator(chunk_size=10_000)
+        for shard in ShardMap.get().shards
+    )
+    RegisteredNames.get().rebuild(rows)
@@ -0,0 +1,125 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from rest_framework.response import Response
+
+from api.admission import AdaptiveLimiter, AdmissionControl, admission_controlled
+
+
+def make_limiter(**overrides):
+    config = {
+        "target_latency": 0.1,
+        "initial_limit": 2,
+        "min_limit": 1,
+        "max_limit": 4,
+        "max_queue": 0,
+        "queue_timeout": 0.01,
+        "metrics": MagicMock(),
+    }
+    config.update(overrides)
+    return AdaptiveLimiter("hashing", **config)
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_sheds_beyond_limit_when_queue_is_full(self):
+        limiter = make_limiter()
+
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+        limiter.metrics.shed.increment.assert_called_once_with(
+            labels={"endpoint_class": "hashing"}
+        )
+
+    def test_queued_request_sheds_after_timeout(self):
+        limiter = make_limiter(initial_limit=1, max_queue=1)
+        limiter.acquire()
+
+        self.assertFalse(limiter.acquire())
+        self.assertEqual(limiter.queued, 0)
+
+    def test_queued_request_admitted_when_slot_frees(self):
+        limiter = make_limiter(initial_limit=1, max_queue=1, queue_timeout=2)
+        limiter.acquire()
+        admitted = []
+        waiter = threading.Thread(target=lambda: admitted.append(limiter.acquire()))
+        waiter.start()
+        while not limiter.queued:
+            pass
+
+        limiter.release(0.01)
+        waiter.join()
+
+        self.assertEqual(admitted, [True])
+        self.assertEqual(limiter.in_flight, 1)
+
+    def test_fast_responses_grow_limit_additively(self):
+        limiter = make_limiter()
+        for _ in range(2):
+            limiter.acquire()
+            limiter.release(0.01)
+
+        self.assertAlmostEqual(limiter.limit, 2 + 1 / 2 + 1 / 2.5)
+
+    def test_slow_response_shrinks_limit_once_per_window(self):
+        limiter = make_limiter(initial_limit=4, target_latency=60)
+        for _ in range(3):
+            limiter.acquire()
+        for _ in range(3):
+            limiter.release(61)
+
+        self.assertAlmostEqual(limiter.limit, 4 * 0.9)
+
+    def test_limit_stays_within_bounds(self):
+        limiter = make_limiter(initial_limit=1, target_latency=0)
+        limiter.acquire()
+        limiter.release(1)
+        self.assertEqual(limiter.limit, 1)
+
+        limiter.limit = 4
+        limiter.acquire()
+        limiter.release(0)
+        self.assertEqual(limiter.limit, 4)
+
+
+class MockView:
+    admission_class = "hashing"
+
+    @admission_controlled
+    def post(self, request):
+        return Response({"ok": True})
+
+
+class TestAdmissionControlled(unittest.TestCase):
+
+    def test_overflow_is_503_without_running_view(self):
+        limiter = make_limiter()
+        limiter.in_flight = 2
+
+        with patch.object(AdmissionControl, "get", return_value=limiter):
+            response = MockView().post(MagicMock())
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+    def test_admitted_request_releases_slot(self):
+        limiter = make_limiter()
+
+        with patch.object(AdmissionControl, "get", return_value=limiter):
+            response = MockView().post(MagicMock())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_wrapped_view_keeps_its_name(self):
+        self.assertEqual(MockView.post.__name__, "post")
+
+    def test_unconfigured_class_is_not_limited(self):
+        self.assertIsNone(AdmissionControl.get(None))
+        self.assertIsNone(AdmissionControl.get("not-configured"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,226 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from redis.exceptions import ConnectionError
+
+from api.auth_cache import MISS, AuthRecordCache, LocalTTLCache
+from api.signals import invalidate_auth_record
+
+ROW = [7, "a@b.com", True, 0]
+
+
+class MockRedisCache:
+    """Strings only, plus the two cache scripts run the way the Lua does."""
+
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+        self.published = []
+
+    def mget(self, *keys):
+        return [self.get(key) for key in keys]
+
+    def get(self, key):
+        value = self.values.get(key)
+        return value.encode() if isinstance(value, str) else value
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = str(value)
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+            self.sets.pop(key, None)
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def run_script(self, conn, name, keys=(), args=()):
+        if name == "cache_set_if_version":
+            if self.values.get(keys[0], "0") != args[0]:
+                return 0
+            self.values[keys[1]] = args[2]
+            if len(keys) > 2:
+                self.sets.setdefault(keys[2], set()).add(args[3])
+            return 1
+        emails = sorted(self.sets.get(keys[0], set())) + list(args[2:])
+        self._incr(keys[2])
+        self.delete(keys[0], keys[1])
+        for email in emails:
+            self._incr(f"{args[0]}:ver:email:{email}")
+            self.delete(f"{args[0]}:email:{email}")
+        return [email.encode() for email in emails]
+
+    def _incr(self, key):
+        self.values[key] = str(int(self.values.get(key, "0")) + 1)
+
+
+class TestLocalTTLCache(unittest.TestCase):
+
+    def test_entries_expire(self):
+        cache = LocalTTLCache(max_entries=10, ttl=5)
+        cache.set("k", 1, now=0)
+
+        self.assertEqual(cache.get("k", now=4), 1)
+        self.assertIs(cache.get("k", now=5), MISS)
+
+    def test_least_recently_used_evicted(self):
+        cache = LocalTTLCache(max_entries=2, ttl=5)
+        cache.set("a", 1, now=0)
+        cache.set("b", 2, now=0)
+        cache.get("a", now=0)
+        cache.set("c", 3, now=0)
+
+        self.assertIs(cache.get("b", now=0), MISS)
+        self.assertEqual(cache.get("a", now=0), 1)
+
+
+class TestAuthRecordCache(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = MockRedisCache()
+        patcher = patch("api.auth_cache.RedisScripts.run", self.redis.run_script)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.metrics = MagicMock()
+        self.cache = self.make_cache()
+        self.load = MagicMock(return_value=tuple(ROW))
+
+    def make_cache(self):
+        return AuthRecordCache(
+            redis_conn=self.redis,
+            local=LocalTTLCache(max_entries=100, ttl=5),
+            ttl=300,
+            lock_wait=0.05,
+            beta=0,
+            metrics=self.metrics,
+        )
+
+    def tiers(self):
+        return [
+            (c.kwargs["labels"]["tier"], c.kwargs["labels"]["result"])
+            for c in self.metrics.lookups.increment.call_args_list
+        ]
+
+    def test_read_through_fills_both_tiers(self):
+        self.assertEqual(self.cache.by_email("A@B.com", self.load), ROW)
+        self.assertEqual(self.cache.by_email("a@b.com", self.load), ROW)
+        self.assertEqual(self.make_cache().by_email("a@b.com", self.load), ROW)
+
+        self.load.assert_called_once()
+        self.assertEqual(
+            self.tiers(),
+            [
+                ("local", "miss"),
+                ("redis", "miss"),
+                ("local", "hit"),
+                ("local", "miss"),
+                ("redis", "hit"),
+            ],
+        )
+        self.assertNotIn("auth_record:v2:lock:email:a@b.com", self.redis.values)
+
+    def test_unknown_user_is_not_cached(self):
+        self.load.return_value = None
+
+        self.assertIsNone(self.cache.by_id(7, self.load))
+        self.assertIsNone(self.cache.by_id(7, self.load))
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_load_that_raced_an_invalidation_is_not_stored(self):
+        def load():
+            self.cache.invalidate(7, emails=["a@b.com"])
+            return tuple(ROW)
+
+        self.assertEqual(self.cache.by_email("a@b.com", load), ROW)
+        self.assertNotIn("auth_record:v2:email:a@b.com", self.redis.values)
+        self.assertIs(self.cache.local.get("email:a@b.com"), MISS)
+
+    def test_invalidate_drops_old_email_and_publishes(self):
+        self.cache.by_email("old@b.com", self.load)
+        self.cache.by_id(7, self.load)
+
+        self.cache.invalidate(7, emails=["New@B.com"])
+
+        self.assertFalse(
+            {"auth_record:v2:email:old@b.com", "auth_record:v2:id:7"}
+            & set(self.redis.values)
+        )
+        channel, message = self.redis.published[0]
+        self.assertEqual(channel, "auth_record:invalidate")
+        self.assertEqual(
+            json.loads(message), {"id": 7, "emails": ["new@b.com", "old@b.com"]}
+        )
+        self.assertIs(self.cache.local.get("email:old@b.com"), MISS)
+
+    def test_published_invalidation_drops_local_copies(self):
+        other = self.make_cache()
+        other.by_id(7, self.load)
+
+        other.on_message(json.dumps({"id": 7, "emails": []}))
+
+        self.assertIs(other.local.get("id:7"), MISS)
+
+    def test_concurrent_miss_waits_for_the_loader(self):
+        self.redis.values["auth_record:v2:lock:id:7"] = "1"
+        entry = {"row": ROW, "exp": 0, "delta": 0}
+        self.redis.mget = MagicMock(return_value=[None, None])
+        self.redis.get = MagicMock(side_effect=[None, json.dumps(entry).encode()])
+
+        self.assertEqual(self.cache.by_id(7, self.load), ROW)
+        self.load.assert_not_called()
+
+    def test_waiter_falls_back_to_db_when_loader_is_slow(self):
+        self.redis.values["auth_record:v2:lock:id:7"] = "1"
+
+        self.assertEqual(list(self.cache.by_id(7, self.load)), ROW)
+        self.load.assert_called_once()
+
+    def test_entry_near_expiry_refreshed_early(self):
+        self.cache.beta = 1
+        entry = {"row": ROW, "exp": 0, "delta": 0.01}  # already due
+        self.redis.values["auth_record:v2:id:7"] = json.dumps(entry)
+
+        self.cache.by_id(7, self.load)
+
+        self.load.assert_called_once()
+        self.assertIn(("redis", "early_refresh"), self.tiers())
+
+    def test_refresh_in_progress_serves_stale_row(self):
+        entry = {"row": ["stale"], "exp": 0, "delta": 0}
+        self.redis.values["auth_record:v2:id:7"] = json.dumps(entry)
+        self.redis.values["auth_record:v2:lock:id:7"] = "1"
+
+        self.assertEqual(self.cache.by_id(7, self.load), ["stale"])
+        self.load.assert_not_called()
+
+    def test_redis_down_reads_database(self):
+        self.redis.mget = MagicMock(side_effect=ConnectionError("down"))
+
+        self.assertEqual(list(self.cache.by_id(7, self.load)), ROW)
+
+
+@patch("api.signals.AuthRecordCache")
+@patch("api.signals.transaction")
+class TestInvalidateAuthRecordSignal(unittest.TestCase):
+
+    def test_invalidates_after_the_shard_commits(self, mock_transaction, mock_cache):
+        user = MagicMock(pk=7, email="a@b.com")
+        invalidate_auth_record(sender=None, instance=user, using="user_shard_1")
+
+        mock_cache.get.return_value.invalidate.assert_not_called()
+        self.assertEqual(
+            mock_transaction.on_commit.call_args.kwargs, {"using": "user_shard_1"}
+        )
+        mock_transaction.on_commit.call_args.args[0]()
+        mock_cache.get.return_value.invalidate.assert_called_once_with(
+            7, emails=["a@b.com"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
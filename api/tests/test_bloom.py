@@ -0,0 +1,269 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.test.client import RequestFactory
+from redis.exceptions import ConnectionError
+
+from api.bloom import BloomFilter, RegisteredNames, set_bits, has_bits
+from api.views import AvailabilityView
+
+
+class MockRedisBitset:
+    """Binary strings with SETBIT/BITOP/RENAME, through a pipeline."""
+
+    def __init__(self):
+        self.values = {}
+        self.published = []
+
+    def pipeline(self, transaction=True):
+        redis, calls = self, []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args: calls.append((name, args))
+
+            def execute(self):
+                return [getattr(redis, name)(*args) for name, args in calls]
+
+        return Pipeline()
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def mget(self, *keys):
+        return [self.values.get(key) for key in keys]
+
+    def set(self, key, value):
+        self.values[key] = value if isinstance(value, bytes) else str(value).encode()
+
+    def setbit(self, key, offset, value):
+        bits = bytearray(self.values.get(key, b""))
+        if len(bits) <= offset >> 3:
+            bits.extend(bytes((offset >> 3) + 1 - len(bits)))
+        set_bits(bits, [offset])
+        self.values[key] = bytes(bits)
+
+    def bitop(self, op, dest, *keys):
+        values = [self.values.get(key, b"") for key in keys]
+        size = max(len(value) for value in values)
+        merged = bytearray(size)
+        for value in values:
+            for i, byte in enumerate(value):
+                merged[i] |= byte
+        self.values[dest] = bytes(merged)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def rename(self, src, dest):
+        self.values[dest] = self.values.pop(src)
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_sized_for_capacity_and_error_rate(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+
+        self.assertEqual((bloom.size, bloom.hashes), (9586, 7))
+
+    def test_false_positive_rate_near_target(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        bits = bloom.empty()
+        for i in range(1000):
+            set_bits(bits, bloom.positions(f"user{i}@example.com"))
+
+        false_positives = sum(
+            has_bits(bits, bloom.positions(f"other{i}@example.com"))
+            for i in range(10_000)
+        )
+        self.assertLess(false_positives, 200)
+
+
+class TestRegisteredNames(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = MockRedisBitset()
+        self.metrics = MagicMock()
+        self.names = self.make_names()
+        patcher = patch("api.bloom.current_app")
+        self.celery = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_names(self):
+        return RegisteredNames(
+            redis_conn=self.redis,
+            bloom=BloomFilter(capacity=1000, error_rate=0.01),
+            region="eu",
+            sync_interval=60,
+            metrics=self.metrics,
+        )
+
+    def loaded(self, rows=()):
+        self.names.rebuild(rows)
+        self.names.sync()
+        return self.names
+
+    def test_unloaded_filter_always_says_maybe(self):
+        self.assertTrue(self.names.might_contain("email", "a@b.com"))
+        self.metrics.checks.increment.assert_called_once_with(
+            labels={"kind": "email", "result": "unloaded"}
+        )
+
+    def test_rebuilt_filter_answers_from_mirror(self):
+        names = self.loaded([("A@B.com", "Alice")])
+
+        self.assertTrue(names.might_contain("email", "a@b.com"))
+        self.assertTrue(names.might_contain("username", "ALICE"))
+        self.assertFalse(names.might_contain("email", "new@b.com"))
+
+    def test_added_names_reach_redis_and_other_mirrors(self):
+        names = self.loaded()
+        other = self.make_names()
+        other.sync()
+
+        names.add(email="New@B.com", username="newbie")
+
+        self.assertTrue(names.might_contain("email", "new@b.com"))
+        self.assertFalse(other.might_contain("email", "new@b.com"))
+        channel, message = self.redis.published[-1]
+        self.assertEqual(channel, "bloom:eu:added")
+        other.on_message(message)
+        self.assertTrue(other.might_contain("email", "new@b.com"))
+        fresh = self.make_names()
+        fresh.sync()
+        self.assertTrue(fresh.might_contain("username", "newbie"))
+
+    def test_rebuild_keeps_bits_added_meanwhile(self):
+        names = self.loaded()
+        names.add(email="live@b.com")
+
+        self.loaded([("old@b.com", "old")])
+
+        self.assertTrue(names.might_contain("email", "live@b.com"))
+        self.assertTrue(names.might_contain("email", "old@b.com"))
+
+    def test_other_layout_is_not_trusted(self):
+        self.loaded([("a@b.com", "alice")])
+        resized = RegisteredNames(
+            redis_conn=self.redis,
+            bloom=BloomFilter(capacity=5000, error_rate=0.01),
+            region="eu",
+            metrics=self.metrics,
+        )
+
+        resized.sync()
+
+        self.assertFalse(resized.is_loaded("email"))
+        self.assertTrue(resized.might_contain("email", "new@b.com"))
+
+    def test_resync_message_reloads(self):
+        names = self.loaded()
+        self.redis.values.clear()
+
+        names.on_message(json.dumps({"resync": True}))
+
+        self.assertEqual(names.mirrors, {})
+
+    def test_failed_update_stops_trusting_mirror(self):
+        names = self.loaded()
+        self.redis.setbit = MagicMock(side_effect=ConnectionError("down"))
+
+        names.add(email="new@b.com")
+
+        self.assertTrue(names.might_contain("email", "other@b.com"))
+
+    def test_failed_update_makes_every_mirror_fail_open(self):
+        names = self.loaded([("old@b.com", "old")])
+        other = self.make_names()
+        other.sync()
+        setbit = self.redis.setbit
+        self.redis.setbit = MagicMock(side_effect=ConnectionError("down"))
+
+        names.add(email="new@b.com")
+        other.on_message(self.redis.published[-1][1])
+
+        self.assertTrue(other.might_contain("email", "new@b.com"))
+        self.celery.send_task.assert_called_once_with(
+            "api.tasks.rebuild_registration_filters"
+        )
+
+        # the queued rebuild puts the lost name back and lifts the mark
+        self.redis.setbit = setbit
+        names.rebuild([("old@b.com", "old"), ("new@b.com", "new")])
+        other.on_message(self.redis.published[-1][1])
+
+        self.assertTrue(other.might_contain("email", "new@b.com"))
+        self.assertFalse(other.might_contain("email", "never@b.com"))
+
+    def test_failure_during_rebuild_keeps_the_mark(self):
+        names = self.loaded()
+        self.redis.set("bloom:eu:stale", 1)
+
+        def rows():
+            # a failed add while the rebuild reads the table
+            self.redis.set("bloom:eu:stale", 2)
+            yield ("new@b.com", "new")
+
+        names.rebuild(rows())
+        names.sync()
+
+        self.assertEqual(self.redis.get("bloom:eu:stale"), b"2")
+        self.assertTrue(names.might_contain("email", "never@b.com"))
+
+    def test_unsent_mark_is_retried_on_sync(self):
+        names = self.loaded()
+        execute = MagicMock(side_effect=ConnectionError("down"))
+        with patch.object(self.redis, "pipeline") as pipeline:
+            pipeline.return_value.execute = execute
+            names.add(email="new@b.com")
+        self.assertNotIn("bloom:eu:stale", self.redis.values)
+
+        names.sync()
+
+        self.assertIn("bloom:eu:stale", self.redis.values)
+        self.assertTrue(names.might_contain("email", "never@b.com"))
+
+
+class TestAvailabilityView(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch("api.views.RegisteredNames")
+        self.names = patcher.start().get.return_value
+        self.names.kinds = RegisteredNames.kinds
+        self.addCleanup(patcher.stop)
+        patcher = patch("api.views.SlidingWindowThrottle.allow_request")
+        patcher.start().return_value = True
+        self.addCleanup(patcher.stop)
+
+    def get(self, **params):
+        request = RequestFactory().get("/availability/", params)
+        return AvailabilityView.as_view()(request)
+
+    def test_answers_from_filter(self):
+        self.names.is_loaded.return_value = True
+        self.names.might_contain.side_effect = lambda kind, value: kind == "username"
+
+        response = self.get(email="a@b.com", username="alice")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"email": True, "username": False})
+
+    def test_unloaded_filter_is_unknown(self):
+        self.names.is_loaded.return_value = False
+
+        response = self.get(email="a@b.com")
+
+        self.assertEqual(response.data, {"email": None})
+        self.names.might_contain.assert_not_called()
+
+    def test_nothing_to_check_is_rejected(self):
+        self.assertEqual(self.get().status_code, 400)
+        self.assertEqual(self.get(email="x" * 300).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,8 +10,19 @@ from api.builder import (
     BuilderException,
     OAuthUserInfoBuilder,
     ValidationTokenBuilder,
+    TokenMinter,
 )
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from api.serializer import UserSerializer
+from api.sharding import Shard, ShardMap
+from api.user_status import UserStatus
+from api.validators import EMAIL_TAKEN
+from django.db import IntegrityError
+from rest_framework import serializers
+from rest_framework_simplejwt.tokens import AccessToken, TokenError
+from api.tokens import BufferedRefreshToken
+from api.utils import AuthRecord
+from django.conf import settings
+import jwt
 
 
 # A more robust mock serializer that better imitates the real one
@@ -59,6 +70,11 @@ class TestUserPasswordCleaner(unittest.TestCase):
     def setUp(self):
         self.cleaner = UserPasswordCleaner()
 
+    def test_keeps_hash_and_drops_plaintext_repeat(self):
+        data = {"password": "pbkdf2_sha256$hash", "password_repeat": "Plain1234"}
+
+        self.assertEqual(self.cleaner.clean(data), {"password": "pbkdf2_sha256$hash"})
+
 
 class TestModelBuilders(unittest.TestCase):
     """Tests the concrete model builders."""
@@ -80,126 +96,285 @@ class TestModelBuilders(unittest.TestCase):
         # FIX: Use assert_any_call to check if the call with `data` happened at all
         mock_get_serializer.assert_any_call(data=ANY)
 
-    @patch("api.builder.PasswordResetBuilder.get_serializer")
-    @patch("api.builder.get_user_by_email")
-    def test_password_reset_builder_updates_user(
-        self, mock_user_get, mock_get_serializer
+
+@patch("api.builder.ReadYourWrites")
+@patch("api.builder.AuthRecordCache")
+@patch("api.builder.UserStatusCache")
+@patch("api.builder.transaction")
+@patch("api.builder.connections")
+@patch("api.builder.get_auth_record_by_email")
+@patch.object(ShardMap, "instance", ShardMap([Shard(0, "default")], 1024))
+class TestPasswordResetBuilder(unittest.TestCase):
+    """PasswordResetBuilder writes with one UPDATE and invalidates by hand."""
+
+    data = {
+        "email": "Test@example.com",
+        "password": "pbkdf2_sha256$1000000$salt$digest",
+        "password_repeat": "new_password123",
+    }
+
+    def cursor(self, mock_connections, rows):
+        connection = mock_connections.__getitem__.return_value
+        connection.ops.quote_name.side_effect = lambda name: f'"{name}"'
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = rows
+        return cursor
+
+    def test_single_update_bumps_epoch(
+        self, mock_record, mock_connections, mock_tx, mock_status, mock_auth, mock_ryw
+    ):
+        cursor = self.cursor(mock_connections, [(7, "test@example.com", True, 3)])
+
+        result = PasswordResetBuilder().build(dict(self.data))
+
+        self.assertEqual(result, {"id": 7, "email": "test@example.com"})
+        mock_record.assert_not_called()  # nothing is read before the write
+        mock_connections.__getitem__.assert_called_with("default")
+        sql, params = cursor.execute.call_args.args
+        self.assertEqual(
+            sql,
+            'UPDATE "api_customuser" SET password = %s, '
+            "token_epoch = token_epoch + 1 WHERE LOWER(email) = %s "
+            "RETURNING id, email, is_active, token_epoch",
+        )
+        self.assertEqual(params, [self.data["password"], "test@example.com"])
+        mock_ryw.return_value.mark.assert_called_once()
+        self.assertEqual(mock_ryw.return_value.mark.call_args.args[0].pk, 7)
+
+        # both caches are dropped only once the update commits
+        mock_status.return_value.invalidate.assert_not_called()
+        drop_cached = mock_tx.on_commit.call_args.args[0]
+        self.assertEqual(mock_tx.on_commit.call_args.kwargs, {"using": "default"})
+        drop_cached()
+        mock_status.return_value.invalidate.assert_called_once_with(7)
+        mock_auth.get.return_value.invalidate.assert_called_once_with(
+            7, emails=["test@example.com"]
+        )
+
+    def test_no_matching_row_is_an_error(
+        self, mock_record, mock_connections, mock_tx, mock_status, mock_auth, mock_ryw
     ):
-        """PasswordResetBuilder should get an instance, clean data, and update."""
+        self.cursor(mock_connections, [])
 
-        class MockUser:
-            def __init__(self, pk, email):
-                self.pk = pk
-                self.email = email
+        with self.assertRaises(BuilderException):
+            PasswordResetBuilder().build(dict(self.data))
 
-        def get_user_by_email(email):
-            return mock_instance
+        mock_tx.on_commit.assert_not_called()
+        mock_ryw.return_value.mark.assert_not_called()
 
-        mock_instance = MockUser(pk=1, email="test@example.com")
-        mock_user_get.side_effect = get_user_by_email
 
-        mock_serializer_instance = MockSerializer(instance=mock_instance)
-        mock_get_serializer.return_value = mock_serializer_instance
+def integrity_error(constraint_name):
+    """IntegrityError as Django raises it, chained to the driver's error."""
+    error = IntegrityError("duplicate key value violates unique constraint")
+    error.__cause__ = Exception()
+    error.__cause__.diag = MagicMock(constraint_name=constraint_name)
+    return error
 
-        builder = PasswordResetBuilder()
-        data = {
-            "email": "test@example.com",
-            "password": "new_password123",
-            "password_repeat": "new_password123",
-        }
-        builder.build(data)
 
-        mock_user_get.assert_called_once_with(email="test@example.com")
-        # This assertion will now pass because MockSerializer.save() returns the MagicMock instance
-        mock_get_serializer.assert_any_call(instance=mock_instance, data=ANY)
+@patch("api.serializer.transaction", MagicMock())
+@patch.object(ShardMap, "instance", ShardMap([Shard(0, "default")], 1024))
+class TestUserSerializerCreate(unittest.TestCase):
+    """Email uniqueness is left to the database on the create path."""
+
+    data = {"email": "taken@example.com", "password": "pbkdf2_sha256$1$s$h"}
+    # as UserBuilder passes it: the state machine hashed the password
+    context = {"password_hashed": True}
+
+    def test_hashed_password_kept(self):
+        serializer = UserSerializer(data=self.data, context=self.context)
+
+        with patch("api.models.CustomUser.objects"):
+            self.assertTrue(serializer.is_valid())
+
+        self.assertEqual(serializer.validated_data["password"], self.data["password"])
+
+    @patch("api.hashing.HasherService.make_password", return_value="hashed")
+    def test_user_input_always_hashed(self, mock_make_password):
+        serializer = UserSerializer(data=self.data)
+
+        with patch("api.models.CustomUser.objects"):
+            self.assertTrue(serializer.is_valid())
+
+        # even though it looks like an encoded hash
+        mock_make_password.assert_called_once_with(self.data["password"])
+        self.assertEqual(serializer.validated_data["password"], "hashed")
+
+    def test_no_unique_query_before_insert(self):
+        serializer = UserSerializer(data=self.data, context=self.context)
+
+        with patch("api.models.CustomUser.objects") as mock_objects:
+            self.assertTrue(serializer.is_valid())
+
+        mock_objects.filter.assert_not_called()
+
+    @patch("rest_framework.serializers.ModelSerializer.create")
+    def test_duplicate_email_is_a_validation_error(self, mock_create):
+        mock_create.side_effect = integrity_error("customuser_email_lower_uniq")
+        serializer = UserSerializer(data=self.data, context=self.context)
+        serializer.is_valid()
+
+        with self.assertRaises(serializers.ValidationError) as raised:
+            serializer.save()
+
+        self.assertEqual(raised.exception.detail, {"email": [EMAIL_TAKEN]})
+
+    @patch("rest_framework.serializers.ModelSerializer.create")
+    def test_other_integrity_errors_propagate(self, mock_create):
+        mock_create.side_effect = integrity_error("api_customuser_pkey")
+        serializer = UserSerializer(data=self.data, context=self.context)
+        serializer.is_valid()
+
+        with self.assertRaises(IntegrityError):
+            serializer.save()
 
 
 @patch("api.builder.get_redis_connection")
 class TestAPIResponseBuilders(unittest.TestCase):
     """Tests the API response builders (Login, Logout, TokenRefresh)."""
 
-    @patch("api.builder.LoginBuilder.build")
-    @patch("api.builder.blacklist_refresh")
+    @patch("api.builder.UserStatusCache")
+    @patch("api.builder.RefreshTokenStore")
     def test_token_refresh_builder_success(
-        self, mock_blacklist, mock_login_build, mock_redis_conn
+        self, mock_store, mock_status, mock_redis_conn
     ):
-        """TokenRefreshBuilder should blacklist old token and generate new ones."""
+        """TokenRefreshBuilder should rotate the old token and mint new ones."""
 
         # 1️⃣ Mock Redis connection
         mock_redis = MagicMock()
         mock_redis_conn.return_value = mock_redis
 
-        # 2️⃣ Create a fake RefreshToken instance
-        mock_refresh_token = MagicMock(spec=RefreshToken)
-        mock_refresh_token.get.return_value = 1  # user_id
+        # 2️⃣ Old refresh payload and cached user status
+        old = {"user_id": "1", "jti": "old", "exp": 0, "epoch": 0}
+        mock_status.return_value.get.return_value = UserStatus(True, 0)
+        mock_store.return_value.rotate.return_value = True
 
-        # 3️⃣ Mock super().build()
-        mock_login_build.return_value = {
-            "refresh": "new_refresh",
-            "access": "new_access",
-        }
+        # 3️⃣ Run builder
+        builder = TokenRefreshBuilder()
+        result = builder.build({"refresh": old})
+
+        # 4️⃣ Assertions
+        mock_status.return_value.get.assert_called_once_with("1")
+        mock_store.assert_called_once_with(mock_redis)
+        rotated, payload, encoded = mock_store.return_value.rotate.call_args[0]
+        self.assertIs(rotated, old)
+        self.assertEqual(encoded, result["refresh"])
+        self.assertEqual(payload["user_id"], "1")
+        self.assertEqual(AccessToken(result["access"])["user_id"], "1")
+
+    @patch("api.builder.UserStatusCache")
+    @patch("api.builder.RefreshTokenStore")
+    def test_token_refresh_builder_rejects_reused_token(
+        self, mock_store, mock_status, mock_redis_conn
+    ):
+        """A refresh token that was already rotated must not mint new tokens."""
+        mock_status.return_value.get.return_value = UserStatus(True, 0)
+        mock_store.return_value.rotate.return_value = False
+        builder = TokenRefreshBuilder()
+
+        with self.assertRaises(TokenError):
+            builder.build({"refresh": {"user_id": 1, "jti": "old", "exp": 0}})
+
+    @patch("api.builder.UserStatusCache")
+    @patch("api.builder.RefreshTokenStore")
+    def test_token_refresh_builder_rejects_inactive_or_stale_epoch(
+        self, mock_store, mock_status, mock_redis_conn
+    ):
+        """Deactivated users and pre-epoch tokens are refused before rotation."""
+        builder = TokenRefreshBuilder()
+        payload = {"user_id": 1, "jti": "old", "exp": 0, "epoch": 1}
 
-        # 4️⃣ Run builder
+        for status in (UserStatus(False, 0), UserStatus(True, 2)):
+            mock_status.return_value.get.return_value = status
+            with self.assertRaises(TokenError):
+                builder.build({"refresh": payload})
+
+        mock_store.return_value.rotate.assert_not_called()
+
+    @patch("api.builder.UserStatusCache")
+    @patch("api.builder.RefreshTokenStore")
+    def test_token_refresh_builder_rejects_foreign_region(
+        self, mock_store, mock_status, mock_redis_conn
+    ):
+        """A token from another region is never checked against local users."""
+        _, raw, _ = TokenMinter(region="eu").mint_pair(1)
         builder = TokenRefreshBuilder()
-        result = builder.build({"refresh": mock_refresh_token})
 
-        # 5️⃣ Assertions
-        mock_refresh_token.get.assert_called_once_with("user_id")
-        mock_blacklist.assert_called_once_with(mock_redis, mock_refresh_token)
-        mock_login_build.assert_called_once()  # MinimalUser passed internally
-        assert result == {"refresh": "new_refresh", "access": "new_access"}
+        with self.assertRaises(TokenError):
+            builder.build({"refresh": BufferedRefreshToken(raw)})
+
+        mock_status.assert_not_called()
+        mock_store.return_value.rotate.assert_not_called()
 
-    @patch("api.builder.RefreshToken")
-    @patch("api.builder.get_user_by_email")
+    @patch("api.builder.RefreshTokenStore")
+    @patch("api.builder.get_auth_record_by_email")
     def test_login_builder_creates_tokens_and_sets_redis(
-        self, mock_user_get, mock_refresh_token, mock_redis_conn
+        self, mock_user_get, mock_store, mock_redis_conn
     ):
-        """LoginBuilder should generate tokens and store them in Redis."""
+        """LoginBuilder should generate tokens and buffer the refresh token."""
 
-        class MockUser:
-            def __init__(self, pk, email):
-                self.pk = pk
-                self.email = email
+        mock_user_get.return_value = AuthRecord(1, "test@example.com", True, 0)
 
-        def get_user_by_email(email):
-            return mock_instance
+        builder = LoginBuilder()
+        result = builder.build({"email": "test@example.com", "password": "..."})
 
-        mock_instance = MockUser(pk=1, email="test@example.com")
-        mock_user_get.side_effect = get_user_by_email
+        mock_user_get.assert_called_once_with("test@example.com")
+        payload, encoded = mock_store.return_value.issue.call_args[0]
+        self.assertEqual(encoded, result["refresh"])
+        self.assertEqual(payload["user_id"], "1")
+        self.assertEqual(AccessToken(result["access"])["user_id"], "1")
 
-        mock_redis = MagicMock()
-        mock_redis_conn.return_value = mock_redis
 
-        mock_access = MagicMock()
-        mock_access.__str__.return_value = "fake_access_token"
-        mock_access.__getitem__.side_effect = lambda key: (
-            1672531200 if key == "exp" else None
-        )
+class TestTokenMinter(unittest.TestCase):
+    """The lean mint path must stay compatible with SimpleJWT validation."""
+
+    def setUp(self):
+        self.minter = TokenMinter()
+
+    def test_refresh_token_validates_with_simplejwt(self):
+        payload, refresh, _ = self.minter.mint_pair(42, token_epoch=3)
+
+        token = BufferedRefreshToken(refresh)
+
+        self.assertEqual(token.payload, payload)
+        self.assertEqual(token["token_type"], "refresh")
+        self.assertEqual(token["epoch"], 3)
+        self.assertEqual(token["region"], settings.REGION)
+
+    def test_access_token_validates_with_simplejwt_and_pyjwt(self):
+        payload, _, access = self.minter.mint_pair(42)
 
-        mock_refresh = MagicMock()
-        mock_refresh.access_token = mock_access
-        mock_refresh.__str__.return_value = "fake_refresh_token"
-        mock_refresh.__getitem__.side_effect = lambda key: (
-            1672531200 if key == "exp" else None
+        token = AccessToken(access)
+        decoded = jwt.decode(access, settings.SECRET_KEY, algorithms=["HS256"])
+
+        self.assertEqual(token["user_id"], "42")
+        self.assertEqual(decoded["token_type"], "access")
+        self.assertNotEqual(decoded["jti"], payload["jti"])
+        self.assertLess(decoded["exp"], payload["exp"])
+
+    def test_header_segment_is_precomputed(self):
+        self.assertIs(
+            TokenMinter.header_segment("HS256", "k1"),
+            TokenMinter.header_segment("HS256", "k1"),
         )
+        _, refresh, _ = TokenMinter(kid="k1").mint_pair(1)
+        self.assertEqual(jwt.get_unverified_header(refresh)["kid"], "k1")
 
-        mock_refresh_token.for_user.return_value = mock_refresh
+    def test_bad_signature_rejected(self):
+        _, refresh, _ = TokenMinter(signing_key="other-key").mint_pair(1)
 
-        builder = LoginBuilder()
-        builder.build({"email": "test@example.com", "password": "..."})
+        with self.assertRaises(TokenError):
+            BufferedRefreshToken(refresh)
 
-        mock_user_get.assert_called_once_with(email="test@example.com")
-        mock_refresh_token.for_user.assert_called_once_with(mock_instance)
+    def test_unsupported_algorithm(self):
+        with self.assertRaises(BuilderException):
+            TokenMinter(algorithm="RS256")
 
 
 class TestLogoutBuilder(unittest.TestCase):
 
     @patch("api.builder.get_redis_connection")
-    @patch("api.builder.blacklist_access")
-    @patch("api.builder.blacklist_refresh")
-    def test_logout_builder_success(
-        self, mock_blacklist_refresh, mock_blacklist_access, mock_redis_conn
-    ):
+    @patch("api.builder.RefreshTokenStore")
+    def test_logout_builder_success(self, mock_store, mock_redis_conn):
         """LogoutBuilder should blacklist tokens and return success message."""
 
         # Mock Redis connection
@@ -212,8 +387,10 @@ class TestLogoutBuilder(unittest.TestCase):
         result = builder.build(data)
 
         # Assertions
-        mock_blacklist_refresh.assert_called_once_with(mock_redis, "fake_refresh_token")
-        mock_blacklist_access.assert_called_once_with(mock_redis, "fake_refresh_token")
+        mock_store.assert_called_once_with(mock_redis)
+        mock_store.return_value.revoke.assert_called_once_with(
+            "fake_refresh_token", "fake_access_token"
+        )
         assert result == {"detail": "Logout successful. Tokens invalidated."}
 
     def test_logout_builder_missing_tokens(self):
@@ -273,7 +450,7 @@ class TestOAuthUserInfoBuilder(unittest.TestCase):
 
 class TestValidationTokenBuilder(unittest.TestCase):
 
-    @patch("api.builder.RefreshToken")
+    @patch("api.builder.BufferedRefreshToken")
     def test_validation_token_builder_success(self, mock_refresh_token):
         """Should return success if refresh token is valid."""
 
@@ -295,7 +472,7 @@ class TestValidationTokenBuilder(unittest.TestCase):
         with self.assertRaises(BuilderException):
             builder.build({})  # no token
 
-    @patch("api.builder.RefreshToken", side_effect=TokenError("Invalid token"))
+    @patch("api.builder.BufferedRefreshToken", side_effect=TokenError("Invalid token"))
     def test_validation_token_builder_invalid_token(self, mock_refresh_token):
         """Should raise BuilderException if token is invalid."""
 
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import MagicMock, PropertyMock, patch
+
+from django.conf import settings
+
+from api.db_pool import PoolStatsRecorder
+
+
+class TestPoolStatsRecorder(unittest.TestCase):
+
+    @patch("api.db_pool.connections")
+    def test_pool_stats_exported_per_alias(self, mock_connections):
+        pool = MagicMock()
+        pool.get_stats.return_value = {
+            "pool_size": 4,
+            "pool_available": 1,
+            "pool_max": 10,
+            "requests_wait_ms": 1500,
+            "requests_errors": 2,
+        }
+        mock_connections.__iter__.return_value = iter(["default"])
+        mock_connections.__getitem__.return_value = MagicMock(
+            _connection_pools={"default": pool}
+        )
+        metrics = MagicMock()
+
+        PoolStatsRecorder(metrics).record()
+
+        metrics.connections.set.assert_any_call(
+            1, labels={"alias": "default", "state": "available"}
+        )
+        metrics.waiting.set.assert_called_once_with(0, labels={"alias": "default"})
+        metrics.wait_seconds.set.assert_called_once_with(
+            1.5, labels={"alias": "default"}
+        )
+        metrics.checkout_errors.set.assert_called_once_with(
+            2, labels={"alias": "default"}
+        )
+
+    @patch("api.db_pool.connections")
+    def test_aliases_without_open_pool_skipped(self, mock_connections):
+        wrapper = MagicMock(_connection_pools={})
+        type(wrapper).pool = opener = PropertyMock()
+        mock_connections.__iter__.return_value = iter(["default"])
+        mock_connections.__getitem__.return_value = wrapper
+        metrics = MagicMock()
+
+        PoolStatsRecorder(metrics).record()
+
+        # reading the stats must not open the alias' pool
+        opener.assert_not_called()
+        metrics.connections.set.assert_not_called()
+
+    def test_every_alias_pools_with_prepared_statements(self):
+        for alias, config in settings.DATABASES.items():
+            self.assertEqual(config.get("CONN_MAX_AGE", 0), 0, alias)
+            self.assertTrue(config["OPTIONS"]["pool"], alias)
+            self.assertTrue(config["OPTIONS"]["server_side_binding"], alias)
+
+
+if __name__ == "__main__":
+    unittest.main()
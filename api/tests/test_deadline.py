@@ -0,0 +1,203 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.db import DatabaseError
+from django.test.client import RequestFactory
+from redis.connection import Connection
+
+from api.deadline import (
+    DEADLINE_HEADER,
+    Deadline,
+    DeadlineConnection,
+    DeadlineConnectionPool,
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    StatementTimeout,
+)
+from api.region_proxy import HomeRegionProxy
+from api.services import AuthService
+
+
+class DeadlineTestCase(unittest.TestCase):
+
+    def start(self, seconds):
+        token = Deadline.start(seconds)
+        self.addCleanup(Deadline.reset, token)
+
+
+class TestDeadline(DeadlineTestCase):
+
+    def test_no_deadline_outside_requests(self):
+        self.assertIsNone(Deadline.remaining())
+        self.assertEqual(Deadline.timeout(5), 5)
+        Deadline.check()
+
+    def test_timeout_is_capped_by_budget(self):
+        self.start(1)
+
+        self.assertLessEqual(Deadline.timeout(5), 1)
+        self.assertEqual(Deadline.timeout(0.5), 0.5)
+        self.assertEqual(Deadline.timeout((0.5, 5))[0], 0.5)
+        self.assertLessEqual(Deadline.timeout((0.5, 5))[1], 1)
+
+    def test_spent_budget_raises(self):
+        self.start(0)
+
+        with self.assertRaises(DeadlineExceeded):
+            Deadline.check()
+        with self.assertRaises(DeadlineExceeded):
+            Deadline.timeout(5)
+
+
+@patch("api.deadline.settings.REQUEST_DEADLINE", 10)
+@patch("api.deadline.settings.REQUEST_DEADLINE_MAX", 30)
+class TestDeadlineMiddleware(unittest.TestCase):
+
+    def budget(self, **headers):
+        request = RequestFactory().post("/login/", headers=headers)
+        return DeadlineMiddleware(MagicMock()).get_budget(request)
+
+    def test_budget_from_header_or_setting(self):
+        self.assertEqual(self.budget(), 10)
+        self.assertEqual(self.budget(**{DEADLINE_HEADER: "250"}), 0.25)
+        self.assertEqual(self.budget(**{DEADLINE_HEADER: "junk"}), 10)
+        self.assertEqual(self.budget(**{DEADLINE_HEADER: "600000"}), 30)
+
+    def test_deadline_is_set_during_request_only(self):
+        seen = []
+        middleware = DeadlineMiddleware(
+            lambda request: seen.append(Deadline.remaining()) or MagicMock()
+        )
+
+        middleware(RequestFactory().get("/"))
+
+        self.assertTrue(0 < seen[0] <= 10)
+        self.assertIsNone(Deadline.remaining())
+
+    @patch("api.deadline.StatementTimeout.reset")
+    def test_failed_timeout_reset_is_logged(self, mock_reset):
+        mock_reset.side_effect = DatabaseError("gone")
+
+        with self.assertLogs("api.deadline", "WARNING") as logs:
+            DeadlineMiddleware(MagicMock())(RequestFactory().get("/"))
+
+        self.assertIn("could not reset statement_timeout", logs.output[0])
+
+    def test_plain_view_exception_is_504(self):
+        response = DeadlineMiddleware(MagicMock()).process_exception(
+            MagicMock(), DeadlineExceeded()
+        )
+
+        self.assertEqual(response.status_code, 504)
+
+
+class TestStatementTimeout(DeadlineTestCase):
+
+    def run_query(self, wrapper, connection):
+        cursor = MagicMock()
+        execute = MagicMock(return_value="rows")
+        context = {"connection": connection, "cursor": cursor}
+        self.assertEqual(wrapper(execute, "SELECT 1", None, False, context), "rows")
+        return cursor.cursor.execute
+
+    def test_sets_timeout_once_while_within_slack(self):
+        self.start(2)
+        wrapper = StatementTimeout(slack_ms=1000)
+        connection = MagicMock(
+            vendor="postgresql", alias="default", in_atomic_block=False
+        )
+
+        first = self.run_query(wrapper, connection)
+        second = self.run_query(wrapper, connection)
+
+        self.assertIn("SET statement_timeout", first.call_args[0][0])
+        second.assert_not_called()
+
+    def test_resent_after_reconnect(self):
+        self.start(2)
+        wrapper = StatementTimeout(slack_ms=1000)
+        connection = MagicMock(
+            vendor="postgresql", alias="default", in_atomic_block=False
+        )
+        self.run_query(wrapper, connection)
+        connection.connection = MagicMock()
+
+        self.run_query(wrapper, connection).assert_called_once()
+
+    def test_transaction_sets_local_timeout_uncached(self):
+        self.start(2)
+        wrapper = StatementTimeout(slack_ms=1000)
+        connection = MagicMock(vendor="postgresql", alias="default")
+
+        connection.in_atomic_block = True
+        first = self.run_query(wrapper, connection)
+        # a rollback would undo it, so nothing is remembered
+        second = self.run_query(wrapper, connection)
+        connection.in_atomic_block = False
+        autocommit = self.run_query(wrapper, connection)
+
+        self.assertIn("SET LOCAL statement_timeout", first.call_args[0][0])
+        self.assertIn("SET LOCAL statement_timeout", second.call_args[0][0])
+        self.assertIn("SET statement_timeout", autocommit.call_args[0][0])
+
+    def test_untouched_without_deadline_or_postgres(self):
+        wrapper = StatementTimeout(slack_ms=0)
+        postgres = MagicMock(
+            vendor="postgresql", alias="default", in_atomic_block=False
+        )
+        self.run_query(wrapper, postgres).assert_not_called()
+
+        self.start(2)
+        sqlite = MagicMock(vendor="sqlite", alias="default")
+        self.run_query(wrapper, sqlite).assert_not_called()
+
+
+class TestDeadlineConnection(DeadlineTestCase):
+
+    def test_pool_hands_out_deadline_connections(self):
+        pool = DeadlineConnectionPool.from_url("redis://localhost:6379/1")
+
+        self.assertIs(pool.connection_class, DeadlineConnection)
+
+    @patch.object(Connection, "read_response")
+    def test_read_timeout_capped_by_budget(self, mock_read):
+        self.start(0.5)
+        connection = DeadlineConnection(socket_timeout=2)
+
+        connection.read_response()
+
+        self.assertLessEqual(mock_read.call_args.kwargs["timeout"], 0.5)
+
+    @patch.object(Connection, "send_packed_command")
+    def test_no_command_sent_after_deadline(self, mock_send):
+        self.start(0)
+
+        with self.assertRaises(DeadlineExceeded):
+            DeadlineConnection().send_packed_command(b"PING")
+        mock_send.assert_not_called()
+
+
+class TestDeadlinePropagation(DeadlineTestCase):
+
+    @patch.object(HomeRegionProxy, "session")
+    def test_proxy_forwards_remaining_budget(self, mock_session):
+        self.start(1)
+        proxy = HomeRegionProxy(endpoints={"eu": "http://eu.local/"}, timeout=(1, 2))
+
+        proxy.refresh("eu", "tok")
+
+        kwargs = mock_session.return_value.post.call_args.kwargs
+        self.assertLessEqual(int(kwargs["headers"][DEADLINE_HEADER]), 1000)
+        self.assertLessEqual(kwargs["timeout"][1], 1)
+
+    def test_state_machine_does_not_swallow_deadline(self):
+        state = MagicMock()
+        state.handle.side_effect = DeadlineExceeded()
+        self.start(5)
+
+        with self.assertRaises(DeadlineExceeded):
+            AuthService().execute({"email": "a@b.com"}, MagicMock(), state)
+
+
+if __name__ == "__main__":
+    unittest.main()
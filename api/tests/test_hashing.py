@@ -0,0 +1,150 @@
+import asyncio
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from django.test.utils import override_settings
+
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher,
+    check_password,
+    make_password,
+)
+
+from api.hashing import (
+    HasherBusy,
+    HasherService,
+    HashingPool,
+    password_for_storage,
+)
+from api.sharding import Shard, ShardMap
+from api.tasks import upgrade_password_hash
+
+FAST_HASHERS = [
+    "django.contrib.auth.hashers.MD5PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+]
+
+
+class PendingExecutor:
+    """Accepts jobs but never runs them, so slots stay taken."""
+
+    def submit(self, fn, *args):
+        return Future()
+
+
+class TestHasherService(unittest.TestCase):
+
+    def setUp(self):
+        self.fast_hashers = override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+        self.fast_hashers.enable()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.metrics = MagicMock()
+        self.pool = HashingPool(self.executor, 4, 1, self.metrics)
+        self.service = HasherService(self.pool)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.fast_hashers.disable()
+
+    def test_make_and_check_password(self):
+        encoded = self.service.make_password("GoodPass1")
+
+        self.assertTrue(encoded.startswith("md5$"))
+        self.assertTrue(self.service.check_password("GoodPass1", encoded))
+        self.assertFalse(self.service.check_password("WrongPass1", encoded))
+
+    def test_async_interface(self):
+        async def run():
+            encoded = await self.service.amake_password("GoodPass1")
+            return await self.service.acheck_password("GoodPass1", encoded)
+
+        self.assertTrue(asyncio.run(run()))
+
+    def test_queue_depth_returns_to_zero(self):
+        self.service.make_password("GoodPass1")
+
+        self.assertEqual(self.pool.pending, 0)
+        self.metrics.queue_depth.set.assert_called_with(0)
+
+    def test_password_for_storage(self):
+        with patch.object(HasherService, "pool", self.pool):
+            encoded = password_for_storage("GoodPass1")
+            self.assertEqual(password_for_storage(encoded, hashed=True), encoded)
+            # user input that merely looks like a hash is still hashed
+            self.assertNotEqual(password_for_storage(encoded), encoded)
+        self.assertTrue(check_password("GoodPass1", encoded))
+
+    def test_needs_upgrade(self):
+        current = make_password("GoodPass1")
+        outdated = PBKDF2PasswordHasher().encode("GoodPass1", "somesalt", 1)
+
+        self.assertFalse(self.service.needs_upgrade(current))
+        self.assertTrue(self.service.needs_upgrade(outdated))
+        self.assertFalse(self.service.needs_upgrade("!unusable"))
+
+    def test_rehash_later_hands_over_new_hash(self):
+        stored = []
+
+        self.service.rehash_later("GoodPass1", stored.append).result()
+
+        self.assertTrue(stored[0].startswith("md5$"))
+
+    def test_rehash_later_skipped_when_busy(self):
+        service = HasherService(HashingPool(PendingExecutor(), 1, 5, MagicMock()))
+        service.pool.submit(print)
+
+        self.assertIsNone(service.rehash_later("GoodPass1", print))  # no 5s wait
+
+    @patch.object(HasherService, "pool", None)
+    @patch("api.hashing.ProcessPoolExecutor")
+    def test_workers_are_not_forked_from_threaded_process(self, mock_executor):
+        HasherService.get_pool()
+
+        context = mock_executor.call_args.kwargs["mp_context"]
+        self.assertEqual(context.get_start_method(), "forkserver")
+
+
+class TestUpgradePasswordHashTask(unittest.TestCase):
+
+    @patch.object(ShardMap, "instance", ShardMap([Shard(0, "default")], 1024))
+    @patch("api.tasks.CustomUser")
+    def test_update_is_conditional_on_old_hash(self, mock_user):
+        users = mock_user.objects.using.return_value
+        users.filter.return_value.update.return_value = 1
+
+        self.assertEqual(upgrade_password_hash(7, "old$hash", "new$hash"), 1)
+
+        mock_user.objects.using.assert_called_once_with("default")
+        users.filter.assert_called_once_with(pk=7, password="old$hash")
+        users.filter.return_value.update.assert_called_once_with(password="new$hash")
+
+
+class TestHashingPool(unittest.TestCase):
+
+    def test_full_pool_refuses_new_jobs(self):
+        metrics = MagicMock()
+        pool = HashingPool(PendingExecutor(), 1, 0, metrics)
+
+        pool.submit(print)
+        with self.assertRaises(HasherBusy):
+            pool.submit(print)
+
+        self.assertEqual(pool.pending, 1)
+        metrics.rejected.increment.assert_called_once()
+
+    def test_slot_released_when_submit_fails(self):
+        executor = MagicMock()
+        executor.submit.side_effect = RuntimeError("pool is shut down")
+        pool = HashingPool(executor, 1, 0, MagicMock())
+
+        with self.assertRaises(RuntimeError):
+            pool.submit(print)
+        with self.assertRaises(RuntimeError):
+            pool.submit(print)  # not HasherBusy: the slot came back
+
+        self.assertEqual(pool.pending, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
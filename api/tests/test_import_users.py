@@ -0,0 +1,163 @@
+import json
+import os
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from api.sharding import Shard, ShardMap
+from api.management.commands.import_users import (
+    Command,
+    load_checkpoint,
+    read_records,
+    save_checkpoint,
+    validate_chunk,
+)
+
+HASHED = "pbkdf2_sha256$1000000$salt$digest"
+
+
+def record(email="a@b.com", username="alice", password="GoodPass1"):
+    return {"email": email, "username": username, "password": password}
+
+
+class FakePool:
+    """In-process stand-in for the hashing ProcessPoolExecutor."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, items, chunksize=1):
+        return [f"hashed:{item}" for item in items]
+
+
+class TestImportUsers(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.dir.name, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_reads_csv_and_jsonl(self):
+        csv_path = self.write("u.csv", "email,username,password\na@b.com,alice,x\n")
+        jsonl_path = self.write("u.jsonl", json.dumps(record()) + "\n\nnot json\n")
+
+        self.assertEqual(
+            list(read_records(csv_path, "csv")),
+            [(1, {"email": "a@b.com", "username": "alice", "password": "x"})],
+        )
+        self.assertEqual(
+            list(read_records(jsonl_path, "jsonl")), [(1, record()), (2, None)]
+        )
+
+    def test_validate_chunk_rejects_without_queries(self):
+        records = [
+            (1, record()),
+            (2, record(email="A@B.com", username="other")),
+            (3, record(email="bad", username="bob")),
+            (4, record(email="c@d.com", username="carol", password="weak")),
+            (5, None),
+            (6, record(email="e@f.com", username="eve", password=HASHED)),
+        ]
+
+        with patch("api.utils.CustomUser") as mock_user:
+            rows, rejects = validate_chunk(records)
+
+        mock_user.objects.filter.assert_not_called()
+        self.assertEqual([row["number"] for row in rows], [1, 6])
+        self.assertEqual([row["needs_hash"] for row in rows], [True, False])
+        self.assertEqual(
+            [r["reason"] for r in rejects],
+            [
+                "Email appears twice in this import.",
+                "Invalid email address.",
+                "Password must be at least 8 characters.",
+                "Unreadable record.",
+            ],
+        )
+
+    def test_hashed_mode_rejects_plaintext(self):
+        rows, rejects = validate_chunk([(1, record())], passwords="hashed")
+
+        self.assertEqual(rows, [])
+        self.assertEqual(
+            rejects[0]["reason"], "Password hash is not in a configured format."
+        )
+
+    def test_checkpoint_only_applies_to_its_source(self):
+        path = os.path.join(self.dir.name, "cp")
+        save_checkpoint(
+            path, {"source": "/a", "done": 10, "inserted": 9, "rejected": 1}
+        )
+
+        self.assertEqual(load_checkpoint(path, "/a")["done"], 10)
+        self.assertEqual(load_checkpoint(path, "/b")["done"], 0)
+
+    @patch("api.management.commands.import_users.ProcessPoolExecutor", FakePool)
+    @patch.object(ShardMap, "instance", ShardMap([Shard(0, "default")], 1024))
+    @patch("api.management.commands.import_users.connections")
+    @patch.object(Command, "_ingest")
+    def test_resumes_from_checkpoint_and_reports_conflicts(
+        self, mock_ingest, mock_connections
+    ):
+        mock_connections.__getitem__.return_value = MagicMock(vendor="postgresql")
+        mock_ingest.side_effect = lambda alias, rows: [
+            (row["email"], row["username"]) for row in rows[:1]
+        ]
+        lines = [
+            record(email=f"u{i}@b.com", username=f"user{i}", password=HASHED)
+            for i in range(5)
+        ]
+        path = self.write("u.jsonl", "".join(json.dumps(r) + "\n" for r in lines))
+        save_checkpoint(
+            f"{path}.checkpoint",
+            {"source": path, "done": 2, "inserted": 2, "rejected": 0},
+        )
+
+        Command(stdout=StringIO()).handle(
+            path=path,
+            format=None,
+            chunk_size=2,
+            workers=1,
+            passwords="auto",
+            checkpoint=None,
+            rejects=None,
+            restart=False,
+        )
+
+        staged = [
+            [row["number"] for row in c.args[1]] for c in mock_ingest.call_args_list
+        ]
+        self.assertEqual(staged, [[3, 4], [5]])
+        self.assertEqual(
+            load_checkpoint(f"{path}.checkpoint", path),
+            {"source": path, "done": 5, "inserted": 4, "rejected": 1},
+        )
+        with open(f"{path}.rejects.jsonl") as f:
+            self.assertEqual(json.loads(f.read())["number"], 4)
+
+    def test_plaintext_hashed_on_pool(self):
+        rows, _ = validate_chunk(
+            [(1, record()), (2, record("c@d.com", "carol", HASHED))]
+        )
+
+        Command()._hash(FakePool(), rows)
+
+        self.assertEqual(
+            [row["password"] for row in rows], ["hashed:GoodPass1", HASHED]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@ from unittest.mock import patch
 from rest_framework.test import APIRequestFactory
 from rest_framework import status
 from api.views import RegisterView
+from api.metrics import PrometheusMetric, MetricsFactory
 
 
 class TestRegisterViewMetrics(unittest.TestCase):
@@ -55,5 +56,23 @@ class TestRegisterViewMetrics(unittest.TestCase):
         self.assertTrue(any(sample.value > 0 for sample in histogram_family.samples))
 
 
+class TestPrometheusMetric(unittest.TestCase):
+
+    def test_existing_metric_is_reused(self):
+        provider = PrometheusMetric()
+        first = provider.counter("reused_total", "doc")
+        self.assertIs(provider.counter("reused_total", "doc"), first)
+
+    @patch("api.metrics.MetricsFactory.get_provider_backend")
+    def test_create_gauge(self, mock_backend):
+        mock_backend.return_value = PrometheusMetric()
+        gauge = MetricsFactory().create_gauge("lag_seconds", "doc", ("peer",))
+
+        gauge.set(4.5, labels={"peer": "eu"})
+
+        sample = gauge.gauge.collect()[0].samples[0]
+        self.assertEqual((sample.labels, sample.value), ({"peer": "eu"}, 4.5))
+
+
 if __name__ == "__main__":
     unittest.main()
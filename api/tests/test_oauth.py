@@ -26,7 +26,8 @@ class TestThirdPartyStrategy(unittest.TestCase):
         # Ensure requests.get was called correctly
         mock_get.assert_called_once_with(
             "https://oauth2.googleapis.com/tokeninfo",
-            params={"id_token": "fake_token"}
+            params={"id_token": "fake_token"},
+            timeout=5.0,
         )
 
     @patch("api.o_auth_start.requests.get")
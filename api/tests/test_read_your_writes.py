@@ -0,0 +1,81 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from redis.exceptions import ConnectionError
+
+from api.db_routers import PrimaryReplicaRouter
+from api.read_your_writes import ReadYourWrites, is_pinned, pinned_to_primary
+from api.replica_pool import ReplicaPool
+
+
+class MockPipeline:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def set(self, key, value, px):
+        self.conn.ttls[key] = px
+
+    def execute(self):
+        pass
+
+
+class MockRedisMarkers:
+    def __init__(self):
+        self.ttls = {}
+
+    def pipeline(self):
+        return MockPipeline(self)
+
+    def exists(self, *keys):
+        return sum(key in self.ttls for key in keys)
+
+
+@patch("api.read_your_writes.settings.READ_YOUR_WRITES_WINDOW_MS", 5000)
+class TestReadYourWrites(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = MockRedisMarkers()
+        self.router = PrimaryReplicaRouter()
+        pool = ReplicaPool({"read_replica": 1}, 2, 5, "", metrics=MagicMock())
+        patcher = patch.object(ReplicaPool, "instance", pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_mark_keys_user_by_email_and_id(self):
+        ReadYourWrites(self.redis).mark(MagicMock(email="A@B.com", pk=7))
+
+        self.assertEqual(
+            self.redis.ttls, {"rw_sticky:email:a@b.com": 5000, "rw_sticky:id:7": 5000}
+        )
+
+    def test_reads_for_written_user_go_to_primary(self):
+        markers = ReadYourWrites(self.redis)
+        markers.mark(MagicMock(email="a@b.com", pk=7))
+
+        with markers.reads_for(email="a@b.com"):
+            self.assertEqual(self.router.db_for_read(None), "default")
+        with markers.reads_for(user_id=7):
+            self.assertEqual(self.router.db_for_read(None), "default")
+        self.assertEqual(self.router.db_for_read(None), "read_replica")
+
+    def test_other_users_stay_on_replica(self):
+        markers = ReadYourWrites(self.redis)
+        markers.mark(MagicMock(email="a@b.com", pk=7))
+
+        with markers.reads_for(email="c@d.com", user_id=8):
+            self.assertEqual(self.router.db_for_read(None), "read_replica")
+
+    def test_redis_down_reads_from_replica(self):
+        self.redis.exists = MagicMock(side_effect=ConnectionError("down"))
+
+        self.assertFalse(ReadYourWrites(self.redis).is_sticky(user_id=7))
+
+    def test_nested_unsticky_block_keeps_outer_pin(self):
+        with pinned_to_primary():
+            with pinned_to_primary(False):
+                self.assertTrue(is_pinned())
+        self.assertFalse(is_pinned())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from api.redis_scripts import RedisScripts
+from api.utils import check_revoked_many, is_revoked, revoke_pair, rotate_refresh
+
+
+class MockScript:
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def __call__(self, keys, args, client):
+        self.calls.append((keys, args, client))
+        return self.result
+
+
+class MockRedisConn:
+    def __init__(self, result=1):
+        self.result = result
+        self.registered = []
+
+    def register_script(self, source):
+        self.registered.append(source)
+        self.script = MockScript(self.result)
+        return self.script
+
+
+@patch.dict(RedisScripts._scripts, clear=True)
+class TestRedisScripts(unittest.TestCase):
+
+    def test_script_registered_once(self):
+        conn = MockRedisConn()
+        RedisScripts.run(conn, "check_revoked_many", keys=["a"])
+        RedisScripts.run(conn, "check_revoked_many", keys=["b"])
+
+        self.assertEqual(len(conn.registered), 1)
+        self.assertEqual(len(conn.script.calls), 2)
+
+    def test_unknown_script(self):
+        with self.assertRaises(ValueError):
+            RedisScripts.run(MockRedisConn(), "missing")
+
+    def test_rotate_refresh_consumes_token(self):
+        conn = MockRedisConn(result=1)
+        payload = {"jti": "old", "exp": int(time.time()) + 100}
+
+        self.assertTrue(rotate_refresh(conn, payload))
+
+        keys, args, client = conn.script.calls[0]
+        self.assertEqual(
+            keys,
+            ["blacklisted_token:old", "refresh_token:old", "token_replication:stream"],
+        )
+        self.assertTrue(0 < args[0] <= 100)
+        self.assertEqual(args[1], payload["exp"])
+        self.assertIs(client, conn)
+
+    def test_rotate_refresh_registers_new_token(self):
+        conn = MockRedisConn(result=1)
+        old = {"jti": "old", "exp": int(time.time()) + 100}
+        new = {"jti": "new", "exp": int(time.time()) + 200}
+
+        self.assertTrue(rotate_refresh(conn, old, new))
+
+        keys, args, _ = conn.script.calls[0]
+        self.assertEqual(keys[3], "refresh_token:new")
+        self.assertTrue(100 < args[3] <= 200)
+
+    def test_rotate_refresh_rejects_reuse(self):
+        conn = MockRedisConn(result=0)
+        payload = {"jti": "old", "exp": int(time.time()) + 100}
+
+        self.assertFalse(rotate_refresh(conn, payload))
+
+    def test_revoke_pair_uses_both_jtis(self):
+        conn = MockRedisConn(result=2)
+        refresh = {"jti": "r", "exp": int(time.time()) + 100}
+        access = {"jti": "a", "exp": int(time.time()) - 5}  # already expired
+
+        self.assertEqual(revoke_pair(conn, refresh, access), 2)
+
+        keys, args, _ = conn.script.calls[0]
+        self.assertEqual(
+            keys,
+            [
+                "blacklisted_token:r",
+                "blacklisted_token:a",
+                "refresh_token:r",
+                "token_replication:stream",
+            ],
+        )
+        self.assertEqual(args[1], 1)  # expired tokens still get a valid TTL
+        self.assertEqual(args[2:4], [refresh["exp"], access["exp"]])
+
+    def test_check_revoked_many(self):
+        conn = MockRedisConn(result=[1, 0])
+
+        self.assertEqual(check_revoked_many(conn, ["x", "y"]), [True, False])
+        self.assertEqual(check_revoked_many(conn, []), [])
+
+    def test_is_revoked(self):
+        self.assertTrue(is_revoked(MockRedisConn(result=[1]), "x"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from api.builder import TokenMinter
+from api.region_proxy import PROXIED_HEADER, HomeRegionProxy, HomeRegionRouter
+from api.views import TokenRefreshView
+
+
+class MockRequest:
+    def __init__(self, data, headers=None):
+        self.data = data
+        self.headers = headers or {}
+
+
+@patch.object(HomeRegionRouter, "metrics", MagicMock())
+class TestHomeRegionRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy = HomeRegionProxy(endpoints={"eu": "http://eu.local:8000"})
+        self.proxy.refresh = MagicMock(return_value=({"access": "a"}, 200))
+        self.router = HomeRegionRouter(self.proxy)
+
+    def token(self, region):
+        _, refresh, _ = TokenMinter(region=region).mint_pair(1)
+        return refresh
+
+    def routes(self):
+        return [
+            c.kwargs["labels"]["route"]
+            for c in HomeRegionRouter.metrics.routed.increment.call_args_list
+        ]
+
+    def test_local_token_is_served_here(self):
+        self.assertIsNone(self.router.route(MockRequest({"refresh": self.token(None)})))
+        self.proxy.refresh.assert_not_called()
+        self.assertEqual(self.routes()[-1], "local")
+
+    def test_foreign_token_is_proxied(self):
+        # replicated here or not, the home region owns the user
+        raw = self.token("eu")
+
+        response = self.router.route(MockRequest({"refresh": raw}))
+
+        self.proxy.refresh.assert_called_once_with("eu", raw)
+        self.assertEqual((response.status_code, response.data), (200, {"access": "a"}))
+        self.assertEqual(self.routes()[-1], "proxied")
+
+    def test_unconfigured_region_is_served_here(self):
+        self.assertIsNone(self.router.route(MockRequest({"refresh": self.token("us")})))
+        self.proxy.refresh.assert_not_called()
+
+    def test_proxied_request_is_never_proxied_again(self):
+        request = MockRequest({"refresh": self.token("eu")}, {PROXIED_HEADER: "us"})
+
+        self.assertIsNone(self.router.route(request))
+        self.proxy.refresh.assert_not_called()
+
+    def test_invalid_token_is_left_to_the_state_machine(self):
+        self.assertIsNone(self.router.route(MockRequest({"refresh": "garbage"})))
+
+    def test_unreachable_home_region(self):
+        self.proxy.refresh.side_effect = requests.ConnectTimeout("slow")
+
+        response = self.router.route(MockRequest({"refresh": self.token("eu")}))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.routes()[-1], "proxy_failed")
+
+
+class TestHomeRegionProxy(unittest.TestCase):
+
+    @patch.object(HomeRegionProxy, "session")
+    def test_refresh_posts_to_home_region(self, mock_session):
+        mock_session.return_value.post.return_value.json.return_value = {"x": 1}
+        mock_session.return_value.post.return_value.status_code = 401
+        proxy = HomeRegionProxy(endpoints={"eu": "http://eu.local/"}, timeout=(1, 2))
+
+        self.assertEqual(proxy.refresh("eu", "tok"), ({"x": 1}, 401))
+
+        mock_session.return_value.post.assert_called_once_with(
+            "http://eu.local/token-refresh/",
+            json={"refresh": "tok"},
+            headers={PROXIED_HEADER: "local"},
+            timeout=(1, 2),
+        )
+
+    def test_session_is_pooled(self):
+        self.assertIs(HomeRegionProxy.session(), HomeRegionProxy.session())
+
+
+class TestTokenRefreshViewRouting(unittest.TestCase):
+
+    @patch("api.views.TokenRefreshView.router_class")
+    @patch("api.views.OneShotAuthService.execute")
+    def test_proxied_response_skips_local_state_machine(
+        self, mock_execute, mock_router
+    ):
+        mock_router.return_value.route.return_value = Response({"access": "a"})
+        request = APIRequestFactory().post(
+            "/token-refresh/", {"refresh": "tok"}, format="json"
+        )
+
+        response = TokenRefreshView.as_view()(request)
+
+        self.assertEqual(response.data, {"access": "a"})
+        mock_execute.assert_not_called()
+
+    @patch("api.views.OneShotAuthService.execute")
+    def test_local_token_reaches_local_state_machine(self, mock_execute):
+        mock_execute.return_value = {"create": {"refresh": "r"}}
+        _, refresh, _ = TokenMinter().mint_pair(1)
+        request = APIRequestFactory().post(
+            "/token-refresh/", {"refresh": refresh}, format="json"
+        )
+
+        response = TokenRefreshView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        mock_execute.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
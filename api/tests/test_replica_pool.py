@@ -0,0 +1,99 @@
+import random
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.db import OperationalError
+
+from api.db_routers import PrimaryReplicaRouter
+from api.read_your_writes import pinned_to_primary
+from api.replica_pool import ReplicaPool
+
+WEIGHTS = {"read_replica": 3, "read_replica_2": 1}
+
+
+def make_pool(**overrides):
+    config = {
+        "max_lag": 2,
+        "probe_interval": 5,
+        "lag_sql": "SELECT lag",
+        "metrics": MagicMock(),
+        "rng": random.Random(0),
+    }
+    config.update(overrides)
+    return ReplicaPool(WEIGHTS, **config)
+
+
+class TestReplicaPool(unittest.TestCase):
+
+    def test_choice_follows_weights(self):
+        pool = make_pool()
+        picks = [pool.choose() for _ in range(4000)]
+
+        share = picks.count("read_replica") / len(picks)
+        self.assertAlmostEqual(share, 0.75, delta=0.03)
+
+    def test_probe_drops_lagging_and_dead_readers(self):
+        pool = make_pool()
+        lags = {"read_replica": 5.0, "read_replica_2": None}
+
+        with patch.object(ReplicaPool, "lag", side_effect=lags.get):
+            self.assertEqual(pool.probe(), [])
+        self.assertIsNone(pool.choose())
+        pool.metrics.healthy.set.assert_any_call(0, labels={"alias": "read_replica"})
+
+    def test_recovered_reader_returns_to_rotation(self):
+        pool = make_pool()
+        pool.healthy = []
+
+        with patch.object(ReplicaPool, "lag", return_value=0.1):
+            pool.probe()
+
+        self.assertEqual(pool.healthy, list(WEIGHTS))
+        pool.metrics.lag.set.assert_any_call(0.1, labels={"alias": "read_replica_2"})
+
+    @patch("api.replica_pool.connections")
+    def test_lag_reads_probe_query(self, mock_connections):
+        cursor = mock_connections.__getitem__.return_value.cursor.return_value
+        cursor.__enter__.return_value.fetchone.return_value = (0.25,)
+
+        self.assertEqual(make_pool().lag("read_replica"), 0.25)
+        cursor.__enter__.return_value.execute.assert_called_once_with("SELECT lag")
+
+    @patch("api.replica_pool.connections")
+    def test_unreachable_reader_has_no_lag(self, mock_connections):
+        connection = mock_connections.__getitem__.return_value
+        connection.cursor.side_effect = OperationalError("down")
+
+        self.assertIsNone(make_pool().lag("read_replica"))
+        connection.close.assert_called_once()
+
+
+class TestRouterWithPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = make_pool()
+        patcher = patch.object(ReplicaPool, "instance", self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_counted_per_alias(self):
+        self.pool.healthy = ["read_replica_2"]
+
+        self.assertEqual(self.router.db_for_read(None), "read_replica_2")
+        self.pool.metrics.reads.increment.assert_called_once_with(
+            labels={"alias": "read_replica_2"}
+        )
+
+    def test_falls_back_to_primary_without_usable_replica(self):
+        self.pool.healthy = []
+
+        self.assertEqual(self.router.db_for_read(None), "default")
+
+    def test_pinned_reads_skip_replicas(self):
+        with pinned_to_primary():
+            self.assertEqual(self.router.db_for_read(None), "default")
+
+
+if __name__ == "__main__":
+    unittest.main()
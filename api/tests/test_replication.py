@@ -0,0 +1,208 @@
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from redis.exceptions import ConnectionError, ResponseError
+
+from api.replication import TokenReplicator, replicate_to_peers
+from api.utils import REPLICATION_STREAM
+
+
+class MockPipeline:
+    def __init__(self, conn):
+        self.conn = conn
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value, ex))
+
+    def execute(self):
+        if self.conn.down:
+            raise ConnectionError("peer unreachable")
+        self.conn.executed += 1
+        for key, value, ex in self.commands:
+            self.conn.set(key, value, ex=ex)
+
+
+class MockStreamRedis:
+    """Enough of a Redis server for one stream, its consumer groups and SET."""
+
+    def __init__(self):
+        self.entries = []
+        self.groups = {}
+        self.values = {}
+        self.ttls = {}
+        self.down = False
+        self.executed = 0
+
+    # stream side (local region)
+    def xadd(self, fields, age=0):
+        ms = int((time.time() - age) * 1000)
+        entry_id = f"{ms}-{len(self.entries)}".encode()
+        self.entries.append(
+            (entry_id, {k.encode(): str(v).encode() for k, v in fields.items()})
+        )
+
+    def xgroup_create(self, name, groupname, id="0", mkstream=False):
+        if groupname in self.groups:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+        self.groups[groupname] = {"delivered": 0, "pending": []}
+
+    def xreadgroup(self, groupname, consumername, streams, count=None):
+        group = self.groups[groupname]
+        if streams[REPLICATION_STREAM] == "0":
+            return [[REPLICATION_STREAM, group["pending"][:count]]]
+        start = group["delivered"]
+        batch = self.entries[start : start + count]
+        if not batch:
+            return []
+        group["delivered"] += len(batch)
+        group["pending"].extend(batch)
+        return [[REPLICATION_STREAM, batch]]
+
+    def xack(self, name, groupname, *ids):
+        group = self.groups[groupname]
+        group["pending"] = [e for e in group["pending"] if e[0] not in ids]
+
+    def xpending(self, name, groupname):
+        pending = self.groups[groupname]["pending"]
+        return {"pending": len(pending), "min": pending[0][0] if pending else None}
+
+    def xinfo_groups(self, name):
+        return [
+            {
+                "name": groupname.encode(),
+                "last-delivered-id": (
+                    self.entries[group["delivered"] - 1][0]
+                    if group["delivered"]
+                    else b"0-0"
+                ),
+            }
+            for groupname, group in self.groups.items()
+        ]
+
+    def xrange(self, name, min="-", max="+", count=None):
+        # only the exclusive "(id" form TokenReplicator uses
+        after = tuple(int(part) for part in min[1:].split("-"))
+        entries = [
+            entry
+            for entry in self.entries
+            if tuple(int(part) for part in entry[0].split(b"-")) > after
+        ]
+        return entries[:count]
+
+    # key side (peer region)
+    def pipeline(self, transaction=True):
+        return MockPipeline(self)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.ttls[key] = ex
+
+
+class TestTokenReplicator(unittest.TestCase):
+
+    def setUp(self):
+        self.local = MockStreamRedis()
+        self.metrics = MagicMock()
+        self.exp = int(time.time()) + 100
+
+    def replicator(self, peer_conn, peer="eu"):
+        return TokenReplicator(peer, peer_conn, self.local, self.metrics)
+
+    def test_revocations_reach_peer(self):
+        peer = MockStreamRedis()
+        self.local.xadd({"key": "blacklisted_token:a", "exp": self.exp})
+        self.local.xadd({"key": "blacklisted_token:b", "exp": self.exp})
+
+        self.assertEqual(self.replicator(peer).replicate(), 2)
+
+        self.assertEqual(
+            set(peer.values), {b"blacklisted_token:a", b"blacklisted_token:b"}
+        )
+        self.assertTrue(0 < peer.ttls[b"blacklisted_token:a"] <= 100)
+        self.metrics.lag.set.assert_called_with(0.0, labels={"peer": "eu"})
+
+    def test_expired_entries_are_skipped(self):
+        peer = MockStreamRedis()
+        self.local.xadd({"key": "blacklisted_token:old", "exp": int(time.time()) - 5})
+
+        self.assertEqual(self.replicator(peer).replicate(), 1)
+        self.assertEqual(peer.values, {})
+
+    def test_batches_are_pipelined(self):
+        peer = MockStreamRedis()
+        for i in range(5):
+            self.local.xadd({"key": f"blacklisted_token:{i}", "exp": self.exp})
+
+        replicator = self.replicator(peer)
+        replicator.batch_size = 2
+        replicator.replicate()
+
+        self.assertEqual(peer.executed, 3)
+        self.assertEqual(len(peer.values), 5)
+
+    def test_peers_have_independent_cursors(self):
+        eu, us = MockStreamRedis(), MockStreamRedis()
+        self.local.xadd({"key": "blacklisted_token:a", "exp": self.exp}, age=30)
+        eu.down = True
+
+        with self.assertRaises(ConnectionError):
+            self.replicator(eu, "eu").replicate()
+        self.replicator(us, "us").replicate()
+
+        self.assertIn(b"blacklisted_token:a", us.values)
+        self.assertEqual(eu.values, {})
+        eu_lag = self.metrics.lag.set.call_args_list[0]
+        self.assertGreaterEqual(eu_lag.args[0], 29)
+
+        # The failed batch is still pending for eu and is retried first.
+        eu.down = False
+        self.assertEqual(self.replicator(eu, "eu").replicate(), 1)
+        self.assertIn(b"blacklisted_token:a", eu.values)
+        self.metrics.lag.set.assert_called_with(0.0, labels={"peer": "eu"})
+
+    def test_unread_entries_count_as_lag(self):
+        peer = MockStreamRedis()
+        for i in range(3):
+            self.local.xadd({"key": f"blacklisted_token:{i}", "exp": self.exp}, age=30)
+
+        replicator = self.replicator(peer)
+        replicator.batch_size, replicator.max_batches = 1, 1
+        replicator.replicate()
+
+        # nothing is left pending, but two entries were never read
+        self.assertEqual(self.local.groups["replicator:eu"]["pending"], [])
+        self.assertGreaterEqual(self.metrics.lag.set.call_args.args[0], 29)
+
+    def test_replay_is_idempotent(self):
+        peer = MockStreamRedis()
+        self.local.xadd({"key": "blacklisted_token:a", "exp": self.exp})
+        replicator = self.replicator(peer)
+        replicator.ensure_group()
+
+        replicator._apply(self.local.entries)
+        replicator._apply(self.local.entries)
+
+        self.assertEqual(peer.values, {b"blacklisted_token:a": "1"})
+
+
+class TestReplicateToPeers(unittest.TestCase):
+
+    @patch("api.replication.TokenReplicator")
+    @patch("api.replication.peer_connection")
+    def test_failing_peer_does_not_stop_others(self, mock_conn, mock_replicator):
+        mock_replicator.return_value.replicate.side_effect = [
+            ConnectionError("down"),
+            3,
+        ]
+
+        with self.assertLogs("api.replication", "WARNING") as logs:
+            shipped = replicate_to_peers({"eu": "redis://eu", "us": "redis://us"})
+
+        self.assertEqual(shipped, {"eu": None, "us": 3})
+        self.assertIn("replication to eu failed: down", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
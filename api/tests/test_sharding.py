@@ -0,0 +1,250 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import Group
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connections
+from django.test.client import RequestFactory
+from rest_framework.request import Request
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.authentication import ShardedJWTAuthentication
+from api.cache import QueryCacheSingleton
+from api.db_routers import ShardRouter
+from api.models import CustomUser
+from api.read_your_writes import pinned_to_primary
+from api.sharding import USER_ID_SCHEME_TABLE, Shard, ShardMap
+from api.utils import (
+    get_auth_record_by_id,
+    get_user_by_email,
+    get_user_by_id,
+    username_exists,
+)
+
+SQLITE_SHARDS = ("test_user_shard_a", "test_user_shard_b")
+
+
+def two_shards(slots=1024):
+    return ShardMap([Shard(0, "default"), Shard(1, "user_shard_1")], slots)
+
+
+class TestShardMap(unittest.TestCase):
+
+    def test_email_hash_is_stable_and_spreads(self):
+        shards = two_shards()
+        emails = [f"user{i}@example.com" for i in range(2000)]
+
+        on_second = sum(shards.for_email(e).index for e in emails)
+
+        self.assertAlmostEqual(on_second / len(emails), 0.5, delta=0.05)
+        self.assertIs(
+            shards.for_email("Someone@Example.com"),
+            shards.for_email("someone@example.com"),
+        )
+
+    def test_id_encodes_the_email_slot(self):
+        shards = two_shards()
+
+        with patch.object(ShardMap, "next_local_id", return_value=41):
+            user_id = shards.allocate_id("someone@example.com", "api_customuser")
+
+        self.assertEqual(user_id // 1024, 41)
+        self.assertIs(shards.for_id(user_id), shards.for_email("someone@example.com"))
+
+    def test_single_shard_still_encodes_the_slot(self):
+        shards = ShardMap([Shard(0, "default")], 1024)
+
+        with patch.object(ShardMap, "next_local_id", return_value=41):
+            user_id = shards.allocate_id("a@b.com", "api_customuser")
+
+        self.assertEqual(user_id % 1024, shards.slot_for_email("a@b.com"))
+        self.assertEqual(shards.for_id(user_id).writer, "default")
+        # once a second shard is added the same id finds the same slot
+        grown = two_shards()
+        self.assertIs(grown.for_id(user_id), grown.for_email("a@b.com"))
+
+    def test_reader_uses_shard_pool_unless_pinned(self):
+        pool = MagicMock()
+        pool.choose.return_value = "user_shard_1_read_1"
+        shard = Shard(1, "user_shard_1", {"user_shard_1_read_1": 1}, pool=pool)
+
+        self.assertEqual(shard.reader(), "user_shard_1_read_1")
+        with pinned_to_primary():
+            self.assertEqual(shard.reader(), "user_shard_1")
+        pool.choose.return_value = None
+        self.assertEqual(shard.reader(), "user_shard_1")
+
+
+class TestShardRouter(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(ShardMap, "instance", two_shards())
+        self.shards = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_user_instances_go_to_their_shard(self):
+        user = CustomUser(email="someone@example.com")
+        expected = self.shards.for_email(user.email).writer
+
+        self.assertEqual(
+            ShardRouter().db_for_write(CustomUser, instance=user), expected
+        )
+        user.pk = 1024 + 1023  # slot 1023 is on the last shard
+        self.assertEqual(
+            ShardRouter().db_for_read(CustomUser, instance=user), "user_shard_1"
+        )
+
+    def test_other_models_stay_on_shard_zero(self):
+        self.assertEqual(ShardRouter().db_for_write(Group), "default")
+        self.assertEqual(ShardRouter().db_for_write(CustomUser), "default")
+
+    def test_every_writer_is_migrated(self):
+        router = ShardRouter()
+
+        self.assertTrue(router.allow_migrate("user_shard_1", "api"))
+        self.assertFalse(router.allow_migrate("read_replica", "api"))
+
+
+class TestSqliteShards(unittest.TestCase):
+    """Two in-memory SQLite databases standing in for shard writers."""
+
+    @classmethod
+    def setUpClass(cls):
+        sqlite = {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+        configured = connections.configure_settings(
+            {"default": {}, **{alias: dict(sqlite) for alias in SQLITE_SHARDS}}
+        )
+        for alias in SQLITE_SHARDS:
+            connections.settings[alias] = configured[alias]
+            with connections[alias].schema_editor() as editor:
+                for model in (CustomUser, Group, LogEntry, OutstandingToken):
+                    editor.create_model(model)
+                editor.execute(
+                    f"CREATE TABLE {USER_ID_SCHEME_TABLE} (legacy_max_id bigint)"
+                )
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in SQLITE_SHARDS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+    def setUp(self):
+        QueryCacheSingleton.clear()
+        self.shards = ShardMap(
+            [Shard(i, alias) for i, alias in enumerate(SQLITE_SHARDS)], slots=16
+        )
+        patchers = [
+            patch.object(ShardMap, "instance", self.shards),
+            patch("api.utils.ReadYourWrites"),
+            patch("api.utils.RegisteredNames"),
+            patch("api.utils.AuthRecordCache"),
+        ] + [
+            patch(f"api.signals.{name}")
+            for name in (
+                "UserStatusCache",
+                "AuthRecordCache",
+                "RegisteredNames",
+                "ReadYourWrites",
+                "transaction",
+            )
+        ]
+        mocks = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        mocks[3].get.return_value.by_id.side_effect = lambda user_id, load: load()
+        self.addCleanup(self.empty_shards)
+
+    def empty_shards(self):
+        tables = (OutstandingToken._meta.db_table, CustomUser._meta.db_table)
+        for alias in SQLITE_SHARDS:
+            with connections[alias].cursor() as cursor:
+                for table in (*tables, USER_ID_SCHEME_TABLE):
+                    cursor.execute(f"DELETE FROM {table}")
+
+    def create(self, number):
+        return CustomUser.objects.create_user(
+            email=f"user{number}@example.com", username=f"user{number}"
+        )
+
+    def test_users_land_on_their_shard_and_are_found_there(self):
+        users = [self.create(i) for i in range(12)]
+
+        for user in users:
+            shard = self.shards.for_email(user.email)
+            self.assertEqual(user.pk % 16, self.shards.slot_for_email(user.email))
+            self.assertTrue(
+                CustomUser.objects.using(shard.writer).filter(pk=user.pk).exists()
+            )
+            self.assertEqual(get_user_by_email(user.email.upper()).pk, user.pk)
+            self.assertEqual(get_auth_record_by_id(user.pk).email, user.email)
+        self.assertEqual(
+            {self.shards.for_email(u.email).writer for u in users}, set(SQLITE_SHARDS)
+        )
+
+    def test_request_authenticated_by_user_on_second_shard(self):
+        user = next(
+            user
+            for user in map(self.create, range(32))
+            if self.shards.for_id(user.pk).index == 1
+        )
+        QueryCacheSingleton.clear()
+        token = AccessToken.for_user(user)
+        request = Request(
+            RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}"),
+            authenticators=[ShardedJWTAuthentication()],
+        )
+
+        self.assertEqual(request.user.pk, user.pk)
+        self.assertEqual(request.user._state.db, SQLITE_SHARDS[1])
+
+    def test_unknown_id_finds_no_user(self):
+        self.assertIsNone(get_user_by_id(16 * 1000 + 1))
+
+    def create_legacy(self, count):
+        """Users with plain ids, as issued before slot encoding, on shard 0."""
+        alias = SQLITE_SHARDS[0]
+        for number in range(1, count + 1):
+            CustomUser(
+                pk=number, email=f"old{number}@example.com", username=f"old{number}"
+            ).save(using=alias, force_insert=True)
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {USER_ID_SCHEME_TABLE} VALUES (%s)", [count])
+
+    def test_plain_ids_block_sharding_until_encoded(self):
+        self.create_legacy(6)
+        OutstandingToken.objects.using(SQLITE_SHARDS[0]).create(
+            user_id=3, jti="j", token="t", expires_at="2030-01-01T00:00:00Z"
+        )
+        single = ShardMap([Shard(0, SQLITE_SHARDS[0])], slots=16)
+
+        with self.assertRaises(ImproperlyConfigured):
+            self.shards.check_legacy_ids()
+
+        with patch.object(ShardMap, "instance", single), patch(
+            "api.management.commands.encode_user_ids.UserStatusCache"
+        ), patch("api.management.commands.encode_user_ids.AuthRecordCache"):
+            call_command("encode_user_ids", batch_size=4, stdout=MagicMock())
+
+        self.shards.check_legacy_ids()
+        users = CustomUser.objects.using(SQLITE_SHARDS[0])
+        for user in users:
+            self.assertGreater(user.pk, 6)
+            self.assertEqual(user.pk % 16, single.slot_for_email(user.email))
+        token = OutstandingToken.objects.using(SQLITE_SHARDS[0]).get(jti="j")
+        self.assertEqual(token.user_id, users.get(email="old3@example.com").pk)
+
+    def test_usernames_checked_on_every_shard(self):
+        user = self.create(1)
+
+        self.assertTrue(username_exists(user.username.upper()))
+        QueryCacheSingleton.clear()
+        self.assertFalse(username_exists("nobody"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from redis.exceptions import ConnectionError
+from rest_framework.test import APIRequestFactory
+
+from api.throttling import LocalBuckets, SlidingWindowThrottle
+from api.views import LoginView
+
+LIMITS = {"login": {"ip": (2, 60), "email": (5, 300), "endpoint": (100, 1)}}
+
+
+class TestLocalBuckets(unittest.TestCase):
+
+    def test_bucket_drains_and_refills(self):
+        buckets = LocalBuckets()
+        checks = [("k", 2, 10)]  # 2 per 10s -> one token every 5s
+
+        self.assertEqual(buckets.take_all(checks, now=0), 0)
+        self.assertEqual(buckets.take_all(checks, now=0), 0)
+        self.assertAlmostEqual(buckets.take_all(checks, now=0), 5)
+        self.assertEqual(buckets.take_all(checks, now=5), 0)
+
+    def test_no_token_taken_when_any_bucket_is_empty(self):
+        buckets = LocalBuckets()
+        buckets.take_all([("a", 1, 10)], now=0)
+
+        self.assertGreater(buckets.take_all([("a", 1, 10), ("b", 1, 10)], now=0), 0)
+        self.assertEqual(buckets.take_all([("b", 1, 10)], now=0), 0)
+
+    def test_least_recently_used_bucket_evicted(self):
+        buckets = LocalBuckets()
+        buckets.max_entries = 2
+        for key in ("a", "b", "c"):
+            buckets.take_all([(key, 1, 10)], now=0)
+
+        self.assertEqual(list(buckets._buckets), ["b", "c"])
+
+
+@patch("api.throttling.settings.RATE_LIMITS", LIMITS)
+@patch.object(SlidingWindowThrottle, "metrics", MagicMock())
+@patch("api.throttling.get_redis_connection")
+class TestSlidingWindowThrottle(unittest.TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.local = patch.object(SlidingWindowThrottle, "local", LocalBuckets())
+        self.local.start()
+
+    def tearDown(self):
+        self.local.stop()
+
+    def login(self, email="A@B.com"):
+        request = self.factory.post("/login/", {"email": email}, format="json")
+        return LoginView.as_view()(request)
+
+    @patch("api.throttling.RedisScripts.run", return_value=0)
+    @patch("api.views.RedisAuthService.execute", return_value={"errors": "x"})
+    def test_one_script_call_covers_every_dimension(
+        self, mock_execute, mock_run, mock_conn
+    ):
+        self.login()
+
+        _, name = mock_run.call_args[0]
+        keys, args = (
+            mock_run.call_args.kwargs["keys"],
+            mock_run.call_args.kwargs["args"],
+        )
+        self.assertEqual(name, "sliding_window")
+        self.assertEqual(
+            keys,
+            [
+                "ratelimit:login:ip:127.0.0.1",
+                "ratelimit:login:email:a@b.com",
+                "ratelimit:login:endpoint:all",
+            ],
+        )
+        self.assertEqual(args[1:], [2, 60000, 5, 300000, 100, 1000])
+        mock_execute.assert_called_once()
+
+    @patch("api.throttling.RedisScripts.run", return_value=1500)
+    @patch("api.views.RedisAuthService.execute")
+    def test_shared_window_refusal_is_429_before_state_machine(
+        self, mock_execute, mock_run, mock_conn
+    ):
+        response = self.login()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "2")
+        mock_execute.assert_not_called()
+
+    @patch("api.throttling.RedisScripts.run", return_value=0)
+    @patch("api.views.RedisAuthService.execute", return_value={"errors": "x"})
+    def test_local_prefilter_refuses_without_redis(
+        self, mock_execute, mock_run, mock_conn
+    ):
+        self.login()
+        self.login()
+        response = self.login()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(mock_run.call_count, 2)
+
+    @patch("api.throttling.RedisScripts.run", side_effect=ConnectionError("down"))
+    @patch("api.views.RedisAuthService.execute", return_value={"errors": "x"})
+    def test_fails_open_when_redis_is_down(self, mock_execute, mock_run, mock_conn):
+        self.assertEqual(self.login().status_code, 400)
+
+    @patch("api.throttling.RedisScripts.run")
+    def test_unscoped_view_is_not_limited(self, mock_run, mock_conn):
+        view = MagicMock(throttle_scope=None)
+
+        self.assertTrue(SlidingWindowThrottle().allow_request(MagicMock(), view))
+        mock_run.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
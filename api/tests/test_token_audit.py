@@ -0,0 +1,262 @@
+import json
+import unittest
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import patch, MagicMock
+
+from django.db import OperationalError
+
+from api.token_audit import TokenAuditBuffer, TokenAuditPartitions, issued_at
+from api.tokens import BufferedRefreshToken
+
+
+class MockRedisList:
+    def __init__(self):
+        self.lists = {}
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value)
+
+    def lrange(self, key, start, end):
+        return self.lists.get(key, [])[start : end + 1]
+
+    def ltrim(self, key, start, end):
+        self.lists[key] = self.lists.get(key, [])[start:]
+
+
+class MockUser:
+    def __init__(self, id):
+        self.id = id
+        self.is_active = True
+
+
+@patch("api.token_audit.RevokedToken")
+@patch("api.token_audit.IssuedToken")
+class TestTokenAuditBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = MockRedisList()
+        self.buffer = TokenAuditBuffer(self.redis)
+
+    def test_flush_bulk_creates_outstanding_rows(
+        self, mock_outstanding, mock_blacklisted
+    ):
+        for i in range(3):
+            self.buffer.add_outstanding(
+                {
+                    "jti": f"jti-{i}",
+                    "user_id": "1",
+                    "iat": 1700000000,
+                    "exp": 1800000000,
+                },
+                "aaa.bbb.ccc",
+            )
+
+        result = self.buffer.flush()
+
+        self.assertEqual(result, {"outstanding": 3, "blacklisted": 0})
+        mock_outstanding.objects.bulk_create.assert_called_once()
+        rows = mock_outstanding.objects.bulk_create.call_args[0][0]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(self.redis.lists[TokenAuditBuffer.outstanding_key], [])
+
+    def test_flush_drains_in_batches(self, mock_outstanding, mock_blacklisted):
+        self.buffer.batch_size = 2
+        for i in range(5):
+            self.buffer.add_outstanding(
+                {"jti": f"jti-{i}", "exp": 1800000000}, "aaa.bbb.ccc"
+            )
+
+        result = self.buffer.flush()
+
+        self.assertEqual(result["outstanding"], 5)
+        self.assertEqual(mock_outstanding.objects.bulk_create.call_count, 3)
+
+    def test_flush_keeps_batch_when_write_fails(
+        self, mock_outstanding, mock_blacklisted
+    ):
+        mock_outstanding.objects.bulk_create.side_effect = Exception("db down")
+        self.buffer.add_outstanding({"jti": "jti-1", "exp": 1800000000}, "aaa.bbb.ccc")
+
+        with self.assertRaises(Exception):
+            self.buffer.flush()
+
+        self.assertEqual(len(self.redis.lists[TokenAuditBuffer.outstanding_key]), 1)
+
+    def test_flush_revokes_in_the_issue_day_partition(
+        self, mock_outstanding, mock_blacklisted
+    ):
+        self.buffer.add_blacklisted(
+            {"jti": "jti-1", "user_id": "1", "iat": 1700000000, "exp": 1800000000}
+        )
+        self.buffer.add_blacklisted({"jti": "jti-2", "exp": 1800000000})
+
+        result = self.buffer.flush()
+
+        self.assertEqual(result["blacklisted"], 2)
+        mock_outstanding.objects.bulk_create.assert_not_called()
+        mock_blacklisted.objects.bulk_create.assert_called_once()
+        first, second = mock_blacklisted.call_args_list
+        self.assertEqual(
+            first.kwargs["issued_at"],
+            datetime.fromtimestamp(1700000000, timezone.utc),
+        )
+        # no iat: derived from exp the way lookups derive it
+        self.assertEqual(second.kwargs["issued_at"], issued_at({"exp": 1800000000}))
+
+
+class MockPartitionCursor:
+    """Records statements; answers the partition listing from `existing`."""
+
+    def __init__(self, existing=(), failing=()):
+        self.existing = list(existing)
+        # partitions whose DROP or ATTACH errors (lock timeout, bad rows)
+        self.failing = set(failing)
+        self.statements = []
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append(" ".join(sql.split()))
+        if "pg_inherits" in sql:
+            self.rows = [(n,) for n in self.existing if n.startswith(params[0])]
+        words = sql.split()
+        if words[0] in ("DROP", "ALTER") and self.failing & set(words):
+            raise OperationalError("lock timeout")
+
+    def fetchall(self):
+        return self.rows
+
+
+@patch("api.token_audit.transaction", MagicMock())
+class TestTokenAuditPartitions(unittest.TestCase):
+
+    now = datetime(2026, 3, 10, 12, tzinfo=timezone.utc)
+
+    def maintain(self, cursor):
+        with patch("api.token_audit.connections") as mock_connections:
+            mock_connections.__getitem__.return_value.cursor.return_value = cursor
+            partitions = TokenAuditPartitions(days_ahead=2, retention=timedelta(days=1))
+            return partitions.maintain(now=self.now)
+
+    def test_creates_missing_days_ahead(self):
+        cursor = MockPartitionCursor(existing=["api_issued_token_p20260310"])
+
+        result = self.maintain(cursor)
+
+        self.assertEqual(
+            result["created"],
+            [
+                "api_issued_token_p20260311",
+                "api_issued_token_p20260312",
+                "api_revoked_token_p20260310",
+                "api_revoked_token_p20260311",
+                "api_revoked_token_p20260312",
+            ],
+        )
+        # built standalone, filled from DEFAULT, then attached
+        self.assertEqual(
+            [st for st in cursor.statements if "api_issued_token_p20260311" in st],
+            [
+                "CREATE TABLE api_issued_token_p20260311 (LIKE api_issued_token "
+                "INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+                "WITH moved AS (DELETE FROM api_issued_token_default WHERE "
+                "issued_at >= %s AND issued_at < %s RETURNING *) "
+                "INSERT INTO api_issued_token_p20260311 SELECT * FROM moved",
+                "ALTER TABLE api_issued_token ATTACH PARTITION "
+                "api_issued_token_p20260311 FOR VALUES FROM "
+                "('2026-03-11T00:00:00+00:00') TO ('2026-03-12T00:00:00+00:00')",
+            ],
+        )
+
+    def test_failed_partition_does_not_stop_the_rest(self):
+        cursor = MockPartitionCursor(
+            existing=["api_issued_token_p20260101"],
+            failing=["api_issued_token_p20260311"],
+        )
+
+        result = self.maintain(cursor)
+
+        self.assertNotIn("api_issued_token_p20260311", result["created"])
+        self.assertIn("api_issued_token_p20260312", result["created"])
+        self.assertEqual(result["dropped"], ["api_issued_token_p20260101"])
+
+    def test_drops_only_fully_expired_days(self):
+        # refresh tokens live 7 days and are kept 1 more: on 2026-03-10 12:00
+        # everything issued before 2026-03-02 12:00 is gone
+        cursor = MockPartitionCursor(
+            existing=[
+                "api_issued_token_p20260301",
+                "api_issued_token_p20260302",
+                "api_issued_token_default",
+                "api_revoked_token_p20260228",
+                "api_revoked_token_p20260301",
+            ],
+            failing=["api_revoked_token_p20260301"],
+        )
+
+        result = self.maintain(cursor)
+
+        self.assertEqual(
+            result["dropped"],
+            ["api_issued_token_p20260301", "api_revoked_token_p20260228"],
+        )
+        self.assertIn(
+            "DROP TABLE IF EXISTS api_issued_token_p20260301", cursor.statements
+        )
+        self.assertNotIn(
+            "DROP TABLE IF EXISTS api_issued_token_p20260302", cursor.statements
+        )
+
+    def test_partition_days_are_parsed_from_names(self):
+        cursor = MockPartitionCursor(
+            existing=["api_issued_token_p20260301", "api_issued_token_default"]
+        )
+
+        self.assertEqual(
+            TokenAuditPartitions(days_ahead=0, retention=timedelta(0)).partitions(
+                cursor, "api_issued_token"
+            ),
+            {"api_issued_token_p20260301": date(2026, 3, 1)},
+        )
+
+
+class TestBufferedRefreshToken(unittest.TestCase):
+
+    @patch("api.tokens.TokenAuditBuffer")
+    @patch("rest_framework_simplejwt.tokens.OutstandingToken")
+    def test_for_user_buffers_instead_of_inserting(self, mock_outstanding, mock_buffer):
+        token = BufferedRefreshToken.for_user(MockUser(1))
+
+        mock_outstanding.objects.create.assert_not_called()
+        mock_buffer.return_value.add_outstanding.assert_called_once_with(
+            token.payload, str(token)
+        )
+        self.assertEqual(token["user_id"], "1")
+
+    @patch("api.tokens.TokenAuditBuffer", MagicMock())
+    @patch("rest_framework_simplejwt.tokens.BlacklistedToken")
+    def test_decoding_skips_db_blacklist_check(self, mock_blacklisted):
+        token = str(BufferedRefreshToken.for_user(MockUser(1)))
+
+        payload = BufferedRefreshToken(token).payload
+
+        mock_blacklisted.objects.filter.assert_not_called()
+        self.assertEqual(payload["user_id"], "1")
+
+    def test_buffered_record_is_json(self):
+        redis = MockRedisList()
+        with patch("api.tokens.TokenAuditBuffer", lambda: TokenAuditBuffer(redis)):
+            token = BufferedRefreshToken.for_user(MockUser(3))
+
+        record = json.loads(redis.lists[TokenAuditBuffer.outstanding_key][0])
+        self.assertEqual(record["jti"], token["jti"])
+        self.assertEqual(record["token"], str(token))
+
+
+if __name__ == "__main__":
+    unittest.main()
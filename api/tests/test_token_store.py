@@ -0,0 +1,121 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from api.token_audit import issued_at
+from api.token_store import RefreshTokenStore
+
+
+class MockRedisKV:
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.ttls[key] = ex
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+
+@patch("api.token_store.TokenAuditBuffer")
+class TestRefreshTokenStore(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = MockRedisKV()
+        self.payload = {"jti": "abc", "user_id": "1", "exp": int(time.time()) + 100}
+
+    def test_issue_marks_active_and_buffers_row(self, mock_audit):
+        store = RefreshTokenStore(self.redis)
+        store.issue(self.payload, "encoded")
+
+        self.assertEqual(store.lookup(self.payload), RefreshTokenStore.ACTIVE)
+        self.assertTrue(0 < self.redis.ttls["refresh_token:abc"] <= 100)
+        mock_audit.return_value.add_outstanding.assert_called_once_with(
+            self.payload, "encoded"
+        )
+
+    @patch("api.token_store.IssuedToken")
+    @patch("api.token_store.RevokedToken")
+    def test_cache_hit_skips_db(self, mock_blacklisted, mock_outstanding, mock_audit):
+        self.redis.set("blacklisted_token:abc", "1")
+
+        store = RefreshTokenStore(self.redis)
+
+        self.assertEqual(store.lookup(self.payload), RefreshTokenStore.REVOKED)
+        mock_blacklisted.objects.filter.assert_not_called()
+        mock_outstanding.objects.filter.assert_not_called()
+
+    @patch("api.token_store.IssuedToken")
+    @patch("api.token_store.RevokedToken")
+    def test_miss_falls_back_to_db_and_repopulates(
+        self, mock_blacklisted, mock_outstanding, mock_audit
+    ):
+        mock_blacklisted.objects.filter.return_value.exists.return_value = True
+        store = RefreshTokenStore(self.redis)
+
+        self.assertEqual(store.lookup(self.payload), RefreshTokenStore.REVOKED)
+        self.assertEqual(store.lookup(self.payload), RefreshTokenStore.REVOKED)
+
+        mock_blacklisted.objects.filter.assert_called_once_with(
+            jti="abc", issued_at=issued_at(self.payload)
+        )
+        self.assertIn("blacklisted_token:abc", self.redis.values)
+
+    @patch("api.token_store.IssuedToken")
+    @patch("api.token_store.RevokedToken")
+    def test_miss_outstanding_row_is_active(
+        self, mock_blacklisted, mock_outstanding, mock_audit
+    ):
+        mock_blacklisted.objects.filter.return_value.exists.return_value = False
+        mock_outstanding.objects.filter.return_value.exists.return_value = True
+
+        store = RefreshTokenStore(self.redis)
+
+        self.assertEqual(store.lookup(self.payload), RefreshTokenStore.ACTIVE)
+        self.assertIn("refresh_token:abc", self.redis.values)
+
+    @patch("api.token_store.IssuedToken")
+    @patch("api.token_store.RevokedToken")
+    def test_miss_everywhere_is_unknown(
+        self, mock_blacklisted, mock_outstanding, mock_audit
+    ):
+        mock_blacklisted.objects.filter.return_value.exists.return_value = False
+        mock_outstanding.objects.filter.return_value.exists.return_value = False
+
+        store = RefreshTokenStore(self.redis)
+
+        self.assertEqual(store.lookup(self.payload), RefreshTokenStore.UNKNOWN)
+        self.assertEqual(self.redis.values, {})
+
+    @patch("api.token_store.rotate_refresh", return_value=True)
+    def test_rotate_buffers_both_rows(self, mock_rotate, mock_audit):
+        new = dict(self.payload, jti="new")
+        store = RefreshTokenStore(self.redis)
+
+        self.assertTrue(store.rotate(self.payload, new, "encoded"))
+
+        mock_rotate.assert_called_once_with(self.redis, self.payload, new)
+        mock_audit.return_value.add_outstanding.assert_called_once_with(new, "encoded")
+        mock_audit.return_value.add_blacklisted.assert_called_once_with(self.payload)
+
+    @patch("api.token_store.rotate_refresh", return_value=False)
+    def test_rotate_reused_token(self, mock_rotate, mock_audit):
+        store = RefreshTokenStore(self.redis)
+
+        self.assertFalse(store.rotate(self.payload, {}, "encoded"))
+        mock_audit.return_value.add_outstanding.assert_not_called()
+        mock_audit.return_value.add_blacklisted.assert_not_called()
+
+    @patch("api.token_store.revoke_pair")
+    def test_revoke(self, mock_revoke, mock_audit):
+        access = {"jti": "acc", "exp": self.payload["exp"]}
+        RefreshTokenStore(self.redis).revoke(self.payload, access)
+
+        mock_revoke.assert_called_once_with(self.redis, self.payload, access)
+        mock_audit.return_value.add_blacklisted.assert_called_once_with(self.payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from io import StringIO
+
+from api.management.commands.tune_password_hashers import (
+    Command,
+    percentile,
+    recommend,
+    time_encode,
+)
+
+
+class TestHasherTuning(unittest.TestCase):
+
+    def test_percentile(self):
+        samples = [i / 100 for i in range(1, 101)]
+        self.assertEqual(percentile(samples, 50), 0.5)
+        self.assertEqual(percentile(samples, 99), 0.99)
+        self.assertEqual(percentile([0.3], 99), 0.3)
+
+    def test_recommend_picks_costliest_within_budget(self):
+        results = [
+            {"params": {"iterations": 100}, "p99": 0.1},
+            {"params": {"iterations": 200}, "p99": 0.2},
+            {"params": {"iterations": 400}, "p99": 0.4},
+        ]
+        self.assertEqual(recommend(results, 0.25)["params"], {"iterations": 200})
+        self.assertIsNone(recommend(results, 0.05))
+
+    def test_budget_covers_both_kdf_runs_of_registration(self):
+        options = {"login_p99_ms": 300, "register_p99_ms": 400, "overhead_ms": 20}
+        self.assertAlmostEqual(Command()._hash_budget(options), 0.19)
+
+    def test_time_encode(self):
+        path = "django.contrib.auth.hashers.MD5PasswordHasher"
+        self.assertGreater(time_encode(path, {}), 0)
+
+    def test_snippet_subclasses_preferred_hasher(self):
+        out = StringIO()
+        command = Command(stdout=out)
+
+        command._print_snippet({"pbkdf2_sha256": {"params": {"iterations": 600000}}})
+
+        snippet = out.getvalue()
+        self.assertIn("class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):", snippet)
+        self.assertIn("    iterations = 600000", snippet)
+        self.assertIn('"api.hashers.TunedPBKDF2PasswordHasher",', snippet)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from api.sharding import Shard, ShardMap
+from api.signals import invalidate_user_status
+from api.user_status import UserStatus, UserStatusCache
+
+
+class MockPipeline:
+    """Queues calls on the connection and returns their results."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.conn, name)
+        return lambda *args, **kwargs: self.calls.append((method, args, kwargs))
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+class MockRedisHash:
+    """Hashes and version strings, plus hash_set_if_version as the Lua runs it."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.values = {}
+        self.ttls = {}
+
+    def hgetall(self, key):
+        return {k.encode(): v for k, v in self.hashes.get(key, {}).items()}
+
+    def hset(self, key, mapping):
+        self.hashes[key] = {k: str(v).encode() for k, v in mapping.items()}
+
+    def get(self, key):
+        value = self.values.get(key)
+        return value.encode() if value is not None else None
+
+    def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, "0")) + 1)
+
+    def expire(self, key, ttl):
+        self.ttls[key] = ttl
+
+    def pipeline(self):
+        return MockPipeline(self)
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def exists(self, *keys):
+        return 0
+
+    def run_script(self, conn, name, keys=(), args=()):
+        if self.values.get(keys[0], "0") != args[0]:
+            return 0
+        fields = args[2:]
+        self.hset(keys[1], dict(zip(fields[::2], fields[1::2])))
+        self.expire(keys[1], args[1])
+        return 1
+
+
+@patch.object(ShardMap, "instance", ShardMap([Shard(0, "default")], 1024))
+@patch("api.user_status.CustomUser")
+class TestUserStatusCache(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = MockRedisHash()
+        patcher = patch("api.user_status.RedisScripts.run", self.redis.run_script)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = UserStatusCache(self.redis)
+
+    def _rows(self, mock_user):
+        mock_user.objects.using.return_value = mock_user.objects
+        return mock_user.objects.filter.return_value.values_list.return_value
+
+    def test_miss_loads_two_columns_and_caches(self, mock_user):
+        self._rows(mock_user).first.return_value = (True, 4)
+
+        status = self.cache.get(7)
+
+        self.assertTrue(status.is_active)
+        self.assertEqual(status.token_epoch, 4)
+        mock_user.objects.filter.assert_called_once_with(pk=7)
+        mock_user.objects.filter.return_value.values_list.assert_called_once_with(
+            "is_active", "token_epoch"
+        )
+        self.assertEqual(self.redis.ttls["user_status:7"], self.cache.ttl)
+
+    def test_hit_skips_db(self, mock_user):
+        self.cache.set(7, UserStatus(True, 2))
+
+        status = self.cache.get(7)
+
+        self.assertEqual(status.token_epoch, 2)
+        mock_user.objects.filter.assert_not_called()
+
+    def test_unknown_user_cached_as_inactive(self, mock_user):
+        self._rows(mock_user).first.return_value = None
+
+        self.assertFalse(self.cache.get(99).is_active)
+        self.assertFalse(self.cache.get(99).is_active)
+        mock_user.objects.filter.assert_called_once()
+
+    def test_invalidate(self, mock_user):
+        self.cache.set(7, UserStatus(True, 2))
+        self.cache.invalidate(7)
+        self.assertNotIn("user_status:7", self.redis.hashes)
+
+    def test_load_that_raced_an_invalidation_is_not_stored(self, mock_user):
+        def load_then_write():
+            # the row is read, then the user is deactivated and invalidated
+            self.cache.invalidate(7)
+            return (True, 4)
+
+        self._rows(mock_user).first.side_effect = load_then_write
+
+        self.assertTrue(self.cache.get(7).is_active)
+        self.assertNotIn("user_status:7", self.redis.hashes)
+
+
+@patch("api.signals.UserStatusCache")
+@patch("api.signals.transaction")
+class TestInvalidateUserStatusSignal(unittest.TestCase):
+
+    def test_invalidates_only_after_commit(self, mock_transaction, mock_cache):
+        invalidate_user_status(
+            sender=None, instance=MagicMock(pk=7), using="user_shard_1"
+        )
+
+        mock_cache.return_value.invalidate.assert_not_called()
+        # tied to the shard the user was written on, not "default"
+        self.assertEqual(
+            mock_transaction.on_commit.call_args.kwargs, {"using": "user_shard_1"}
+        )
+        mock_transaction.on_commit.call_args.args[0]()
+        mock_cache.return_value.invalidate.assert_called_once_with(7)
+
+
+class TestUserStatus(unittest.TestCase):
+    def test_allows(self):
+        self.assertTrue(UserStatus(True, 1).allows(1))
+        self.assertTrue(UserStatus(True, 0).allows(None))
+        self.assertFalse(UserStatus(True, 2).allows(1))
+        self.assertFalse(UserStatus(False, 0).allows(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
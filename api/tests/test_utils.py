@@ -0,0 +1,131 @@
+import unittest
+from unittest.mock import patch
+
+from api.cache import QueryCacheSingleton
+from api.models import CustomUser
+from api.sharding import Shard, ShardMap
+from api.utils import (
+    AuthRecord,
+    email_exists,
+    get_auth_record_by_email,
+    get_password_hash,
+    get_user_by_email,
+)
+
+
+def single_shard(test):
+    patcher = patch.object(ShardMap, "instance", ShardMap([Shard(0, "default")], 1024))
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class TestUserLookups(unittest.TestCase):
+
+    def setUp(self):
+        QueryCacheSingleton.clear()
+        single_shard(self)
+
+    def test_lower_lookup_compiles_to_indexed_expression(self):
+        query = CustomUser.objects.filter(email__lower="a@b.com").query
+
+        self.assertIn('LOWER("api_customuser"."email")', str(query))
+
+    @patch("api.utils.ReadYourWrites")
+    @patch("api.utils.CustomUser")
+    def test_email_lookup_ignores_case(self, mock_user, mock_markers):
+        get_user_by_email("Someone@Example.COM")
+
+        mock_user.objects.using.assert_called_once_with("default")
+        mock_user.objects.using.return_value.filter.assert_called_once_with(
+            email__lower="someone@example.com"
+        )
+        mock_markers.return_value.reads_for.assert_called_once_with(
+            email="someone@example.com"
+        )
+
+    @patch("api.utils.CustomUser")
+    def test_missing_email_skips_query(self, mock_user):
+        self.assertIsNone(get_user_by_email(None))
+        mock_user.objects.filter.assert_not_called()
+
+
+@patch("api.utils.ReadYourWrites")
+@patch("api.utils.CustomUser")
+class TestAuthRecordLookups(unittest.TestCase):
+
+    def setUp(self):
+        QueryCacheSingleton.clear()
+        single_shard(self)
+        patcher = patch("api.utils.AuthRecordCache")
+        cache = patcher.start().get.return_value
+        cache.by_email.side_effect = lambda email, load: load()
+        self.addCleanup(patcher.stop)
+        patcher = patch("api.utils.RegisteredNames")
+        self.names = patcher.start().get.return_value
+        self.names.might_contain.return_value = True
+        self.addCleanup(patcher.stop)
+
+    def test_record_built_from_values_list(self, mock_user, mock_markers):
+        query = mock_user.objects.using.return_value.filter.return_value.values_list
+        query.return_value.first.return_value = (4, "a@b.com", True, 2)
+
+        record = get_auth_record_by_email("A@B.com")
+
+        # the password hash stays out of the shared caches
+        query.assert_called_once_with("id", "email", "is_active", "token_epoch")
+        self.assertEqual((record.pk, record.token_epoch), (4, 2))
+        # validator and builder share one query per request
+        self.assertIs(get_auth_record_by_email("a@b.com"), record)
+        query.assert_called_once()
+
+    def test_unknown_email_has_no_record(self, mock_user, mock_markers):
+        query = mock_user.objects.using.return_value.filter.return_value.values_list
+        query.return_value.first.return_value = None
+
+        self.assertIsNone(get_auth_record_by_email("a@b.com"))
+
+    def test_existence_check_loads_no_row(self, mock_user, mock_markers):
+        users = mock_user.objects.using.return_value
+        users.filter.return_value.exists.return_value = True
+
+        self.assertTrue(email_exists("A@B.com"))
+        users.filter.assert_called_once_with(email__lower="a@b.com")
+
+    def test_filtered_out_email_skips_query(self, mock_user, mock_markers):
+        self.names.might_contain.return_value = False
+
+        self.assertFalse(email_exists("A@B.com"))
+        self.names.might_contain.assert_called_once_with("email", "a@b.com")
+        mock_user.objects.filter.assert_not_called()
+
+    def test_unfiltered_check_always_queries(self, mock_user, mock_markers):
+        self.names.might_contain.return_value = False
+        users = mock_user.objects.using.return_value
+        users.filter.return_value.exists.return_value = True
+
+        self.assertTrue(email_exists("A@B.com", use_filter=False))
+        self.names.might_contain.assert_not_called()
+
+    def test_password_hash_read_uncached(self, mock_user, mock_markers):
+        users = mock_user.objects.using.return_value
+        query = users.filter.return_value.values_list
+        query.return_value.first.return_value = "hash"
+
+        self.assertEqual(get_password_hash(4), "hash")
+        self.assertEqual(get_password_hash(4), "hash")
+
+        users.filter.assert_called_with(pk=4)
+        query.assert_called_with("password", flat=True)
+        self.assertEqual(query.call_count, 2)
+
+    def test_record_is_immutable(self, mock_user, mock_markers):
+        record = AuthRecord(1, "a@b.com", True, 0)
+
+        with self.assertRaises(AttributeError):
+            record.email = "other@b.com"
+        with self.assertRaises(AttributeError):
+            record.extra = 1
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,6 +15,7 @@ from api.validators import (
     OAuthTokenValidator,
     UserRegistrationValidator,
     PasswordResetValidator,
+    LoginCredentialsValidator,
     TokenRefreshValidator,
 )
 
@@ -25,17 +26,37 @@ from ..utils import hash_token
 # USERNAME VALIDATOR
 # -------------------------
 class TestUsernameValidator(unittest.TestCase):
-    @patch("api.validators.QueryCacheSingleton.get_or_set", return_value=False)
+    def setUp(self):
+        patcher = patch("api.validators.RegisteredNames")
+        self.names = patcher.start().get.return_value
+        self.names.might_contain.return_value = True
+        self.addCleanup(patcher.stop)
+
+    @patch("api.utils.QueryCacheSingleton.get_or_set", return_value=False)
     def test_username_validator_valid(self, mock_cache):
         validator = UsernameValidator()
         self.assertTrue(validator.validate("valid_user123"))
 
-    @patch("api.validators.QueryCacheSingleton.get_or_set", return_value=True)
+    @patch("api.utils.QueryCacheSingleton.get_or_set", return_value=True)
     def test_username_already_taken(self, mock_cache):
         validator = UsernameValidator()
         with self.assertRaises(ValidationError):
             validator.validate("existing_user")
 
+    @patch("api.utils.QueryCacheSingleton.get_or_set", return_value=False)
+    def test_username_checked_case_insensitively(self, mock_cache):
+        UsernameValidator().validate("Mixed_Case")
+
+        self.assertEqual(mock_cache.call_args[0][0], "username:mixed_case")
+
+    @patch("api.utils.QueryCacheSingleton.get_or_set")
+    def test_username_not_in_filter_skips_query(self, mock_cache):
+        self.names.might_contain.return_value = False
+
+        self.assertTrue(UsernameValidator().validate("Fresh_Name"))
+        self.names.might_contain.assert_called_once_with("username", "fresh_name")
+        mock_cache.assert_not_called()
+
     def test_username_invalid_length(self):
         v = UsernameValidator()
         with self.assertRaises(ValidationError):
@@ -51,12 +72,12 @@ class TestUsernameValidator(unittest.TestCase):
 # EMAIL VALIDATOR
 # -------------------------
 class TestEmailValidator(unittest.TestCase):
-    @patch("api.validators.get_user_by_email", return_value=None)
+    @patch("api.validators.email_exists", return_value=False)
     def test_email_validator_valid(self, mock_user):
         v = EmailValidator()
         self.assertTrue(v.validate("test@example.com"))
 
-    @patch("api.validators.get_user_by_email", return_value=True)
+    @patch("api.validators.email_exists", return_value=True)
     def test_email_already_registered(self, mock_user):
         v = EmailValidator()
         with self.assertRaises(ValidationError):
@@ -96,12 +117,15 @@ class TestPasswordValidator(unittest.TestCase):
 # EMAIL RESET VALIDATOR
 # -------------------------
 class TestEmailResetValidator(unittest.TestCase):
-    @patch("api.validators.get_user_by_email", return_value=True)
+    @patch("api.validators.email_exists", return_value=True)
     def test_email_reset_valid(self, mock_user):
         v = EmailResetValidator()
         self.assertTrue(v.validate("user@example.com"))
+        mock_user.assert_called_once_with(
+            "user@example.com", cache_key_prefix="email_reset", use_filter=False
+        )
 
-    @patch("api.validators.get_user_by_email", return_value=None)
+    @patch("api.validators.email_exists", return_value=False)
     def test_email_reset_no_user(self, mock_user):
         v = EmailResetValidator()
         with self.assertRaises(ValidationError):
@@ -128,15 +152,17 @@ class TestTokenValidator(unittest.TestCase):
 # -------------------------
 class TestAccessTokenValidator(unittest.TestCase):
     @patch("api.validators.get_redis_connection")
-    @patch("jwt.decode", return_value={"some": "payload"})
-    def test_access_token_valid(self, mock_decode, mock_redis):
-        mock_redis.return_value.get.return_value = None
+    @patch("api.validators.is_revoked", return_value=False)
+    @patch("jwt.decode", return_value={"jti": "abc"})
+    def test_access_token_valid(self, mock_decode, mock_revoked, mock_redis):
         v = AccessTokenValidator()
         self.assertTrue(v.validate("aaa.bbb.ccc"))
+        mock_revoked.assert_called_once_with(mock_redis.return_value, "abc")
 
     @patch("api.validators.get_redis_connection")
-    def test_access_token_blacklisted(self, mock_redis):
-        mock_redis.return_value.get.return_value = True
+    @patch("api.validators.is_revoked", return_value=True)
+    @patch("jwt.decode", return_value={"jti": "abc"})
+    def test_access_token_blacklisted(self, mock_decode, mock_revoked, mock_redis):
         v = AccessTokenValidator()
         with self.assertRaises(ValidationError):
             v.validate("aaa.bbb.ccc")
@@ -144,7 +170,6 @@ class TestAccessTokenValidator(unittest.TestCase):
     @patch("api.validators.get_redis_connection")
     @patch("jwt.decode", side_effect=jwt.ExpiredSignatureError)
     def test_access_token_expired(self, mock_decode, mock_redis):
-        mock_redis.return_value.get.return_value = None
         v = AccessTokenValidator()
         with self.assertRaises(ValidationError):
             v.validate("aaa.bbb.ccc")
@@ -158,27 +183,41 @@ class TestRefreshTokenValidator(unittest.TestCase):
         def __init__(self, token):
             if token == "bad":
                 raise ValidationError("Invalid token")
+            self.payload = {"jti": token}
+
+        def get(self, key):
+            return self.payload.get(key)
 
     @patch("api.validators.get_redis_connection")
-    @patch("api.validators.RefreshToken")
-    def test_refresh_token_valid(self, mock_refresh, mock_redis):
+    @patch("api.validators.RefreshTokenStore.lookup", return_value="active")
+    @patch("api.validators.BufferedRefreshToken")
+    def test_refresh_token_valid(self, mock_refresh, mock_lookup, mock_redis):
         mock_refresh.return_value = self.MockRefreshToken("good")
-        mock_redis.return_value.get.return_value = None
         v = RefreshTokenValidator()
         self.assertTrue(v.validate("good"))
+        mock_lookup.assert_called_once_with({"jti": "good"})
 
     @patch("api.validators.get_redis_connection")
-    def test_refresh_token_blacklisted(self, mock_redis):
-        mock_redis.return_value.get.return_value = True
+    @patch("api.validators.RefreshTokenStore.lookup", return_value="unknown")
+    @patch("api.validators.BufferedRefreshToken")
+    def test_refresh_token_not_yet_stored(self, mock_refresh, mock_lookup, mock_redis):
+        mock_refresh.return_value = self.MockRefreshToken("good")
+        v = RefreshTokenValidator()
+        self.assertTrue(v.validate("good"))
+
+    @patch("api.validators.get_redis_connection")
+    @patch("api.validators.RefreshTokenStore.lookup", return_value="revoked")
+    @patch("api.validators.BufferedRefreshToken")
+    def test_refresh_token_blacklisted(self, mock_refresh, mock_lookup, mock_redis):
+        mock_refresh.side_effect = self.MockRefreshToken
         v = RefreshTokenValidator()
         with self.assertRaises(ValidationError):
             v.validate("aaa.bbb.ccc")
 
     @patch("api.validators.get_redis_connection")
-    @patch("api.validators.RefreshToken")
+    @patch("api.validators.BufferedRefreshToken")
     def test_refresh_token_invalid(self, mock_refresh, mock_redis):
         mock_refresh.side_effect = self.MockRefreshToken
-        mock_redis.return_value.get.return_value = None
         v = RefreshTokenValidator()
         with self.assertRaises(ValidationError):
             v.validate("bad")
@@ -252,3 +291,67 @@ class TestUserRegistrationValidator(unittest.TestCase):
         v = PasswordResetValidator()
         with self.assertRaises(ValidationError):
             v.validate({})
+
+
+# -------------------------
+# LOGIN CREDENTIALS VALIDATOR
+# -------------------------
+@patch("api.validators.HasherService")
+@patch("api.validators.get_auth_record_by_email")
+class TestLoginCredentialsValidator(unittest.TestCase):
+    data = {"email": "a@b.com", "password": "GoodPass1"}
+
+    def setUp(self):
+        patcher = patch("api.validators.get_password_hash")
+        self.password_hash = patcher.start()
+        self.password_hash.return_value = "stored-hash"
+        self.addCleanup(patcher.stop)
+
+    def test_correct_password(self, mock_user, mock_hasher):
+        mock_user.return_value.pk = 3
+        mock_hasher.return_value.check_password.return_value = True
+        mock_hasher.return_value.needs_upgrade.return_value = False
+
+        self.assertTrue(LoginCredentialsValidator().validate(self.data))
+        mock_hasher.return_value.check_password.assert_called_once_with(
+            "GoodPass1", "stored-hash"
+        )
+        mock_hasher.return_value.rehash_later.assert_not_called()
+        self.password_hash.assert_called_once_with(3)
+
+    @patch("api.validators.upgrade_password_hash")
+    def test_outdated_hash_upgraded_in_background(
+        self, mock_task, mock_user, mock_hasher
+    ):
+        mock_user.return_value.pk = 3
+        self.password_hash.return_value = "old-hash"
+        mock_hasher.return_value.check_password.return_value = True
+        mock_hasher.return_value.needs_upgrade.return_value = True
+
+        self.assertTrue(LoginCredentialsValidator().validate(self.data))
+
+        password, on_done = mock_hasher.return_value.rehash_later.call_args[0]
+        self.assertEqual(password, "GoodPass1")
+        on_done("new-hash")
+        mock_task.delay.assert_called_once_with(3, "old-hash", "new-hash")
+
+    def test_wrong_password(self, mock_user, mock_hasher):
+        mock_hasher.return_value.check_password.return_value = False
+
+        with self.assertRaises(ValidationError):
+            LoginCredentialsValidator().validate(self.data)
+
+    def test_inactive_user(self, mock_user, mock_hasher):
+        mock_user.return_value.is_active = False
+        mock_hasher.return_value.check_password.return_value = True
+
+        with self.assertRaises(ValidationError):
+            LoginCredentialsValidator().validate(self.data)
+
+    def test_unknown_user(self, mock_user, mock_hasher):
+        mock_user.return_value = None
+
+        with self.assertRaises(ValidationError):
+            LoginCredentialsValidator().validate(self.data)
+        mock_hasher.return_value.check_password.assert_not_called()
+        self.password_hash.assert_not_called()
@@ -0,0 +1,268 @@
+import json
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django_redis import get_redis_connection
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import IssuedToken, RevokedToken
+
+
+def issued_at(payload):
+    """
+    Partition key of a token's audit rows. Tokens carry iat; for a record
+    without one it is derived from exp, the same way on write and on lookup.
+    """
+    iat = payload.get("iat")
+    if iat is None:
+        return datetime_from_epoch(payload["exp"]) - api_settings.REFRESH_TOKEN_LIFETIME
+    return datetime_from_epoch(iat)
+
+
+class TokenAuditBuffer:
+    """
+    Write-behind buffer for the token audit tables (IssuedToken and
+    RevokedToken).
+
+    Issuing or revoking a token only appends a small record to a Redis list.
+    `flush` drains the lists in batches with `bulk_create`, so the request path
+    never waits on the primary DB. Redis stays the source of truth for
+    revocation checks; these rows are for auditing only.
+    """
+
+    outstanding_key = "token_audit:outstanding"
+    blacklisted_key = "token_audit:blacklisted"
+    batch_size = 500
+
+    def __init__(self, redis_conn=None):
+        self.redis_conn = redis_conn or get_redis_connection("default")
+
+    # ---------------------
+    # Producers (hot path)
+    # ---------------------
+
+    def add_outstanding(self, payload, encoded):
+        record = {
+            "jti": payload[api_settings.JTI_CLAIM],
+            "user_id": payload.get(api_settings.USER_ID_CLAIM),
+            "token": encoded,
+            "iat": payload.get("iat"),
+            "exp": payload["exp"],
+        }
+        self.redis_conn.rpush(self.outstanding_key, json.dumps(record))
+
+    def add_blacklisted(self, payload):
+        record = {
+            "jti": payload[api_settings.JTI_CLAIM],
+            "user_id": payload.get(api_settings.USER_ID_CLAIM),
+            "iat": payload.get("iat"),
+            "exp": payload["exp"],
+            "revoked_at": time.time(),
+        }
+        self.redis_conn.rpush(self.blacklisted_key, json.dumps(record))
+
+    # ---------------------
+    # Consumer (Celery)
+    # ---------------------
+
+    def flush(self):
+        """Persist everything buffered so far. Returns the row counts written."""
+        return {
+            "outstanding": self._drain(self.outstanding_key, self._write_outstanding),
+            "blacklisted": self._drain(self.blacklisted_key, self._write_blacklisted),
+        }
+
+    def _drain(self, key, writer):
+        total = 0
+        while True:
+            raw = self.redis_conn.lrange(key, 0, self.batch_size - 1)
+            if not raw:
+                return total
+            writer([json.loads(item) for item in raw])
+            # Trim only after the batch is stored: a crash replays the batch,
+            # and ignore_conflicts makes the replay harmless.
+            self.redis_conn.ltrim(key, len(raw), -1)
+            total += len(raw)
+
+    def _write_outstanding(self, records):
+        IssuedToken.objects.bulk_create(
+            [
+                IssuedToken(
+                    jti=record["jti"],
+                    issued_at=issued_at(record),
+                    expires_at=datetime_from_epoch(record["exp"]),
+                    user_id=record.get("user_id"),
+                    token=record.get("token", ""),
+                )
+                for record in records
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _write_blacklisted(self, records):
+        # No issued row is needed first: the tables share no foreign key.
+        RevokedToken.objects.bulk_create(
+            [
+                RevokedToken(
+                    jti=record["jti"],
+                    issued_at=issued_at(record),
+                    expires_at=datetime_from_epoch(record["exp"]),
+                    user_id=record.get("user_id"),
+                    revoked_at=datetime_from_epoch(
+                        record.get("revoked_at") or time.time()
+                    ),
+                )
+                for record in records
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class TokenAuditPartitions:
+    """
+    Daily range partitions of the token audit tables, named
+    <table>_pYYYYMMDD and covering that UTC day of issue.
+
+    `maintain` creates the partitions for today and the coming days, and
+    drops a partition whole once every token issued that day has expired
+    and the retention period has passed, so expired rows are never
+    DELETE-d one by one.
+    """
+
+    tables = (IssuedToken._meta.db_table, RevokedToken._meta.db_table)
+
+    LIST_SQL = """
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """
+
+    def __init__(self, alias="default", days_ahead=None, retention=None):
+        self.alias = alias
+        if days_ahead is None:
+            days_ahead = settings.TOKEN_AUDIT_PARTITION_DAYS_AHEAD
+        if retention is None:
+            retention = timedelta(days=settings.TOKEN_AUDIT_RETENTION_DAYS)
+        self.days_ahead = days_ahead
+        self.retention = retention
+
+    def maintain(self, now=None):
+        """
+        Create upcoming partitions and drop expired ones; the names of each.
+        A partition that cannot be created or dropped is reported and left
+        for the next run without stopping the others.
+        """
+        now = now or datetime.now(timezone.utc)
+        # every token issued before this has expired and outlived retention
+        expired_before = now - api_settings.REFRESH_TOKEN_LIFETIME - self.retention
+        created, dropped = [], []
+        with connections[self.alias].cursor() as cursor:
+            for table in self.tables:
+                existing = self.partitions(cursor, table)
+                for offset in range(self.days_ahead + 1):
+                    day = (now + timedelta(days=offset)).date()
+                    if day not in existing.values() and self.create(cursor, table, day):
+                        created.append(self.partition_name(table, day))
+                for name, day in existing.items():
+                    if self.upper_bound(day) <= expired_before and self.drop(
+                        cursor, name
+                    ):
+                        dropped.append(name)
+                self.prune_default(cursor, table, expired_before)
+        return {"created": created, "dropped": dropped}
+
+    def partitions(self, cursor, table):
+        """{partition name: day} for the dated partitions of `table`."""
+        cursor.execute(self.LIST_SQL, [table])
+        pattern = re.compile(rf"{table}_p(\d{{8}})")
+        partitions = {}
+        for (name,) in cursor.fetchall():
+            match = pattern.fullmatch(name)
+            if match:
+                partitions[name] = datetime.strptime(match[1], "%Y%m%d").date()
+        return partitions
+
+    @staticmethod
+    def partition_name(table, day):
+        return f"{table}_p{day:%Y%m%d}"
+
+    def create(self, cursor, table, day) -> bool:
+        """
+        Make the partition for `day`. Rows for that day that already landed
+        in DEFAULT would make CREATE ... PARTITION OF fail, so the table is
+        built standalone, those rows are moved into it and it is attached.
+        """
+        name = self.partition_name(table, day)
+        start, end = self.lower_bound(day), self.upper_bound(day)
+        return self._run(
+            cursor,
+            f"create {name}",
+            [
+                (
+                    f"CREATE TABLE {name} "
+                    f"(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+                    None,
+                ),
+                (
+                    f"WITH moved AS (DELETE FROM {table}_default "
+                    "WHERE issued_at >= %s AND issued_at < %s RETURNING *) "
+                    f"INSERT INTO {name} SELECT * FROM moved",
+                    [start, end],
+                ),
+                # DDL takes no bind parameters; the bounds are our own timestamps
+                (
+                    f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                    f"FOR VALUES FROM ('{start.isoformat()}') "
+                    f"TO ('{end.isoformat()}')",
+                    None,
+                ),
+            ],
+        )
+
+    def drop(self, cursor, name) -> bool:
+        # Dropping a partition briefly locks the parent. Give up rather than
+        # queue the refresh path behind a long query; the next run retries.
+        return self._run(
+            cursor,
+            f"drop {name}",
+            [
+                ("SET LOCAL lock_timeout = '2s'", None),
+                (f"DROP TABLE IF EXISTS {name}", None),
+            ],
+        )
+
+    def prune_default(self, cursor, table, expired_before) -> bool:
+        # the few rows that missed a dated partition
+        return self._run(
+            cursor,
+            f"prune {table}_default",
+            [
+                (
+                    f"DELETE FROM {table}_default WHERE issued_at < %s",
+                    [expired_before],
+                )
+            ],
+        )
+
+    def _run(self, cursor, action, statements) -> bool:
+        """Run `statements` in one transaction; False (rolled back) on error."""
+        try:
+            with transaction.atomic(using=self.alias):
+                for sql, params in statements:
+                    cursor.execute(sql, params)
+        except DatabaseError as e:
+            print(f"Could not {action}, retrying next run: {e}")
+            return False
+        return True
+
+    @staticmethod
+    def lower_bound(day):
+        return datetime.combine(day, datetime.min.time(), timezone.utc)
+
+    @staticmethod
+    def upper_bound(day):
+        return TokenAuditPartitions.lower_bound(day) + timedelta(days=1)
@@ -0,0 +1,81 @@
+from django_redis import get_redis_connection
+
+from .models import IssuedToken, RevokedToken
+from .token_audit import TokenAuditBuffer, issued_at
+from .utils import (
+    refresh_key,
+    revoke_pair,
+    revoked_key,
+    rotate_refresh,
+    seconds_until_expiry,
+)
+
+
+class RefreshTokenStore:
+    """
+    Cache-aside store for refresh-token validity.
+
+    Reads hit Redis first (one MGET for the revoked marker and the active
+    marker) and only fall back to the audit tables on a miss, repopulating
+    Redis from what the DB says. Writes land in Redis immediately; the DB
+    rows are written behind by the Celery flush of TokenAuditBuffer.
+    """
+
+    ACTIVE = "active"
+    REVOKED = "revoked"
+    UNKNOWN = "unknown"
+
+    def __init__(self, redis_conn=None):
+        self.redis_conn = redis_conn or get_redis_connection("default")
+        self.audit = TokenAuditBuffer(self.redis_conn)
+
+    # ---------------------
+    # Writes
+    # ---------------------
+
+    def issue(self, payload, encoded):
+        self.redis_conn.set(
+            refresh_key(payload["jti"]), "1", ex=seconds_until_expiry(payload)
+        )
+        self.audit.add_outstanding(payload, encoded)
+
+    def rotate(self, old_payload, new_payload, encoded) -> bool:
+        """Swap old for new atomically. False if old was already used."""
+        if not rotate_refresh(self.redis_conn, old_payload, new_payload):
+            return False
+        self.audit.add_outstanding(new_payload, encoded)
+        self.audit.add_blacklisted(old_payload)
+        return True
+
+    def revoke(self, refresh_payload, access_payload):
+        revoke_pair(self.redis_conn, refresh_payload, access_payload)
+        self.audit.add_blacklisted(refresh_payload)
+
+    # ---------------------
+    # Reads
+    # ---------------------
+
+    def lookup(self, payload) -> str:
+        jti = payload["jti"]
+        revoked, active = self.redis_conn.mget([revoked_key(jti), refresh_key(jti)])
+        if revoked:
+            return self.REVOKED
+        if active:
+            return self.ACTIVE
+        return self._lookup_db(payload)
+
+    def _lookup_db(self, payload) -> str:
+        jti = payload["jti"]
+        ttl = seconds_until_expiry(payload)
+        # issued_at pins each query to the one partition holding the token
+        key = {"jti": jti, "issued_at": issued_at(payload)}
+
+        if RevokedToken.objects.filter(**key).exists():
+            self.redis_conn.set(revoked_key(jti), "1", ex=ttl)
+            return self.REVOKED
+        if IssuedToken.objects.filter(**key).exists():
+            self.redis_conn.set(refresh_key(jti), "1", ex=ttl)
+            return self.ACTIVE
+        # Signed by us but not in the DB yet (write-behind, or issued in
+        # another region).
+        return self.UNKNOWN
@@ -0,0 +1,35 @@
+from django.conf import settings
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken
+
+from .token_audit import TokenAuditBuffer
+
+# claim carrying the user's token_epoch at mint time
+TOKEN_EPOCH_CLAIM = "epoch"
+# claim naming the region that issued (and is authoritative for) the token
+REGION_CLAIM = "region"
+
+
+class BufferedRefreshToken(RefreshToken):
+    """
+    RefreshToken that never touches the token_blacklist tables on the request
+    path. Audit rows are handed to the TokenAuditBuffer and revocation is
+    checked against Redis by the validators.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        # Skip BlacklistMixin.for_user, which inserts an OutstandingToken row.
+        token = super(BlacklistMixin, cls).for_user(user)
+        token[TOKEN_EPOCH_CLAIM] = getattr(user, "token_epoch", 0)
+        token[REGION_CLAIM] = settings.REGION
+        TokenAuditBuffer().add_outstanding(token.payload, str(token))
+        return token
+
+    def check_blacklist(self):
+        pass
+
+    def outstand(self):
+        TokenAuditBuffer().add_outstanding(self.payload, str(self))
+
+    def blacklist(self):
+        TokenAuditBuffer().add_blacklisted(self.payload)
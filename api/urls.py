@@ -1,6 +1,7 @@
 from django.urls import path
 
 from .views import (
+    AvailabilityView,
     RegisterView,
     LogoutView,
     PasswordResetView,
@@ -14,9 +15,17 @@ from .views import (
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from django.http import HttpResponse
 
+from .db_pool import PoolStatsRecorder
+from .metrics import GeneralMetricsView
+
 
 def metrics_view(request):
-    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+    PoolStatsRecorder().record()
+    # the default registry plus the one this service's own metrics live on
+    body = generate_latest() + generate_latest(
+        GeneralMetricsView.factory.provider.registry
+    )
+    return HttpResponse(body, content_type=CONTENT_TYPE_LATEST)
 
 
 urlpatterns = [
@@ -33,4 +42,5 @@ urlpatterns = [
     path("third-party-login/", ThirdPartyLoginView.as_view(), name="third-party-login"),
     path("token-refresh/", TokenRefreshView.as_view(), name="token-refresh"),
     path("validate-token/", ValidateTokenView.as_view(), name="validate-token"),
+    path("availability/", AvailabilityView.as_view(), name="availability"),
 ]
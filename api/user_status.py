@@ -0,0 +1,109 @@
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from api.models import CustomUser
+from .read_your_writes import ReadYourWrites
+from .redis_scripts import RedisScripts
+from .sharding import ShardMap
+
+
+class UserStatus:
+    """The only part of a user the refresh path needs to know about."""
+
+    __slots__ = ("is_active", "token_epoch")
+
+    def __init__(self, is_active, token_epoch):
+        self.is_active = is_active
+        self.token_epoch = token_epoch
+
+    def allows(self, token_epoch) -> bool:
+        """True if a token minted at `token_epoch` is still acceptable."""
+        return self.is_active and int(token_epoch or 0) >= self.token_epoch
+
+
+class UserStatusCache:
+    """
+    Cache-aside store of per-user status records in a Redis hash.
+
+    A miss reads two columns from the replica and repopulates the hash.
+    Unknown users are cached as inactive so stale tokens for deleted accounts
+    don't reach the DB on every refresh.
+
+    Like AuthRecordCache, each user has a version that invalidation bumps,
+    and a loaded status is only stored if the version is unchanged, so a
+    load that raced a write cannot put the old status back.
+    """
+
+    key_prefix = "user_status"
+
+    def __init__(self, redis_conn=None):
+        self.redis_conn = redis_conn or get_redis_connection("default")
+        self.ttl = settings.USER_STATUS_CACHE_TTL
+
+    def get(self, user_id) -> UserStatus:
+        pipe = self.redis_conn.pipeline()
+        pipe.hgetall(self._key(user_id))
+        pipe.get(self._version_key(user_id))
+        cached, version = pipe.execute()
+        if cached:
+            return self._decode(cached)
+
+        status = self._load(user_id)
+        self.set_if_version(user_id, status, version.decode() if version else "0")
+        return status
+
+    def set(self, user_id, status):
+        key = self._key(user_id)
+        pipe = self.redis_conn.pipeline()
+        pipe.hset(key, mapping=self._encode(status))
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def set_if_version(self, user_id, status, version) -> bool:
+        """Store `status` unless the user was invalidated since `version`."""
+        fields = [part for item in self._encode(status).items() for part in item]
+        return bool(
+            RedisScripts.run(
+                self.redis_conn,
+                "hash_set_if_version",
+                keys=[self._version_key(user_id), self._key(user_id)],
+                args=[version, self.ttl, *fields],
+            )
+        )
+
+    def invalidate(self, user_id):
+        version_key = self._version_key(user_id)
+        pipe = self.redis_conn.pipeline()
+        pipe.delete(self._key(user_id))
+        pipe.incr(version_key)
+        # versions must outlive the entries they guard
+        pipe.expire(version_key, self.ttl * 2)
+        pipe.execute()
+
+    def _load(self, user_id) -> UserStatus:
+        with ReadYourWrites(self.redis_conn).reads_for(user_id=user_id):
+            row = (
+                CustomUser.objects.using(ShardMap.get().for_id(user_id).reader())
+                .filter(pk=user_id)
+                .values_list("is_active", "token_epoch")
+                .first()
+            )
+        if row is None:
+            return UserStatus(False, 0)
+        return UserStatus(*row)
+
+    def _encode(self, status) -> dict:
+        return {"is_active": int(status.is_active), "token_epoch": status.token_epoch}
+
+    def _decode(self, cached) -> UserStatus:
+        cached = {
+            (k.decode() if isinstance(k, bytes) else k): int(v)
+            for k, v in cached.items()
+        }
+        return UserStatus(bool(cached["is_active"]), cached["token_epoch"])
+
+    def _key(self, user_id) -> str:
+        return f"{self.key_prefix}:{user_id}"
+
+    def _version_key(self, user_id) -> str:
+        return f"{self.key_prefix}:ver:{user_id}"
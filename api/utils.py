@@ -1,18 +1,23 @@
 import secrets
+import time
 import jwt
+from .auth_cache import AuthRecordCache
+from .bloom import RegisteredNames
 from .cache import QueryCacheSingleton
+from .hashing import HasherService
+from .read_your_writes import ReadYourWrites
+from .redis_scripts import RedisScripts
+from .sharding import ShardMap
 from api.models import CustomUser
 from UserAuthModule.settings import SECRET_KEY
 
 
-from django.contrib.auth.hashers import make_password
-
-
 def hash_token(token_str: str) -> str:
     """
     Hash a token string using Django's password hashing system.
+    The KDF runs on the hashing pool, not the request thread.
     """
-    return make_password(token_str)
+    return HasherService().make_password(token_str)
 
 
 def get_transaction_id():
@@ -33,25 +38,109 @@ def decode_jwt(token):
         raise Exception("Invalid token")
 
 
-def blacklist_refresh(conn, token):
-    # Blacklist refresh token
-    refresh_ttl = conn.ttl(f"refresh_token:{token}")
-    if refresh_ttl > 0:
-        conn.set(f"blacklisted_token:{token}", "true", ex=refresh_ttl)
-        conn.delete(f"refresh_token:{token}")
+# Every revocation is appended here and shipped to peer regions by
+# api.replication; the cap bounds memory if a peer stays down.
+REPLICATION_STREAM = "token_replication:stream"
+REPLICATION_STREAM_MAXLEN = 100_000
+
+
+def revoked_key(jti) -> str:
+    return f"blacklisted_token:{jti}"
+
+
+def refresh_key(jti) -> str:
+    return f"refresh_token:{jti}"
+
+
+def seconds_until_expiry(payload) -> int:
+    """Remaining lifetime of a token payload, never less than one second."""
+    return max(int(payload["exp"] - time.time()), 1)
+
+
+def rotate_refresh(conn, payload, new_payload=None) -> bool:
+    """
+    Atomically consume a refresh token during rotation and, if given,
+    register its replacement in the same round trip.
+
+    Returns False if the token was already revoked or rotated, so two
+    concurrent refreshes of the same token cannot both succeed.
+    """
+    jti = payload["jti"]
+    keys = [revoked_key(jti), refresh_key(jti), REPLICATION_STREAM]
+    args = [seconds_until_expiry(payload), payload["exp"], REPLICATION_STREAM_MAXLEN]
+    if new_payload is not None:
+        keys.append(refresh_key(new_payload["jti"]))
+        args.append(seconds_until_expiry(new_payload))
+    consumed = RedisScripts.run(conn, "rotate_refresh", keys=keys, args=args)
+    return bool(consumed)
+
+
+def revoke_pair(conn, refresh_payload, access_payload) -> int:
+    """Revoke a refresh/access pair in one round trip (used by logout)."""
+    return RedisScripts.run(
+        conn,
+        "revoke_pair",
+        keys=[
+            revoked_key(refresh_payload["jti"]),
+            revoked_key(access_payload["jti"]),
+            refresh_key(refresh_payload["jti"]),
+            REPLICATION_STREAM,
+        ],
+        args=[
+            seconds_until_expiry(refresh_payload),
+            seconds_until_expiry(access_payload),
+            refresh_payload["exp"],
+            access_payload["exp"],
+            REPLICATION_STREAM_MAXLEN,
+        ],
+    )
 
 
-def blacklist_access(conn, token):
-    # Blacklist access token
-    access_ttl = conn.ttl(f"access_token:{token}")
-    if access_ttl > 0:
-        conn.set(f"blacklisted_token:{token}", "true", ex=access_ttl)
-        conn.delete(f"access_token:{token}")
+def check_revoked_many(conn, jtis) -> list[bool]:
+    """Return one revoked flag per jti, in order, in one round trip."""
+    if not jtis:
+        return []
+    flags = RedisScripts.run(
+        conn, "check_revoked_many", keys=[revoked_key(jti) for jti in jtis]
+    )
+    return [bool(flag) for flag in flags]
+
+
+def is_revoked(conn, jti) -> bool:
+    return check_revoked_many(conn, [jti])[0]
+
+
+def users_on_shard(email=None, user_id=None):
+    """
+    CustomUser manager on a reader of the shard holding this user (its
+    writer while reads are pinned). Call inside reads_for so pinning applies.
+    """
+    shards = ShardMap.get()
+    shard = shards.for_email(email) if email is not None else shards.for_id(user_id)
+    return CustomUser.objects.using(shard.reader())
+
+
+def username_exists(username: str) -> bool:
+    """
+    True if an account uses `username` (any case). Usernames are not the
+    shard key, so every shard is asked, stopping at the first that has it.
+    """
+    username = username.lower()
+
+    def query_username():
+        return any(
+            CustomUser.objects.using(shard.reader())
+            .filter(username__lower=username)
+            .exists()
+            for shard in ShardMap.get().shards
+        )
+
+    return QueryCacheSingleton.get_or_set(f"username:{username}", query_username)
 
 
 def get_user_by_email(email: str, cache_key_prefix: str = "user") -> CustomUser | None:
     """
-    Fetch a user by email with per-request caching.
+    Fetch a user by email, ignoring case, with per-request caching.
 
     Args:
         email: The email of the user to fetch.
@@ -60,10 +149,15 @@ def get_user_by_email(email: str, cache_key_prefix: str = "user") -> CustomUser
     Returns:
         CustomUser instance or None if not found.
     """
+    if not isinstance(email, str):
+        return None
+    email = email.lower()
     key = f"{cache_key_prefix}:{email}"
 
     def query_user():
-        return CustomUser.objects.filter(email=email).first()
+        # served by the unique LOWER(email) index
+        with ReadYourWrites().reads_for(email=email):
+            return users_on_shard(email=email).filter(email__lower=email).first()
 
     return QueryCacheSingleton.get_or_set(key, query_user)
 
@@ -82,6 +176,114 @@ def get_user_by_id(user_id: int, cache_key_prefix: str = "user") -> CustomUser |
     key = f"{cache_key_prefix}:{user_id}"
 
     def query_user():
-        return CustomUser.objects.filter(pk=user_id).first()
+        with ReadYourWrites().reads_for(user_id=user_id):
+            return users_on_shard(user_id=user_id).filter(pk=user_id).first()
 
     return QueryCacheSingleton.get_or_set(key, query_user)
+
+
+# ------------------------------------------------------------------
+# Slim lookups for the auth hot paths
+# ------------------------------------------------------------------
+
+
+class AuthRecord:
+    """
+    The user columns login and token issuing read, without building a
+    CustomUser (and its PermissionsMixin fields). Immutable.
+
+    Records are shared through Redis and every worker's LRU, so the password
+    hash is not one of them; see get_password_hash.
+    """
+
+    __slots__ = ("id", "email", "is_active", "token_epoch")
+
+    def __init__(self, id, email, is_active, token_epoch):
+        values = (id, email, is_active, token_epoch)
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("AuthRecord is immutable")
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __repr__(self):
+        return f"AuthRecord(id={self.id}, email={self.email!r})"
+
+
+def email_exists(
+    email: str, cache_key_prefix: str = "email_exists", use_filter: bool = True
+) -> bool:
+    """
+    True if an account uses `email` (any case); one index probe, no row.
+    Pass use_filter=False where a false "no" would lock a user out.
+    """
+    if not isinstance(email, str):
+        return False
+    email = email.lower()
+    if use_filter and not RegisteredNames.get().might_contain("email", email):
+        return False  # definitely never registered; no query
+
+    def query_exists():
+        with ReadYourWrites().reads_for(email=email):
+            return users_on_shard(email=email).filter(email__lower=email).exists()
+
+    return QueryCacheSingleton.get_or_set(f"{cache_key_prefix}:{email}", query_exists)
+
+
+def get_auth_record_by_email(email: str) -> AuthRecord | None:
+    """AuthRecord for `email` (any case) with per-request caching."""
+    if not isinstance(email, str):
+        return None
+    email = email.lower()
+
+    def load_row():
+        with ReadYourWrites().reads_for(email=email):
+            return (
+                users_on_shard(email=email)
+                .filter(email__lower=email)
+                .values_list(*AuthRecord.__slots__)
+                .first()
+            )
+
+    def query_record():
+        row = AuthRecordCache.get().by_email(email, load_row)
+        return AuthRecord(*row) if row else None
+
+    return QueryCacheSingleton.get_or_set(f"auth_record:{email}", query_record)
+
+
+def get_password_hash(user_id: int) -> str | None:
+    """
+    The stored password hash, read from the user's shard when a password is
+    verified. Deliberately never cached.
+    """
+    with ReadYourWrites().reads_for(user_id=user_id):
+        return (
+            users_on_shard(user_id=user_id)
+            .filter(pk=user_id)
+            .values_list("password", flat=True)
+            .first()
+        )
+
+
+def get_auth_record_by_id(user_id: int) -> AuthRecord | None:
+    """AuthRecord for a primary key with per-request caching."""
+
+    def load_row():
+        with ReadYourWrites().reads_for(user_id=user_id):
+            return (
+                users_on_shard(user_id=user_id)
+                .filter(pk=user_id)
+                .values_list(*AuthRecord.__slots__)
+                .first()
+            )
+
+    def query_record():
+        row = AuthRecordCache.get().by_id(user_id, load_row)
+        return AuthRecord(*row) if row else None
+
+    return QueryCacheSingleton.get_or_set(f"auth_record:{user_id}", query_record)
@@ -1,19 +1,30 @@
 import re
 from abc import ABC
-from tokenize import TokenError
-from rest_framework_simplejwt.tokens import RefreshToken
+from functools import partial
+from rest_framework_simplejwt.exceptions import TokenError
 
 import jwt
 from django_redis import get_redis_connection
-from django.contrib.auth.hashers import check_password
 
 from UserAuthModule import settings
-from api.models import CustomUser
-from .cache import QueryCacheSingleton
-from .utils import get_user_by_email
+from .bloom import RegisteredNames
+from .hashing import HasherService
+from .tasks import upgrade_password_hash
+from .utils import (
+    email_exists,
+    get_auth_record_by_email,
+    get_password_hash,
+    is_revoked,
+    username_exists,
+)
+from .tokens import BufferedRefreshToken
+from .token_store import RefreshTokenStore
 from .o_auth_start import ThirdPartyStrategySingleton
 from .tracers import trace
 
+# also raised by UserSerializer when the unique index rejects a duplicate
+EMAIL_TAKEN = "Email is already registered."
+
 
 class ValidationError(ValueError):
     pass
@@ -62,6 +73,20 @@ class DefaultStateValidator(StateValidator):
 
 class UsernameValidator(StateValidator):
     def validate(self, value):
+        self.validate_format(value)
+
+        # Use query cache; names differing only in case count as taken
+        username = value.lower()
+        if not RegisteredNames.get().might_contain("username", username):
+            return True  # definitely free; no query
+
+        if username_exists(username):
+            raise ValidationError("Username is already taken.")
+
+        return True
+
+    def validate_format(self, value):
+        """The checks that need no database; bulk imports run only these."""
         self._ensure_str(value, "Username")
 
         if not (3 <= len(value) <= 30):
@@ -71,27 +96,24 @@ class UsernameValidator(StateValidator):
             raise ValidationError(
                 "Username can only contain letters, numbers, underscores, dots, or hyphens."
             )
-
-        # Use query cache
-        def query_username():
-            return CustomUser.objects.filter(username=value).exists()
-
-        if QueryCacheSingleton.get_or_set(f"username:{value}", query_username):
-            raise ValidationError("Username is already taken.")
-
         return True
 
 
 class EmailValidator(StateValidator):
     def validate(self, value):
+        self.validate_format(value)
+
+        if email_exists(value):
+            raise ValidationError(EMAIL_TAKEN)
+
+        return True
+
+    def validate_format(self, value):
+        """The checks that need no database; bulk imports run only these."""
         self._ensure_str(value, "Email")
 
         if not re.match(r"^[\w\.-]+@[\w\.-]+\.\w+$", value):
             raise ValidationError("Invalid email address.")
-
-        if get_user_by_email(value):
-            raise ValidationError("Email is already registered.")
-
         return True
 
 
@@ -112,8 +134,7 @@ class PasswordValidator(StateValidator):
 class EmailResetValidator(StateValidator):
     def validate(self, value):
         self._ensure_str(value, "Email")
-        user = get_user_by_email(value, cache_key_prefix="email_reset")
-        if not user:
+        if not email_exists(value, cache_key_prefix="email_reset", use_filter=False):
             raise ValidationError("No user found with this email.")
         return True
 
@@ -160,23 +181,23 @@ class AccessTokenValidator(StateValidator):
 
         print("not null token")
 
-        # Check blacklist in Redis
-        conn = get_redis_connection("default")
-        if conn.get(f"blacklisted_token:{value}"):
-            raise ValidationError("Token has been blacklisted (logged out).")
-
-        print("not in the blacklist")
-
         try:
             # The jwt.decode function automatically validates the signature
             # and the expiration ('exp') claim.
-            jwt.decode(value, settings.SECRET_KEY, algorithms=["HS256"])
+            payload = jwt.decode(value, settings.SECRET_KEY, algorithms=["HS256"])
             print("decoded check")
         except jwt.ExpiredSignatureError:
             raise ValidationError("Access token has expired.")
         except jwt.InvalidTokenError:
             raise ValidationError("Access token is invalid or has a bad signature.")
 
+        # Check blacklist in Redis
+        conn = get_redis_connection("default")
+        if is_revoked(conn, payload.get("jti")):
+            raise ValidationError("Token has been blacklisted (logged out).")
+
+        print("not in the blacklist")
+
         return True
 
 
@@ -191,24 +212,24 @@ class RefreshTokenValidator(StateValidator):
         if not value:
             raise ValidationError("Refresh token cannot be empty.")
 
-        # Check blacklist in Redis
-        conn = get_redis_connection("default")
-        if conn.get(f"blacklisted_token:{value}"):
-            raise ValidationError("Token has been blacklisted (logged out).")
-
-        print("refresh not blacklist ")
-
         print("value,", value)
 
         try:
             # The RefreshToken class from simple-jwt handles all validation
             # including signature, expiration, and token type.
-            RefreshToken(value)
+            token = BufferedRefreshToken(value)
             print("good refresh")
         except TokenError as e:
             # Catch the specific exception from the library
             raise ValidationError(str(e))
 
+        # Check the token store (Redis first, audit tables on a cache miss)
+        store = RefreshTokenStore(get_redis_connection("default"))
+        if store.lookup(token.payload) == RefreshTokenStore.REVOKED:
+            raise ValidationError("Token has been blacklisted (logged out).")
+
+        print("refresh not blacklist ")
+
         return True
 
 
@@ -253,12 +274,35 @@ class PasswordResetValidator(CompleteStateValidator):
         self._validate_all_data(all_data or {})
         password = all_data.get("password")
         password_repeat = all_data.get("password_repeat")
-        if not check_password(password_repeat, password):
+        if not HasherService().check_password(password_repeat, password):
             raise ValidationError("Passwords do not match.")
         print("passwords match")
         return True
 
 
+class LoginCredentialsValidator(CompleteStateValidator):
+    def validate(self, all_data):
+        self._validate_all_data(all_data or {})
+        password = all_data.get("password")
+        user = get_auth_record_by_email(all_data.get("email"))
+        if user is None:
+            raise ValidationError("Invalid email or password.")
+        encoded = get_password_hash(user.pk)
+        hasher = HasherService()
+        if encoded is None or not hasher.check_password(password, encoded):
+            raise ValidationError("Invalid email or password.")
+        if not user.is_active:
+            raise ValidationError("Invalid email or password.")
+
+        # Outdated hash: rehash on the pool and store it from Celery, so the
+        # login itself still costs one verification.
+        if hasher.needs_upgrade(encoded):
+            hasher.rehash_later(
+                password, partial(upgrade_password_hash.delay, user.pk, encoded)
+            )
+        return True
+
+
 class TokenRefreshValidator(CompleteStateValidator):
     def validate(self, all_data):
         return True
@@ -46,6 +46,10 @@ from api.metrics import (
     TokenRefreshMetrics,
     track_metrics,
 )
+from .admission import admission_controlled
+from .bloom import RegisteredNames
+from .region_proxy import HomeRegionRouter
+from .throttling import SlidingWindowThrottle
 from .tracers import trace
 
 
@@ -104,9 +108,20 @@ class AuthView(BaseAuthView):
     A specialized base view for stateful operations that require a state machine.
     """
 
+    # Limits come from settings.RATE_LIMITS[throttle_scope]; no scope, no limit.
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = None
+    # Concurrency class from settings.ADMISSION_CONTROL; no class, no limit.
+    admission_class = None
+
     @trace(lambda self: f"{self.__class__.__name__}_post")
     @track_metrics(lambda self: self.metrics)
+    @admission_controlled
     def post(self, request, *args, **kwargs):
+        routed = self.route_request()
+        if routed is not None:
+            return routed
+
         data = self.get_data()
         if not data or "errors" in data:
             return Response(
@@ -131,6 +146,10 @@ class AuthView(BaseAuthView):
     def get_data(self):
         return self.request.data
 
+    def route_request(self):
+        """Hook to answer a request elsewhere (e.g. another region). None = handle here."""
+        return None
+
     def get_status_code(self, result: dict) -> int:
         if "create" in result:
             return status.HTTP_201_CREATED
@@ -156,6 +175,8 @@ class RegisterView(AuthView):
     factory_class = RegistrationFactory
     logger = RegisterLogger
     metrics = RegistrationMetrics()
+    throttle_scope = "register"
+    admission_class = "hashing"
 
 
 class LoginView(AuthView):
@@ -164,6 +185,8 @@ class LoginView(AuthView):
     factory_class = LoginFactory
     logger = LoginLogger
     metrics = LoginMetrics()
+    throttle_scope = "login"
+    admission_class = "hashing"
 
 
 class PasswordResetView(AuthView):
@@ -172,6 +195,8 @@ class PasswordResetView(AuthView):
     factory_class = PasswordResetFactory
     logger = PasswordResetLogger
     metrics = PasswordResetRequestMetrics()
+    throttle_scope = "password_reset"
+    admission_class = "hashing"
 
 
 # ------------------------------------------------------------------
@@ -222,6 +247,7 @@ class LogoutView(AuthView):
     logger = LogoutLogger
     factory_class = FullTokenFactory
     metrics = LogoutMetrics()
+    admission_class = "token"
 
     def get_status_code(self, result: dict) -> int:
         if "errors" in result:
@@ -236,6 +262,7 @@ class ValidateTokenView(AuthView):
     logger = ValidationTokenBuilder  # Reusing LoginLogger for simplicity
     factory_class = FullTokenFactory
     metrics = ValidationTokenBuilder  # No specific metrics for validation
+    admission_class = "token"
 
     def get_status_code(self, result: dict) -> int:
         if "errors" in result:
@@ -249,8 +276,57 @@ class TokenRefreshView(AuthView):
     logger = TokenRefreshLogger
     factory_class = RefreshTokenFactory
     metrics = TokenRefreshMetrics()
+    throttle_scope = "refresh"
+    admission_class = "token"
+    router_class = HomeRegionRouter
+
+    def route_request(self):
+        return self.router_class().route(self.request)
 
     def get_status_code(self, result: dict) -> int:
         if "errors" in result:
             return status.HTTP_401_UNAUTHORIZED
         return status.HTTP_200_OK
+
+
+# ------------------------------------------------------------------
+# AVAILABILITY
+# ------------------------------------------------------------------
+
+
+class AvailabilityView(APIView):
+    """
+    GET ?email=...&username=... while the user types. Answers come from the
+    in-process Bloom filters only, never the database: true means free,
+    false means probably taken (registration still checks for real), and
+    null means the filter is not loaded yet.
+    """
+
+    permission_classes = [AllowAny]
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = "availability"
+    max_length = 254
+
+    @trace(lambda self: f"{self.__class__.__name__}_get")
+    def get(self, request, *args, **kwargs):
+        names = RegisteredNames.get()
+        asked = {
+            kind: request.query_params.get(kind)
+            for kind in names.kinds
+            if request.query_params.get(kind)
+        }
+        if not asked or any(len(value) > self.max_length for value in asked.values()):
+            return Response(
+                {"errors": "Pass an email and/or username of at most 254 characters"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {
+                kind: (
+                    not names.might_contain(kind, value)
+                    if names.is_loaded(kind)
+                    else None
+                )
+                for kind, value in asked.items()
+            }
+        )